@@ -1,8 +1,9 @@
 '''
 This is the code for our Mario Kart Wii simulation.
 
-When the program is ran, the user will be prompted to enter an integer from 2-12, representing the number of racers
-in the race.
+When the program is ran, the user will be prompted to enter an integer from 2-1000, representing the number of racers
+in the race. Races of up to 12 racers use the item probabilities of the game, and larger fields use probabilities
+interpolated from the 12 racer ones.
 
 Then, that number of participants is randomly chosen from the list of all of the characters in the game. 
 The function update_race_state() calls on the functions for simulating racer movement, updating their positions whenever
@@ -18,18 +19,71 @@ Note that this simulation is not perfect, as it contains bugs that sometimes occ
 regarding the race track and item functionality.
 '''
 
+import argparse
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import platform
+import queue
 import random
+import socket
+import subprocess
 import sys
+import tempfile
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
+import numpy as np
 import time
-from matplotlib.animation import FuncAnimation
+import threading
+import tomllib
+import tracemalloc
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from matplotlib.animation import FuncAnimation, PillowWriter
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+from statistics import NormalDist
 from tabulate import tabulate
 from operator import attrgetter
 
 # The number of seconds that have elapsed since the start of the race
 Race_duration = 0
 
+# The distance (in meters) from the starting line to the finish line. Race length can be changed freely
+finish_line = 2000
+Default_finish_line = finish_line
+
+# The distance (in meters) between item boxes. The first item box is this far from the starting line
+Item_box_spacing = 250
+Default_item_box_spacing = Item_box_spacing
+
+# The track the race is run on, compiled by set_track from Race_track_definition. None for the original straight track,
+# with an item box every Item_box_spacing meters up to the finish line
+Race_track = None
+Race_track_definition = None
+
+# The base max speed of each weight class. Every racer's max speed is their weight class's base speed times a random
+# factor between 1 and 1.5
+Weight_speeds = {"Light": 23, "Medium": 25, "Heavy": 27}
+Default_weight_speeds = dict(Weight_speeds)
+
+# The random number generators used by the race when every racer has its own streams, as set by run_paired_races.
+# None when every random number comes from the random module, which is the case for a normal race
+Race_streams = None
+
 # Variables storing the times that the lightning bolt, the POW block, and the blooper were used
 # These are for the item timing rules
 Lightning_use_time = 0
@@ -81,9 +135,12 @@ class Racer:
     TC_initial (bool): Keeps track of whether the racer is in the initial phase of the lightning cloud item
     TC_final (bool): Keeps track of whether the racer is in the final phase of the lightning cloud item
     finished (bool): Keeps track of whether the racer has crossed the finish line
+    finish_time (int): The number of seconds it took the racer to cross the finish line
+    finish_position (int): The position the racer finished the race in. Racers who cross the finish line during the
+                           same second are ordered by how far past the line they are
 
     Methods:
-    None
+    marker
     '''
 
     def __init__(self, name, weight):
@@ -117,15 +174,15 @@ class Racer:
         # Assigns random max_speed values based on weight
         # Initially, all racers will start with a speed of 0
         if weight == "Light":
-            s = 23 * random.uniform(1.0, 1.5)
+            s = Weight_speeds["Light"] * stream(self, "speed").uniform(1.0, 1.5)
             self.speed = 0
             self.max_speed = s
         if weight == "Medium":
-            s = 25 * random.uniform(1.0, 1.5)
+            s = Weight_speeds["Medium"] * stream(self, "speed").uniform(1.0, 1.5)
             self.speed = 0
             self.max_speed = s
         if weight == "Heavy":
-            s = 27 * random.uniform(1.0, 1.5)
+            s = Weight_speeds["Heavy"] * stream(self, "speed").uniform(1.0, 1.5)
             self.speed = 0
             self.max_speed = s
 
@@ -161,7 +218,7 @@ class Racer:
         self.shocked = False
 
         # Initially set to 0 but will be updated based on what specific item the racer is using
-        self.marker = 0
+        self._marker = 0
         self.user_marker = 0
 
         # Initially set to False, as the racer is not using a lightning cloud at the beginning of the race
@@ -171,6 +228,303 @@ class Racer:
         # WIll be set to True once the racer crosses the finish line
         self.finished = False
 
+        # Will be set once the racer crosses the finish line
+        self.finish_time = None
+        self.finish_position = None
+
+    @property
+    def marker(self):
+        '''
+        The stun the racer is marked for: 1 for one second, 3 for three seconds, or 0 if none
+
+        Parameters:
+        None
+
+        Returns:
+        int: the marker
+        '''
+        return self._marker
+
+    @marker.setter
+    def marker(self, value):
+        '''
+        Changes the stun the racer is marked for, and keeps Marked_racers up to date
+
+        Parameters:
+        value (int): the new marker
+
+        Returns:
+        None
+        '''
+        if self._marker in Marked_racers:
+            Marked_racers[self._marker].pop(self, None)
+        if value in Marked_racers:
+            Marked_racers[value][self] = None
+        self._marker = value
+
+
+class AntitheticRandom(random.Random):
+    '''
+    A random number generator that gives the mirror image of every number the usual generator gives with the same seed:
+    1 - u instead of u, and the last choice instead of the first. Races run with both generators have negatively
+    correlated results, so the average of the pair varies less than the average of two independent races
+
+    Methods:
+    random, _randbelow
+    '''
+
+    def random(self):
+        '''
+        Gives a random float in [0, 1)
+
+        Parameters:
+        None
+
+        Returns:
+        float: one minus the float the usual generator would give, kept below 1
+        '''
+        return (1.0 - super().random()) % 1.0
+
+    def _randbelow(self, n):
+        '''
+        Gives a random int in [0, n). choice, randint, and sample are built on it
+
+        Parameters:
+        n (int): the number of possible ints
+
+        Returns:
+        int: the mirror image of the int the usual generator would give
+        '''
+        return n - 1 - self._randbelow_with_getrandbits(n)
+
+
+# The purposes whose numbers are drawn a block at a time by BlockRandom: item pulls, item delays, and item actions
+Block_purposes = ("item", "delay", "action")
+
+# The number of floats BlockRandom draws at a time for a whole race, and for one racer's stream in RandomStreams, which
+# draws far fewer numbers. The numbers drawn are the same whatever the block size, so these only change the speed
+Random_block_size = 256
+Stream_block_size = 16
+
+
+class BlockRandom:
+    '''
+    A random number generator that draws its numbers from a NumPy Generator a block at a time and hands them out one by
+    one, drawing the next block only once the last one is used up. Every number, including the ints,
+    comes from the same sequence of uniform floats, so the numbers given for a seed are the same whatever the block size
+
+    Attributes:
+    generator (Generator): The NumPy generator the blocks are drawn from
+    antithetic (bool): Whether the numbers are the mirror image of the usual ones, like those of AntitheticRandom
+    block_size (int): The number of floats drawn at a time
+    block (list): The floats of the current block that were not handed out yet, last one first. Its end is the cursor
+
+    Methods:
+    refill, random, uniform, randint, getstate, setstate
+    '''
+
+    def __init__(self, seed, antithetic=False, block_size=None):
+        '''
+        Constructs all the necessary attributes for the BlockRandom class
+
+        Parameters:
+        seed (int or str): The seed of the generator. Strings are hashed into an int
+        antithetic (bool): if True, every number is the mirror image of the usual one
+        block_size (int): The number of floats drawn at a time. Defaults to Random_block_size
+
+        Returns:
+        None
+        '''
+        if isinstance(seed, str):
+            seed = int.from_bytes(hashlib.sha256(seed.encode()).digest()[:16], "big")
+        self.generator = np.random.Generator(np.random.PCG64(seed))
+        self.antithetic = antithetic
+        self.block_size = block_size if block_size is not None else Random_block_size
+        self.block = []
+
+    def refill(self):
+        '''
+        Draws the next block of floats, once the last one is used up
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        block = self.generator.random(self.block_size)
+        if self.antithetic:
+            block = (1.0 - block) % 1.0
+        # Kept in reverse order, so the next float is taken off the end of the list
+        self.block = block[::-1].tolist()
+
+    # The floats are taken off the block inside every method rather than through random, which saves a method call on
+    # every number
+    def random(self):
+        '''
+        Gives a random float in [0, 1)
+
+        Parameters:
+        None
+
+        Returns:
+        float: the next float of the block
+        '''
+        if not self.block:
+            self.refill()
+        return self.block.pop()
+
+    def uniform(self, a, b):
+        '''
+        Gives a random float between a and b, in the same way as random.uniform
+
+        Parameters:
+        a (float): the lower bound
+        b (float): the upper bound
+
+        Returns:
+        float: the random float
+        '''
+        if not self.block:
+            self.refill()
+        return a + (b - a) * self.block.pop()
+
+    def randint(self, a, b):
+        '''
+        Gives a random int from a to b, both included
+
+        Parameters:
+        a (int): the lowest int
+        b (int): the highest int
+
+        Returns:
+        int: the random int
+        '''
+        if not self.block:
+            self.refill()
+        # A float below 1 times a whole number always rounds to less than that number, so the int is never above b
+        return a + int(self.block.pop() * (b - a + 1))
+
+    def getstate(self):
+        '''
+        Gets the state of the generator, so it can be restored to give the same numbers again
+
+        Parameters:
+        None
+
+        Returns:
+        tuple: the state and increment of the PCG64 generator and the floats of the block that were not handed out yet,
+               in the order they are handed out
+        '''
+        state = self.generator.bit_generator.state["state"]
+        return state["state"], state["inc"], tuple(reversed(self.block))
+
+    def setstate(self, state):
+        '''
+        Restores a state from getstate
+
+        Parameters:
+        state (tuple): the state
+
+        Returns:
+        None
+        '''
+        pcg_state, increment, block = state
+        self.generator.bit_generator.state = {"bit_generator": "PCG64", "state": {"state": pcg_state, "inc": increment},
+                                              "has_uint32": 0, "uinteger": 0}
+        self.block = list(reversed(block))
+
+
+# The generators the numbers of Block_purposes are drawn from when Race_streams is not set, keyed by purpose. Seeded
+# from the random module by seed_block_draws when a race starts, so a race seeded with random.seed is the same every
+# time
+Block_draws = {}
+
+
+def seed_block_draws():
+    '''
+    Makes new generators for Block_draws, seeded from the random module
+    Args:
+        None
+
+    Returns:
+        None
+    '''
+    for purpose in Block_purposes:
+        Block_draws[purpose] = BlockRandom(random.getrandbits(64))
+
+
+class RandomStreams:
+    '''
+    A separate random number generator for every racer and every purpose (max speed, item pulls, item delays, item
+    actions, targets, and the starting grid), each seeded from the seed of the race. Two races with the same seed draw
+    the same numbers for the same purpose even if one of them makes more draws for something else, which keeps races
+    with slightly different settings comparable. The generators of Block_purposes are BlockRandom generators
+
+    Attributes:
+    seed (int): The seed of the race
+    antithetic (bool): Whether the generators give the mirror image of the usual numbers, except for the starting grid
+    generators (dict): The generators made so far, keyed by racer name and purpose
+
+    Methods:
+    get
+    '''
+
+    def __init__(self, seed, antithetic=False):
+        '''
+        Constructs all the necessary attributes for the RandomStreams class
+
+        Parameters:
+        seed (int): The seed of the race
+        antithetic (bool): if True, every generator is an AntitheticRandom
+
+        Returns:
+        None
+        '''
+        self.seed = seed
+        self.antithetic = antithetic
+        self.generators = {}
+
+    def get(self, name, purpose):
+        '''
+        Gets the generator for one racer and one purpose, making it the first time it is needed
+
+        Parameters:
+        name (str): the name of the racer, or None for draws that belong to the whole race
+        purpose (str): what the numbers are used for
+
+        Returns:
+        random.Random: the generator
+        '''
+        generator = self.generators.get((name, purpose))
+        if generator is None:
+            seed = f"{self.seed}:{name}:{purpose}"
+            if purpose in Block_purposes:
+                generator = BlockRandom(seed, antithetic=self.antithetic, block_size=Stream_block_size)
+            else:
+                # The starting grid is never mirrored, so a race and its mirror image have the same racers
+                generator_class = AntitheticRandom if self.antithetic and purpose != "grid" else random.Random
+                generator = generator_class(seed)
+            self.generators[(name, purpose)] = generator
+        return generator
+
+
+def stream(racer, purpose):
+    """
+    Gets the random number generator a racer draws from for one purpose
+
+    Parameters:
+    racer (obj): The racer drawing the number, or None for draws that belong to the whole race
+    purpose (str): What the number is used for
+
+    Returns:
+    The racer's own generator for that purpose if Race_streams is set, otherwise the generator of the race in
+    Block_draws for the purposes in Block_purposes, or the random module
+    """
+    if Race_streams is None:
+        return Block_draws.get(purpose, random)
+    return Race_streams.get(racer.name if racer is not None else None, purpose)
+
 
 def update_position(racer1, racer2):
     """
@@ -187,6 +541,8 @@ def update_position(racer1, racer2):
     racer1.position, racer2.position = racer2.position, racer1.position
     if "bill" in racer1.status:
         racer1.racers_passed += 1
+    if Event_log is not None:
+        Event_log.append((Race_duration, "overtake", racer1.name, racer2.name, racer1.position))
 
 
 def update_distance(racer, use_time):
@@ -201,7 +557,12 @@ def update_distance(racer, use_time):
     """
 
     # Distance traveled is adjusted using the formula final_distance = initial_distance + speed*time
-    distance = racer.distance_from_start + (racer.speed * use_time)
+    if Race_track is None:
+        distance = racer.distance_from_start + (racer.speed * use_time)
+    else:
+        # Corners and offroad slow the racer down for as long as they are on them
+        distance = racer.distance_from_start + (
+                racer.speed * use_time * Race_track.speed_multiplier(racer.distance_from_start))
     racer.distance_from_start = distance
 
 
@@ -230,18 +591,19 @@ def update_speed(racer, use_time):
         racer.speed = speed
 
 
-def choose_item(choices, position):
+def choose_item(choices, position, rng=random):
     """
     Picks the item a racer gets from an item box
     Parameters:
     choices (dict): the potential items to choose from and the probabilities of acquiring each item
     position (int): the position of the racer is currently in
+    rng: where the random number comes from. Defaults to the random module
 
     Returns:
     item (str): the item the racer now possesses
     """
     total = sum(weight[position] for _, weight in choices)  # Finds all the possible items a racer can get
-    r = random.uniform(0, total)  # Chooses a random float to choose the item
+    r = rng.uniform(0, total)  # Chooses a random float to choose the item
     subtotal = 0
 
     for item, weight in choices:
@@ -317,100 +679,22 @@ def get_item(racer, num_racers):
     None
     """
 
-    # Checks for how many racers are in the current race
-    if num_racers == 2:
-        # If there aren't any unavailable items, or if the racer is in a position where none of the items they can get
-        # can become unavailable, or if none of the unavailable items are in the list of the racer's possible items
-        if not Unavailable_items or racer.position == 1 or not any(
-                item in possible_items(racer.position, all_items_2) for item in Unavailable_items):
-            # Choose an item from the default item probability list
-            item = choose_item(all_items_2, racer.position)
-            racer.item = item
-        else:
-            # Otherwise, choose an item from the updated probabilities list
-            item = choose_item(update_probabilities(Unavailable_items, all_items_2, racer.position), racer.position)
-            racer.item = item
-    # Does the same process for every other possible number of racers
-    if num_racers == 3:
-        if not Unavailable_items or racer.position == 1 or not any(
-                item in possible_items(racer.position, all_items_3) for item in Unavailable_items):
-            item = choose_item(all_items_3, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_3, racer.position), racer.position)
-            racer.item = item
-    if num_racers == 4:
-        if not Unavailable_items or racer.position == 1 or not any(
-                item in possible_items(racer.position, all_items_4) for item in Unavailable_items):
-            item = choose_item(all_items_4, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_4, racer.position), racer.position)
-            racer.item = item
-    if num_racers == 5:
-        if not Unavailable_items or racer.position == 1 or not any(
-                item in possible_items(racer.position, all_items_5) for item in Unavailable_items):
-            item = choose_item(all_items_5, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_5, racer.position), racer.position)
-            racer.item = item
-    if num_racers == 6:
-        if not Unavailable_items or racer.position == 1 or not any(
-                item in possible_items(racer.position, all_items_6) for item in Unavailable_items):
-            item = choose_item(all_items_6, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_6, racer.position), racer.position)
-            racer.item = item
-    if num_racers == 7:
-        if not Unavailable_items or racer.position == 1 or not any(
-                item in possible_items(racer.position, all_items_7) for item in Unavailable_items):
-            item = choose_item(all_items_7, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_7, racer.position), racer.position)
-            racer.item = item
-    if num_racers == 8:
-        if not Unavailable_items or racer.position in [1, 2] or not any(
-                item in possible_items(racer.position, all_items_8) for item in Unavailable_items):
-            item = choose_item(all_items_8, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_8, racer.position), racer.position)
-            racer.item = item
-    if num_racers == 9:
-        if not Unavailable_items or racer.position in [1, 2] or not any(
-                item in possible_items(racer.position, all_items_9) for item in Unavailable_items):
-            item = choose_item(all_items_9, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_9, racer.position), racer.position)
-            racer.item = item
-    if num_racers == 10:
-        if not Unavailable_items or racer.position in [1, 2] or not any(
-                item in possible_items(racer.position, all_items_10) for item in Unavailable_items):
-            item = choose_item(all_items_10, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_10, racer.position), racer.position)
-            racer.item = item
-    if num_racers == 11:
-        if not Unavailable_items or racer.position in [1, 2] or not any(
-                item in possible_items(racer.position, all_items_11) for item in Unavailable_items):
-            item = choose_item(all_items_11, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_11, racer.position), racer.position)
-            racer.item = item
-    if num_racers == 12:
-        if not Unavailable_items or racer.position in [1, 2] or not any(
-                item in possible_items(racer.position, all_items_12) for item in Unavailable_items):
-            item = choose_item(all_items_12, racer.position)
-            racer.item = item
-        else:
-            item = choose_item(update_probabilities(Unavailable_items, all_items_12, racer.position), racer.position)
-            racer.item = item
+    rng = stream(racer, "item")
+    # The probability list for the number of racers in the race. Fields of more than 12 racers use a list interpolated
+    # from the 12 racer one
+    probability_list = item_table(num_racers)
+    # With 8 or more racers, the racers in 1st and 2nd place always choose from the default probabilities
+    front = [1] if num_racers < 8 else [1, 2]
+    # If there aren't any unavailable items, or if the racer is in a position where none of the items they can get
+    # can become unavailable, or if none of the unavailable items are in the list of the racer's possible items
+    if not Unavailable_items or racer.position in front or not any(
+            item in Unavailable_items for item in possible_items(racer.position, probability_list)):
+        # Choose an item from the default item probability list
+        racer.item = choose_item(probability_list, racer.position, rng)
+    else:
+        # Otherwise, choose an item from the updated probabilities list
+        racer.item = choose_item(update_probabilities(Unavailable_items, probability_list, racer.position),
+                                 racer.position, rng)
 
 
 # For very specific scenarios where a racer has at least one of these status and needs to accelerate
@@ -467,6 +751,7 @@ def one_sec_stun(original_racer, racer):
             if "invulnerable" not in racer.status and "mega" not in racer.status:
                 racer.status.append("stunned")
                 racer.status.append("1s_stun")
+                record_hit(original_racer.recently_used_item, stun=True, racer=racer)
         if "invulnerable" not in racer.status and "mega" not in racer.status:
             racer.speed = 0
     # If it is past one second (meaning the stun time is over), remove the status effects
@@ -476,6 +761,9 @@ def one_sec_stun(original_racer, racer):
             racer.status.remove("stunned")
             racer.status.remove("1s_stun")
             racer.marker = 0
+            if Event_log is not None:
+                Event_log.append((Race_duration, "stun_expired", racer.name, original_racer.recently_used_item,
+                                  racer.position))
         original_racer.user_marker = 0
         original_racer.using_item = False
         original_racer.action = None
@@ -513,10 +801,11 @@ def three_sec_stun(original_racer, racer):
                 # The lightning cloud cannot be removed until it zaps the racer it's affected
                 if racer.item != "lightning_cloud":
                     if racer.item in All_possible_unavailable_items and racer.item in Unavailable_items:
-                        Unavailable_items.remove(racer.item)
+                        make_available(racer.item)
                     racer.item = None
                 racer.status.append("stunned")
                 racer.status.append("3s_stun")
+                record_hit(original_racer.recently_used_item, stun=True, racer=racer)
         if "invulnerable" not in racer.status and "mega" not in racer.status:
             racer.speed = 0
 
@@ -527,18 +816,22 @@ def three_sec_stun(original_racer, racer):
             racer.status.remove("stunned")
             racer.status.remove("3s_stun")
             racer.marker = 0
+            if Event_log is not None:
+                Event_log.append((Race_duration, "stun_expired", racer.name, original_racer.recently_used_item,
+                                  racer.position))
         original_racer.user_marker = 0
         original_racer.using_item = False
         original_racer.action = None
         original_racer.recently_used_item = None
 
 
-def banana_slowdown(racer):
+def banana_slowdown(racer, original_racer=None):
     """
     Reduces a racer's speed by half when hit by a banana
 
     Parameters:
     racer (obj): The racer being affected
+    original_racer (obj): The racer who threw the banana, so the hit can be counted for their item
 
     Returns:
     None
@@ -554,6 +847,205 @@ def banana_slowdown(racer):
         # Reduces speed by half if racer is not invincible
         if "invulnerable" not in racer.status and "mega" not in racer.status:
             racer.speed = 0.5 * speed
+            if original_racer is not None:
+                record_hit(original_racer.recently_used_item, stun=False, racer=racer)
+
+
+# The racers in every position during the current second of the race, from 1st place, and the index of every racer
+# in the list of participants. Built by update_race_state once the positions of the second are settled, so the racers
+# a few positions away from an item user are found without going through the whole field
+Racers_by_position = []
+Racer_slots = {}
+
+# The racers sorted by how far they were from the start line at the start of the current second, from last to first,
+# with those distances. index_positions sorts the order of the last second again rather than starting over, which takes
+# about one pass over the field since racers only pass a few others in a second, so the racers near an item user are
+# found with a binary search
+Indexed_participants = None
+Racers_by_distance = []
+Indexed_distances = []
+Start_distances = {}
+
+# How far ahead and behind the user (in meters) each item can hit a racer. Items that are not listed, like the blue
+# shell, reach the whole track. Bananas and fake item boxes are mostly dropped and stay on the track for the racers
+# behind to run into, and only thrown a short way ahead
+Hit_ranges = {"green_shell": (200, 100), "trip_green_shell": (200, 100), "red_shell": (400, 100),
+              "trip_red_shell": (400, 100), "FIB": (30, 100), "banana": (30, 100), "trip_bananas": (30, 100),
+              "bob_omb": (150, 40)}
+
+# The racers who are marked to be stunned by an item, for every marker. 1 is a one second stun and 3 is a three
+# second stun. Kept up to date by the marker attribute of Racer, so a stun only goes through the racers it affects
+Marked_racers = {1: {}, 3: {}}
+
+# The racers affected by the lightning bolt, blooper, and POW that are in effect, keyed by the status each one gives,
+# in the order of the participants. Filled in the seconds the item strikes the field, so the rest of the effect and
+# its expiry only go through the racers it affected instead of the whole field. The strike and the expiry are still
+# Python loops over the racers: their statuses are lists on each Racer, and every hit records an event and can put an
+# item back in the item tables, in the order of the participants
+Field_effects = {"shrunk": [], "inked": [], "POW'd": []}
+
+
+def index_positions(participants):
+    '''
+    Builds Racers_by_position and Racer_slots, and sorts Racers_by_distance, for the current second of the race
+    Args:
+        participants (list): the racers in the race
+
+    Returns:
+        None
+    '''
+    global Racers_by_position, Racer_slots, Indexed_participants, Racers_by_distance, Indexed_distances, \
+        Start_distances
+    Racers_by_position = [None] * len(participants)
+    for racer in participants:
+        Racers_by_position[racer.position - 1] = racer
+    Racer_slots = {racer: slot for slot, racer in enumerate(participants)}
+
+    # A new race starts from the order of the participants. The sort is stable, so racers the same distance from the
+    # start line stay in the order they were in
+    if Indexed_participants is not participants:
+        Indexed_participants = participants
+        Racers_by_distance = list(participants)
+    Racers_by_distance.sort(key=attrgetter("distance_from_start"))
+    Indexed_distances = [racer.distance_from_start for racer in Racers_by_distance]
+    Start_distances = dict(zip(Racers_by_distance, Indexed_distances))
+
+
+def racers_within(racer, ahead, behind):
+    '''
+    Finds the racers close to a racer, by how far they were from the start line at the start of the second
+    Args:
+        racer (obj): the racer
+        ahead (float): how far ahead of the racer to look, in meters
+        behind (float): how far behind the racer to look, in meters
+
+    Returns:
+        list: the other racers within that distance, from the furthest behind to the furthest ahead
+    '''
+    distance = Start_distances[racer]
+    low = bisect.bisect_left(Indexed_distances, distance - behind)
+    high = bisect.bisect_right(Indexed_distances, distance + ahead)
+    return [other_racer for other_racer in Racers_by_distance[low:high] if other_racer is not racer]
+
+
+def racers_at(positions):
+    '''
+    Finds the racers in some positions of the race
+    Args:
+        positions (list of ints): the positions. Positions outside of the race are skipped
+
+    Returns:
+        list: the racers in those positions, in the order they are in the list of participants
+    '''
+    found = [Racers_by_position[position - 1] for position in positions if 1 <= position <= len(Racers_by_position)]
+    return sorted(found, key=Racer_slots.__getitem__)
+
+
+def racers_in_reach(racer, positions):
+    '''
+    Finds the racers in some positions of the race that the item the racer is using can reach, as set in Hit_ranges
+    Args:
+        racer (obj): the racer using the item
+        positions (list of ints): the positions. Positions outside of the race are skipped
+
+    Returns:
+        list: the racers in those positions that are close enough to be hit, in the order they are in the list of
+              participants
+    '''
+    found = racers_at(positions)
+    if racer.recently_used_item not in Hit_ranges:
+        return found
+    near = set(racers_within(racer, *Hit_ranges[racer.recently_used_item]))
+    return [other_racer for other_racer in found if other_racer in near]
+
+
+def marked_racers(marker):
+    '''
+    Lists the racers with a marker
+    Args:
+        marker (int): 1 for racers being stunned for one second, 3 for three seconds
+
+    Returns:
+        list: the marked racers. The list is a copy, so the stuns can clear the markers
+    '''
+    return list(Marked_racers[marker])
+
+
+def hit_positions(racer, positions, marker):
+    '''
+    Hits the racers in some positions with the racer's item on the second it is used, and keeps stunning every racer
+    with the same marker until the stun is over. Racers out of the item's reach are missed
+    Args:
+        racer (obj): The racer using the item
+        positions (list of ints): the positions of the racers that are hit
+        marker (int): 1 for a one second stun, 3 for a three second stun
+
+    Returns:
+        None
+    '''
+    if Race_duration == racer.time_item_used:
+        for other_racer in racers_in_reach(racer, positions):
+            # A racer who is already being stunned is not marked again
+            if (other_racer.marker not in [1, 2, 3]) if marker == 1 else (other_racer.marker != 3):
+                other_racer.marker = marker
+    stun = one_sec_stun if marker == 1 else three_sec_stun
+    for other_racer in marked_racers(marker):
+        stun(racer, other_racer)
+
+
+def pick_other_racer(participants, excluded, rng):
+    '''
+    Picks a racer at random from the participants other than one of them, in the same way as rng.choice on the list of
+    the other participants but without making the list
+    Args:
+        participants (list): the racers in the race
+        excluded (obj): the racer who cannot be picked, or None
+        rng: where the random number comes from
+
+    Returns:
+        obj: the racer picked
+    '''
+    if excluded is None:
+        return participants[rng.randrange(len(participants))]
+    index = rng.randrange(len(participants) - 1)
+    return participants[index if index < Racer_slots[excluded] else index + 1]
+
+
+def hit_random_racer(racer, participants, position):
+    '''
+    Hits a random racer other than the one in a position with the racer's item on the second it is used, and keeps
+    stunning every racer with a one second marker until the stun is over. Only the racers the item can reach, as set
+    in Hit_ranges, can be picked, and the item misses if there are none
+    Args:
+        racer (obj): The racer using the item
+        participants (list): the racers in the race
+        position (int): the position of the racer who cannot be hit. Nobody is hit if the position is not in the race
+
+    Returns:
+        None
+    '''
+    passed = None
+    if Race_duration == racer.time_item_used:
+        excluded = racers_at([position])
+        if excluded and racer.recently_used_item in Hit_ranges:
+            # The racers in reach are put in the order of the participants, so the pick does not depend on how the
+            # racers near the user were sorted
+            near = sorted((other_racer for other_racer in racers_within(racer, *Hit_ranges[racer.recently_used_item])
+                           if other_racer is not excluded[0]), key=Racer_slots.__getitem__)
+            kart = near[stream(racer, "target").randrange(len(near))] if near else None
+        elif excluded:
+            kart = pick_other_racer(participants, excluded[0], stream(racer, "target"))
+        else:
+            kart = None
+        if kart is not None and kart.marker not in [1, 2, 3]:
+            kart.marker = 1
+            # The racers were gone through in order, so a racer before the excluded one was already passed over when
+            # it was marked and is only stunned from the next second
+            if Racer_slots[kart] < Racer_slots[excluded[0]]:
+                passed = kart
+    for other_racer in marked_racers(1):
+        if other_racer is not passed:
+            one_sec_stun(racer, other_racer)
 
 
 def use_item(racer, participants):
@@ -579,7 +1071,7 @@ def use_item(racer, participants):
     if racer.recently_used_item == "lightning_cloud":
         if "mega" in racer.status or "invulnerable" in racer.status:
             if "lightning_cloud" in Unavailable_items:
-                Unavailable_items.remove("lightning_cloud")
+                make_available("lightning_cloud")
             racer.item = None
             racer.recently_used_item = None
         else:
@@ -602,7 +1094,7 @@ def use_item(racer, participants):
                         racer.shocked = True
                         racer.using_item = False
                         if "lightning_cloud" in Unavailable_items:
-                            Unavailable_items.remove("lightning_cloud")
+                            make_available("lightning_cloud")
                     else:
                         racer.TC_final = True
                         racer.shocked = False
@@ -621,7 +1113,7 @@ def use_item(racer, participants):
                         racer.shocked = True
                         racer.using_item = False
                         if "lightning_cloud" in Unavailable_items:
-                            Unavailable_items.remove("lightning_cloud")
+                            make_available("lightning_cloud")
                     else:
                         racer.TC_final = True
                         racer.shocked = False
@@ -654,25 +1146,28 @@ def use_item(racer, participants):
                             pass
                         elif "shrunk" not in other_racer.status:
                             other_racer.status.append("shrunk")
+                            record_hit("lightning_bolt", stun=True, racer=other_racer)
 
-                for other_racer in participants:
-                    if "shrunk" in other_racer.status:
-                        # Cannot shock out a lightning cloud from another racer
-                        if other_racer.item == "lightning_cloud":
-                            other_racer.speed = 0
-                            other_racer.shocked = True
-                        else:
-                            if (other_racer.item in All_possible_unavailable_items and other_racer.item in
-                                    Unavailable_items):
-                                Unavailable_items.remove(other_racer.item)
-                            other_racer.item = None
-                            other_racer.speed = 0
-                            other_racer.shocked = True
-                            other_racer.using_item = False
-                            other_racer.recently_used_item = None
+                # Only the racers the lightning bolt shrunk are affected until it wears off
+                Field_effects["shrunk"] = [other_racer for other_racer in participants if
+                                           "shrunk" in other_racer.status]
+                for other_racer in Field_effects["shrunk"]:
+                    # Cannot shock out a lightning cloud from another racer
+                    if other_racer.item == "lightning_cloud":
+                        other_racer.speed = 0
+                        other_racer.shocked = True
+                    else:
+                        if (other_racer.item in All_possible_unavailable_items and other_racer.item in
+                                Unavailable_items):
+                            make_available(other_racer.item)
+                        other_racer.item = None
+                        other_racer.speed = 0
+                        other_racer.shocked = True
+                        other_racer.using_item = False
+                        other_racer.recently_used_item = None
 
             else:
-                for kart in participants:
+                for kart in Field_effects["shrunk"]:
                     if "shrunk" in kart.status:
                         kart.shocked = False
                         if kart.TC_initial is True and "inked" not in kart.status and "squished" not in kart.status:
@@ -687,9 +1182,13 @@ def use_item(racer, participants):
                                     and kart.shocked == False):
                                 update_speed(kart, 1)
         else:
-            for other_racer in participants:
+            for other_racer in Field_effects["shrunk"]:
                 if "shrunk" in other_racer.status:
                     other_racer.status.remove("shrunk")
+                    if Event_log is not None:
+                        Event_log.append((Race_duration, "stun_expired", other_racer.name, "lightning_bolt",
+                                          other_racer.position))
+            Field_effects["shrunk"] = []
             racer.using_item = False
             racer.recently_used_item = None
 
@@ -705,8 +1204,12 @@ def use_item(racer, participants):
                         if ("invulnerable" not in other_racer.status and
                                 "mega" not in other_racer.status and "sped up" not in other_racer.status and "inked" not in other_racer.status):
                             other_racer.status.append("inked")
+                            record_hit("blooper", stun=False, racer=other_racer)
+                # Only the racers the blooper inked are affected until it wears off
+                Field_effects["inked"] = [other_racer for other_racer in participants if
+                                          "inked" in other_racer.status]
 
-            for other_racer in participants:
+            for other_racer in Field_effects["inked"]:
                 if "inked" in other_racer.status:
                     if (other_racer.TC_initial is True and "shrunk" not in other_racer.status and "squished" not in
                             other_racer.status):
@@ -724,9 +1227,10 @@ def use_item(racer, participants):
                                 and "stunned" not in other_racer.status and other_racer.shocked == False):
                             update_speed(other_racer, 1)
         else:
-            for other_racer in participants:
+            for other_racer in Field_effects["inked"]:
                 if "inked" in other_racer.status:
                     other_racer.status.remove("inked")
+            Field_effects["inked"] = []
             racer.using_item = False
             racer.recently_used_item = None
 
@@ -749,28 +1253,34 @@ def use_item(racer, participants):
                             "stunned" not in other_racer.status and "POW'd" not in other_racer.status):
                         other_racer.status.append("stunned")
                         other_racer.status.append("POW'd")
-
-            for other_racer in participants:
-                if "stunned" in other_racer.status and "POW'd" in other_racer.status:
-
-                    # Cannot pow out a lightning cloud from a racer
-                    if other_racer.item == "lightning_cloud":
-                        other_racer.speed = 0
-                    else:
-                        if other_racer.item in All_possible_unavailable_items and other_racer.item in Unavailable_items:
-                            Unavailable_items.remove(other_racer.item)
-                        other_racer.item = None
-                        other_racer.speed = 0
-                        other_racer.using_item = False
-                        other_racer.recently_used_item = None
+                        record_hit("POW", stun=True, racer=other_racer)
+
+            # Only the racers the POW stunned are affected until it wears off
+            Field_effects["POW'd"] = [other_racer for other_racer in participants if
+                                      "stunned" in other_racer.status and "POW'd" in other_racer.status]
+            for other_racer in Field_effects["POW'd"]:
+                # Cannot pow out a lightning cloud from a racer
+                if other_racer.item == "lightning_cloud":
+                    other_racer.speed = 0
+                else:
+                    if other_racer.item in All_possible_unavailable_items and other_racer.item in Unavailable_items:
+                        make_available(other_racer.item)
+                    other_racer.item = None
+                    other_racer.speed = 0
+                    other_racer.using_item = False
+                    other_racer.recently_used_item = None
 
         else:
-            for other_racer in participants:
+            for other_racer in Field_effects["POW'd"]:
                 # Having 2 statuses added to the list at first allows us to make sure that only the racers that get
                 # POW'd get their stunned status removed after 2 seconds.
                 if "stunned" in other_racer.status and "POW'd" in other_racer.status:
                     other_racer.status.remove("stunned")
                     other_racer.status.remove("POW'd")
+                    if Event_log is not None:
+                        Event_log.append((Race_duration, "stun_expired", other_racer.name, "POW",
+                                          other_racer.position))
+            Field_effects["POW'd"] = []
             racer.using_item = False
             racer.recently_used_item = None
 
@@ -955,7 +1465,7 @@ def use_item(racer, participants):
                 racer.racers_passed = 0
                 racer.status.remove("invulnerable")
                 racer.status.remove("bill")
-                Unavailable_items.remove("bullet_bill")
+                make_available("bullet_bill")
                 racer.using_item = None
                 racer.item = None
                 racer.recently_used_item = None
@@ -966,7 +1476,7 @@ def use_item(racer, participants):
                 racer.racers_passed = 0
                 racer.status.remove("invulnerable")
                 racer.status.remove("bill")
-                Unavailable_items.remove("bullet_bill")
+                make_available("bullet_bill")
                 racer.using_item = None
                 racer.item = None
                 racer.recently_used_item = None
@@ -976,7 +1486,7 @@ def use_item(racer, participants):
         racer.item = None
 
         if racer.action is None:
-            racer.action = random.random()
+            racer.action = stream(racer, "action").random()
         if racer.position == 1 and racer.user_marker == 0:
             racer.user_marker = 4
         elif racer.position == len(participants) and racer.user_marker == 0:
@@ -987,38 +1497,18 @@ def use_item(racer, participants):
 
         if racer.user_marker == 4:
             if 0 <= racer.action <= 0.4:  # 40% chance of stunning 2nd place, 60% of doing nothing
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 1)
 
         elif racer.user_marker == 5:
             if 0 <= racer.action <= 0.4:  # 40% chance of stunning the racer ahead, 60% chance of doing nothing
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 1)
 
         else:
             if 0 <= racer.action <= 0.3:  # 30% chance of stunning the racer behind
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 1)
 
             elif 0.3 < racer.action <= 0.6:  # 30% chance of stunning the racer ahead
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 1)
 
     if racer.recently_used_item == "trip_green_shell":
         # Similar logic to green shells but a slightly lower chance of doing nothing and the ability to hit racers
@@ -1026,7 +1516,7 @@ def use_item(racer, participants):
 
         racer.item = None
         if racer.action is None:
-            racer.action = random.random()
+            racer.action = stream(racer, "action").random()
         if racer.position == 1 and racer.user_marker == 0:
             racer.user_marker = 4
         elif racer.position == len(participants) and racer.user_marker == 0:
@@ -1037,94 +1527,58 @@ def use_item(racer, participants):
 
         if racer.user_marker == 4:
             if 0 <= racer.action <= 0.5:  # 50% chance of stunning 2nd place
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 1)
             elif 0.5 < racer.action <= 0.9:  # 40% of hitting any other racer
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if other_racer.position == racer.position + 1:
-                            kart1 = other_racer
-                            everyone_else = [r for r in participants if r != kart1]
-                            kart = random.choice(everyone_else)
-                            if kart.marker not in [1, 2, 3]:
-                                kart.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_random_racer(racer, participants, racer.position + 1)
 
         elif racer.user_marker == 5:
             if 0 <= racer.action <= 0.5:  # 50% chance of stunning 2nd to last place
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 1)
 
             elif 0.5 < racer.action <= 0.9:  # 40% chance of hitting anyone else
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if other_racer.position == racer.position - 1:
-                            kart1 = other_racer
-                            everyone_else = [r for r in participants if r != kart1]
-                            kart = random.choice(everyone_else)
-                            if kart.marker not in [1, 2, 3]:
-                                kart.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_random_racer(racer, participants, racer.position - 1)
 
         else:
             if 0 <= racer.action <= 0.35:  # 35% chance of hitting the racer behind
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 1)
 
             elif 0.35 < racer.action <= 0.7:  # 35% chance of hitting the racer ahead
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 1)
 
             elif 0.7 < racer.action <= 0.9:  # 20% chance of hitting any other racer
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        unaffected = []
-                        if other_racer.position == racer.position + 1:
-                            unaffected.append(other_racer)
-                        if other_racer.position == racer.position - 1:
-                            unaffected.append(other_racer)
-                        everyone_else = [r for r in participants if r not in unaffected]
-                        kart = random.choice(everyone_else)
-                        if kart.marker not in [1, 2, 3]:
-                            kart.marker = 1
-                    if other_racer.marker == 1:
+                if Race_duration == racer.time_item_used:
+                    # Only the racers the shells can reach are picked, in the order of the participants, and a pick
+                    # misses if there are none
+                    near = sorted(racers_within(racer, *Hit_ranges["trip_green_shell"]), key=Racer_slots.__getitem__)
+                    near_set = set(near)
+                    # Every racer in turn picks a racer to hit, so the whole field is gone through once
+                    for other_racer in participants:
+                        targets = near
+                        if other_racer in near_set and other_racer.position in (racer.position + 1,
+                                                                                racer.position - 1):
+                            targets = [kart for kart in near if kart is not other_racer]
+                        if targets:
+                            kart = targets[stream(racer, "target").randrange(len(targets))]
+                            if kart.marker not in [1, 2, 3]:
+                                kart.marker = 1
+                        if other_racer.marker == 1:
+                            one_sec_stun(racer, other_racer)
+                else:
+                    for other_racer in marked_racers(1):
                         one_sec_stun(racer, other_racer)
 
     if racer.recently_used_item == "blue_shell":
         # When used, stuns the racer in 1st place for 3 seconds
         racer.item = None
         if "blue_shell" in Unavailable_items:
-            Unavailable_items.remove("blue_shell")
-        for other_racer in participants:
-            if Race_duration == racer.time_item_used:
-                if other_racer.position == 1 and other_racer.marker != 3:
-                    other_racer.marker = 3
-            if other_racer.marker == 3:
-                three_sec_stun(racer, other_racer)
+            make_available("blue_shell")
+        hit_positions(racer, [1], 3)
 
     if racer.recently_used_item == "red_shell":
         # Similar logic to green shells but slightly higher chance of hitting a racer
         racer.item = None
         if racer.action is None:
-            racer.action = random.random()
+            racer.action = stream(racer, "action").random()
         if racer.position == 1 and racer.user_marker == 0:
             racer.user_marker = 4
         elif racer.position == len(participants) and racer.user_marker == 0:
@@ -1135,44 +1589,24 @@ def use_item(racer, participants):
 
         if racer.user_marker == 4:
             if 0 <= racer.action <= 0.3:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 1)
 
         elif racer.user_marker == 5:
             if 0 <= racer.action <= 0.7:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 1)
 
         else:
             if 0 <= racer.action <= 0.65:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 1)
 
             elif 0.65 < racer.action <= 0.85:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 1)
 
     if racer.recently_used_item == "trip_red_shell":
         # Similar logic to triple green shells but slightly higher chance of hitting a racer
         racer.item = None
         if racer.action == None:
-            racer.action = random.random()
+            racer.action = stream(racer, "action").random()
         if racer.position == 1 and racer.user_marker == 0:
             racer.user_marker = 4
         elif racer.position == len(participants) and racer.user_marker == 0:
@@ -1186,110 +1620,47 @@ def use_item(racer, participants):
         if len(participants) >= 3:
             if racer.user_marker == 4:
                 if 0 <= racer.action <= 0.4:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position + 1], 1)
 
                 elif 0.4 < racer.action <= 0.65:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if other_racer.position == racer.position + 1:
-                                kart1 = other_racer
-                                everyone_else = [r for r in participants if r != kart1]
-                                kart = random.choice(everyone_else)
-                                if kart.marker not in [1, 2, 3]:
-                                    kart.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_random_racer(racer, participants, racer.position + 1)
 
             elif racer.user_marker == 5:
                 if 0 <= racer.action <= 0.6:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                            if (other_racer.position == racer.position - 2) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position - 1, racer.position - 2], 1)
 
                 elif 0.6 < racer.action < 0.95:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position - 1], 1)
 
             elif racer.user_marker == 2:
                 if 0 <= racer.action <= 0.75:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position - 1], 1)
 
                 elif 0.75 < racer.action <= 0.95:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position + 1], 1)
             else:
                 if 0 <= racer.action <= 0.6:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                            if (other_racer.position == racer.position - 2) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position - 1, racer.position - 2], 1)
 
                 elif 0.6 < racer.action <= 0.85:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position - 1], 1)
 
                 elif 0.85 < racer.action <= 0.95:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position + 1], 1)
 
         else:
             if racer.user_marker == 4:
                 if 0 <= racer.action <= 0.4:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position + 1], 1)
             else:
                 if 0 <= racer.action <= 0.8:
-                    for other_racer in participants:
-                        if Race_duration == racer.time_item_used:
-                            if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                                other_racer.marker = 1
-                        if other_racer.marker == 1:
-                            one_sec_stun(racer, other_racer)
+                    hit_positions(racer, [racer.position - 1], 1)
 
     if racer.recently_used_item == "FIB":
         # Works very similarly to shells but a higher chance of missing a racer
         racer.item = None
         if racer.action is None:
-            racer.action = random.random()
+            racer.action = stream(racer, "action").random()
         if racer.position == 1 and racer.user_marker == 0:
             racer.user_marker = 4
         elif racer.position == len(participants) and racer.user_marker == 0:
@@ -1299,66 +1670,42 @@ def use_item(racer, participants):
             racer.user_marker = 6
         if racer.user_marker == 4:
             if 0 <= racer.action <= 0.35:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 1)
 
         elif racer.user_marker == 5:
             if 0 <= racer.action <= 0.35:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 1)
 
         else:
             if 0 <= racer.action <= 0.25:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 1)
 
             elif 0.25 < racer.action <= 0.5:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker not in [1, 2, 3]:
-                            other_racer.marker = 1
-                    if other_racer.marker == 1:
-                        one_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 1)
 
     if racer.recently_used_item == "banana":
         # Same logic as a green shell and FIB but slightly higher chance of doing nothing
         racer.item = None
         if racer.action is None:
-            racer.action = random.random()
+            racer.action = stream(racer, "action").random()
         if racer.position == 1:
             if 0 <= racer.action <= 0.3:
-                for other_racer in participants:
-                    if other_racer.position == racer.position + 1:
-                        banana_slowdown(other_racer)
+                for other_racer in racers_in_reach(racer, [racer.position + 1]):
+                    banana_slowdown(other_racer, racer)
 
         elif racer.position == len(participants):
             if 0 <= racer.action <= 0.3:
-                for other_racer in participants:
-                    if other_racer.position == racer.position - 1:
-                        banana_slowdown(other_racer)
+                for other_racer in racers_in_reach(racer, [racer.position - 1]):
+                    banana_slowdown(other_racer, racer)
 
         else:
             if 0 <= racer.action <= 0.2:
-                for other_racer in participants:
-                    if other_racer.position == racer.position + 1:
-                        banana_slowdown(other_racer)
+                for other_racer in racers_in_reach(racer, [racer.position + 1]):
+                    banana_slowdown(other_racer, racer)
 
             elif 0.2 < racer.action <= 0.4:
-                for other_racer in participants:
-                    if other_racer.position == racer.position - 1:
-                        banana_slowdown(other_racer)
+                for other_racer in racers_in_reach(racer, [racer.position - 1]):
+                    banana_slowdown(other_racer, racer)
         racer.using_item = False
         racer.action = None
         racer.recently_used_item = None
@@ -1367,57 +1714,46 @@ def use_item(racer, participants):
         # Similar to triple green/red shells, but the racer can only hit racers up to 3 positions away
         racer.item = None
         if racer.action is None:
-            racer.action = random.random()
+            racer.action = stream(racer, "action").random()
         if racer.position == 1:
             if 0 <= racer.action <= 0.4:
-                for other_racer in participants:
-                    if other_racer.position == racer.position + 1:
-                        banana_slowdown(other_racer)
+                for other_racer in racers_in_reach(racer, [racer.position + 1]):
+                    banana_slowdown(other_racer, racer)
 
             elif 0.4 < racer.action <= 0.7:
-                back_three = []
-                for other_racer in participants:
-                    if (other_racer.position == racer.position + 1 or
-                            other_racer.position == racer.position + 2 or other_racer.position == racer.position + 3):
-                        back_three.append(other_racer)
-                kart = random.choice(back_three)
-                banana_slowdown(kart)
+                back_three = racers_in_reach(racer, [racer.position + 1, racer.position + 2, racer.position + 3])
+                # The bananas miss if nobody is close enough
+                if back_three:
+                    kart = stream(racer, "target").choice(back_three)
+                    banana_slowdown(kart, racer)
 
         elif racer.position == len(participants):
             if 0 <= racer.action <= 0.4:
-                for other_racer in participants:
-                    if other_racer.position == racer.position - 1:
-                        banana_slowdown(other_racer)
+                for other_racer in racers_in_reach(racer, [racer.position - 1]):
+                    banana_slowdown(other_racer, racer)
 
             elif 0.4 < racer.action <= 0.7:
-                front_three = []
-                for other_racer in participants:
-                    if (other_racer.position == racer.position - 1 or
-                            other_racer.position == racer.position - 2 or other_racer.position == racer.position - 3):
-                        front_three.append(other_racer)
-                kart = random.choice(front_three)
-                banana_slowdown(kart)
+                front_three = racers_in_reach(racer, [racer.position - 1, racer.position - 2, racer.position - 3])
+                # The bananas miss if nobody is close enough
+                if front_three:
+                    kart = stream(racer, "target").choice(front_three)
+                    banana_slowdown(kart, racer)
 
         else:
             if 0 <= racer.action <= 0.25:
-                for other_racer in participants:
-                    if other_racer.position == racer.position + 1:
-                        banana_slowdown(other_racer)
+                for other_racer in racers_in_reach(racer, [racer.position + 1]):
+                    banana_slowdown(other_racer, racer)
 
             elif 0.25 < racer.action <= 0.5:
-                for other_racer in participants:
-                    if other_racer.position == racer.position - 1:
-                        banana_slowdown(other_racer)
+                for other_racer in racers_in_reach(racer, [racer.position - 1]):
+                    banana_slowdown(other_racer, racer)
 
             elif 0.5 < racer.action <= 0.7:
-                within_three = []
-                for other_racer in participants:
-                    if (other_racer.position == racer.position + 1 or other_racer.position == racer.position + 2 or
-                            other_racer.position == racer.position + 3 or other_racer.position == racer.position - 1 or
-                            other_racer.position == racer.position - 2 or other_racer.position == racer.position - 3):
-                        within_three.append(other_racer)
-                kart = random.choice(within_three)
-                banana_slowdown(kart)
+                within_three = racers_in_reach(racer, [racer.position + 1, racer.position + 2, racer.position + 3,
+                                                       racer.position - 1, racer.position - 2, racer.position - 3])
+                if within_three:
+                    kart = stream(racer, "target").choice(within_three)
+                    banana_slowdown(kart, racer)
         racer.using_item = False
         racer.action = None
         racer.recently_used_item = None
@@ -1426,7 +1762,7 @@ def use_item(racer, participants):
         # Similar to triple bananas but a lower chance of doing nothing
         racer.item = None
         if racer.action is None:
-            racer.action = random.random()
+            racer.action = stream(racer, "action").random()
 
         if racer.position == 1 and racer.user_marker == 0:
             racer.user_marker = 4
@@ -1437,114 +1773,42 @@ def use_item(racer, participants):
             racer.user_marker = 6
         if racer.user_marker == 4:
             if 0 <= racer.action <= 0.5:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker != 3:
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 3)
 
             elif 0.5 < racer.action <= 0.8:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (
-                                other_racer.position == racer.position + 1 or other_racer.position == racer.position + 2) and other_racer.marker != 3:
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1, racer.position + 2], 3)
 
             elif 0.8 < racer.action <= 0.9:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if ((other_racer.position == racer.position + 1 or
-                             other_racer.position == racer.position + 2 or other_racer.position == racer.position + 3)
-                                and other_racer.marker != 3):
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1, racer.position + 2, racer.position + 3], 3)
 
         elif racer.user_marker == 5:
             if 0 <= racer.action <= 0.5:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker != 3:
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 3)
 
             elif 0.5 < racer.action <= 0.8:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if ((other_racer.position == racer.position - 1 or other_racer.position == racer.position - 2)
-                                and other_racer.marker != 3):
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1, racer.position - 2], 3)
 
             elif 0.8 < racer.action <= 0.9:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if ((other_racer.position == racer.position - 1 or
-                             other_racer.position == racer.position - 2 or other_racer.position == racer.position - 3)
-                                and other_racer.marker != 3):
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1, racer.position - 2, racer.position - 3], 3)
 
         else:
             if 0 <= racer.action <= 0.2:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position - 1) and other_racer.marker != 3:
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1], 3)
 
             elif 0.2 < racer.action <= 0.35:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if ((other_racer.position == racer.position - 1 or other_racer.position == racer.position - 2)
-                                and other_racer.marker != 3):
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1, racer.position - 2], 3)
 
             elif 0.35 < racer.action <= 0.45:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if ((other_racer.position == racer.position - 1 or
-                             other_racer.position == racer.position - 2 or other_racer.position == racer.position - 3)
-                                and other_racer.marker != 3):
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position - 1, racer.position - 2, racer.position - 3], 3)
 
             elif 0.45 < racer.action <= 0.65:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if (other_racer.position == racer.position + 1) and other_racer.marker != 3:
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1], 3)
 
             elif 0.65 < racer.action <= 0.8:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if ((other_racer.position == racer.position + 1 or other_racer.position == racer.position + 2)
-                                and other_racer.marker != 3):
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1, racer.position + 2], 3)
 
             elif 0.8 < racer.action <= 0.9:
-                for other_racer in participants:
-                    if Race_duration == racer.time_item_used:
-                        if ((other_racer.position == racer.position + 1 or
-                             other_racer.position == racer.position + 2 or other_racer.position == racer.position + 3)
-                                and other_racer.marker != 3):
-                            other_racer.marker = 3
-                    if other_racer.marker == 3:
-                        three_sec_stun(racer, other_racer)
+                hit_positions(racer, [racer.position + 1, racer.position + 2, racer.position + 3], 3)
 
 
 # Creating the objects for all of the racers
@@ -1823,18 +2087,352 @@ all_items_2 = [("lightning_cloud", {1: 0, 2: 0.075}),
                ("banana", {1: 0.375, 2: 0.025}),
                ("trip_bananas", {1: 0.1, 2: 0.025})]
 
+# The item probability list for each possible number of racers
+Item_tables = {2: all_items_2, 3: all_items_3, 4: all_items_4, 5: all_items_5, 6: all_items_6, 7: all_items_7,
+               8: all_items_8, 9: all_items_9, 10: all_items_10, 11: all_items_11, 12: all_items_12}
+
+# A copy of the item probabilities before any race. update_probabilities changes the probability lists while a race
+# is running, so they are set back to these values before every new race
+Default_item_tables = {n: [(item, dict(weights)) for item, weights in table] for n, table in Item_tables.items()}
+
+# The item probabilities every race starts with, which are the default ones unless apply_config changed them
+Config_item_tables = Default_item_tables
+
+# The largest field that can race. Fields of more than 12 racers use synthetic item probabilities, and fields larger
+# than the roster add numbered copies of the characters
+Max_racers = 1000
+
+# The synthetic probability lists made so far, keyed by the number of racers, so each field size is only interpolated
+# once. Emptied by apply_config, since they depend on the 12 racer list
+Synthetic_item_tables = {}
+
+
+def synthetic_item_table(num_racers):
+    '''
+    Makes a probability list for a field of any size by stretching the 12 racer list over it. Every position is placed
+    at the same relative distance from 1st to last place in the 12 racer list, and its probabilities are linearly
+    interpolated between the two nearest positions there
+    Args:
+        num_racers (int): the number of racers in the race
+
+    Returns:
+        list of tuples: the probability list, in the same format as all_items_N
+    '''
+    table = Synthetic_item_tables.get(num_racers)
+    if table is None:
+        base = Config_item_tables[12]
+        table = []
+        for item, weights in base:
+            interpolated = {}
+            for position in range(1, num_racers + 1):
+                x = 1 + (position - 1) * 11 / (num_racers - 1)
+                low = int(x)
+                high = min(low + 1, 12)
+                interpolated[position] = weights[low] + (x - low) * (weights[high] - weights[low])
+            table.append((item, interpolated))
+        Synthetic_item_tables[num_racers] = table
+    return table
+
+
+def base_item_table(num_racers):
+    '''
+    Gets the probability list a race of a given size starts with
+    Args:
+        num_racers (int): the number of racers in the race
+
+    Returns:
+        list of tuples: the configured probability list for that many racers, or a synthetic one if there is none
+    '''
+    if num_racers in Config_item_tables:
+        return Config_item_tables[num_racers]
+    return synthetic_item_table(num_racers)
+
+
+def item_table(num_racers):
+    '''
+    Gets the probability list that a race of a given size is using, which update_probabilities changes while the race
+    is running. The list for a new field size is made the first time it is needed
+    Args:
+        num_racers (int): the number of racers in the race
+
+    Returns:
+        list of tuples: the probability list
+    '''
+    table = Item_tables.get(num_racers)
+    if table is None:
+        table = Item_tables[num_racers] = [(item, dict(weights)) for item, weights in base_item_table(num_racers)]
+    return table
+
+
+# The names and weight classes of the characters that fields of every size are picked from, keyed by the field size
+Rosters = {}
+
+
+def roster(num_racers):
+    '''
+    Lists the characters a field is picked from. Fields up to the size of the roster pick from all_racers, and larger
+    fields also pick from numbered copies of every character, such as "Mario 2", so every racer has its own name
+    Args:
+        num_racers (int): the number of racers in the race
+
+    Returns:
+        list of tuples: the name and weight class of every character that can race
+    '''
+    copies = -(-num_racers // len(all_racers))
+    characters = Rosters.get(copies)
+    if characters is None:
+        characters = Rosters[copies] = [(racer.name, racer.weight) for racer in all_racers] + [
+            (f"{racer.name} {copy}", racer.weight) for copy in range(2, copies + 1) for racer in all_racers]
+    return characters
+
+
+def racer_weight(name):
+    '''
+    Finds the weight class of a character or of a numbered copy of one
+    Args:
+        name (str): the name of the racer
+
+    Returns:
+        str: the weight class
+    '''
+    if name in Racer_weights:
+        return Racer_weights[name]
+    return Racer_weights[name.rsplit(" ", 1)[0]]
+
+
+class Track:
+    '''
+    A race track compiled from its definition. The item boxes and the segments of every lap are laid out once, from the
+    start line to the finish line, in sorted NumPy arrays, so finding the item box or segment at any distance is a
+    binary search
+
+    Attributes:
+    name (str): The name of the track
+    laps (int): The number of laps
+    lap_length (float): The length of one lap, in meters
+    finish_line (float): The length of the race, in meters
+    box_starts (ndarray): The distance of every item box from the start line, in increasing order
+    box_ends (ndarray): The furthest distance past each item box at which a racer still picks it up
+    segment_starts (ndarray): The distance at which every segment starts, in increasing order
+    segment_speeds (ndarray): The speed multiplier of every segment, such as 0.8 for a corner or 0.5 for offroad
+
+    Methods:
+    crosses_item_box, speed_multiplier, lap
+    '''
+
+    def __init__(self, definition):
+        '''
+        Compiles a track definition
+
+        Parameters:
+        definition (dict): the track, as read by read_track. "lap_length" is the length of a lap, "laps" the number of
+                           laps (default 1), "item_boxes" the distances of the item boxes from the start of a lap,
+                           "pickup_window" how far past an item box a racer can still pick it up (default 50), and
+                           "segments" a list of {"start": distance from the start of a lap, "speed": multiplier}, each
+                           lasting until the next one. Parts of a lap that are not covered by a segment have a speed
+                           multiplier of 1
+
+        Returns:
+        None
+        '''
+        self.name = definition.get("name", "Unnamed track")
+        self.laps = definition.get("laps", 1)
+        self.lap_length = definition["lap_length"]
+        window = definition.get("pickup_window", 50)
+        boxes = sorted(definition.get("item_boxes", []))
+        segments = sorted((segment["start"], segment["speed"]) for segment in definition.get("segments", []))
+        if self.laps < 1 or self.lap_length <= 0 or window < 0:
+            raise ValueError("A track needs at least one lap, a positive lap length, and a pickup window of 0 or more")
+        if any(not 0 <= distance < self.lap_length for distance in boxes + [start for start, _ in segments]):
+            raise ValueError("Item boxes and segments must start within the lap")
+        if any(speed <= 0 for _, speed in segments):
+            raise ValueError("Segment speed multipliers must be positive")
+        self.finish_line = self.laps * self.lap_length
+
+        offsets = np.arange(self.laps) * self.lap_length
+        self.box_starts = (offsets[:, None] + np.array(boxes, dtype=float)).ravel()
+        self.box_ends = self.box_starts + window
+        self.segment_starts = (offsets[:, None] + np.array([start for start, _ in segments], dtype=float)).ravel()
+        self.segment_speeds = np.tile(np.array([speed for _, speed in segments], dtype=float), self.laps)
+        # Racers are looked up one at a time during a second of the race, where a call to np.searchsorted costs more
+        # than the rest of a racer's update. These lists hold the same sorted values for bisect
+        self._box_starts = self.box_starts.tolist()
+        self._box_ends = self.box_ends.tolist()
+        self._segment_starts = self.segment_starts.tolist()
+        self._segment_speeds = self.segment_speeds.tolist()
+
+    def crosses_item_box(self, previous, current):
+        '''
+        Checks if a racer's move reached an item box or its pickup window
+
+        Parameters:
+        previous (float): the racer's distance from the start line before the move
+        current (float): the racer's distance after the move
+
+        Returns:
+        bool: True if the move overlapped the pickup window of at least one item box
+        '''
+        return bisect.bisect_right(self._box_starts, current) > bisect.bisect_left(self._box_ends, previous)
+
+    def speed_multiplier(self, distance):
+        '''
+        Finds the speed multiplier of the segment a racer is in
+
+        Parameters:
+        distance (float): the racer's distance from the start line
+
+        Returns:
+        float: the speed multiplier, 1 outside of every segment
+        '''
+        segment = bisect.bisect_right(self._segment_starts, distance) - 1
+        if segment < 0 or distance >= self.finish_line:
+            return 1.0
+        return self._segment_speeds[segment]
+
+    def lap(self, distance):
+        '''
+        Finds the lap a racer is on
+
+        Parameters:
+        distance (float): the racer's distance from the start line
+
+        Returns:
+        int: the lap, from 1 to the number of laps
+        '''
+        return min(max(int(distance // self.lap_length) + 1, 1), self.laps)
+
+
+# Every track compiled so far, keyed by the hash of its definition, so a track is only compiled once however many
+# races are run on it
+Compiled_tracks = {}
+
+
+def read_track(path):
+    '''
+    Reads a track definition from a JSON or TOML file
+    Args:
+        path (str): the file. Files ending in .toml are read as TOML and all others as JSON
+
+    Returns:
+        dict: the track definition, in the format of Track
+    '''
+    if path.endswith(".toml"):
+        with open(path, "rb") as file:
+            return tomllib.load(file)
+    with open(path) as file:
+        return json.load(file)
+
+
+def compile_track(definition):
+    '''
+    Compiles a track definition, or gets it from the tracks that were already compiled
+    Args:
+        definition (dict): the track definition, in the format of Track
+
+    Returns:
+        Track: the compiled track
+    '''
+    key = hashlib.sha256(json.dumps(definition, sort_keys=True).encode()).hexdigest()
+    track = Compiled_tracks.get(key)
+    if track is None:
+        track = Compiled_tracks[key] = Track(definition)
+    return track
+
 
-def update_race_state(participants, num_racers):
+def set_track(definition):
+    '''
+    Sets the track that races are run on in this process, and the finish line to the end of its last lap
+    Args:
+        definition (dict): the track definition, in the format of Track. None goes back to the original straight track,
+                           with an item box every Item_box_spacing meters
+
+    Returns:
+        None
+    '''
+    global Race_track, Race_track_definition, finish_line
+    Race_track_definition = definition
+    if definition is None:
+        Race_track = None
+        return
+    Race_track = compile_track(definition)
+    finish_line = Race_track.finish_line
+
+
+def crosses_item_box(previous, current):
+    '''
+    Checks if a racer's move reached an item box or the 50 meters past it where it can still be picked up. Checking
+    the whole move instead of where the racer ends up means a racer cannot skip over an item box by moving more than 50
+    meters in one step, such as with a bullet bill
+    Args:
+        previous (float): the racer's distance from the start line before the move
+        current (float): the racer's distance after the move
+
+    Returns:
+        bool: True if the move overlapped the pickup window of at least one item box
+    '''
+    if Race_track is not None:
+        return Race_track.crosses_item_box(previous, current)
+    # The original track has an item box every Item_box_spacing meters, starting Item_box_spacing meters from the start
+    # line. The move overlaps the window of box number k if k * spacing <= current and k * spacing + 50 >= previous
+    return max(1, math.ceil((previous - 50) / Item_box_spacing)) <= math.floor(current / Item_box_spacing)
+
+
+def set_worker_settings(event_log_capacity, metrics_interval, random_block_size):
+    '''
+    Sets the settings of this process that can be changed from the command line, in a worker process. Processes that
+    are not forked from the main process, such as on Windows and macOS, start with the default settings otherwise.
+    Worker processes are forked when the first task is submitted, which can be after the main process has started
+    recording a race, so the event log, statistics, and metrics they inherit are cleared. A task that records races
+    sets up its own
+    Args:
+        event_log_capacity (int): the value of Event_log_capacity
+        metrics_interval (float): the value of Metrics_interval
+        random_block_size (int): the value of Random_block_size
+
+    Returns:
+        None
+    '''
+    global Event_log_capacity, Metrics_interval, Random_block_size, Event_log, Race_stats, Race_metrics
+    Event_log_capacity = event_log_capacity
+    Metrics_interval = metrics_interval
+    Random_block_size = random_block_size
+    Event_log = None
+    Race_stats = None
+    Race_metrics = None
+
+
+def race_pool(workers):
+    '''
+    Starts the worker processes that races are run in, with the same settings as this process
+    Args:
+        workers (int): the number of processes, or None for the number of CPUs
+
+    Returns:
+        ProcessPoolExecutor: the processes
+    '''
+    return ProcessPoolExecutor(max_workers=workers, initializer=set_worker_settings,
+                               initargs=(Event_log_capacity, Metrics_interval, Random_block_size))
+
+
+def update_race_state(participants, num_racers, record=True):
     '''
     Runs the race for 1 second
     Args:
         participants (list): the racers present in the race
         num_racers (int): the number of racers in the race
+        record (bool): if False, the race is only simulated and no dataframes are built, which is much faster when the
+                       race is not printed or animated
 
     Returns:
         None
     '''
     global Unavailable_items, Blooper_use_time, POW_use_time, Lightning_use_time
+    # The clock is only read in the seconds that are timed for the metrics
+    timed = Race_metrics is not None and Race_metrics.start_tick()
+    if timed:
+        clock = time.perf_counter
+        movement = pickup = using = 0.0
+        started = clock()
     # Adds the distance, speed, and position at a specific time point to a dataframe that can be visualized in future
     # graphs
     race_data_distance = {"Time Elapsed": [Race_duration]}
@@ -1846,51 +2444,75 @@ def update_race_state(participants, num_racers):
         rd_list.append(Race_duration)
 
     # The data from this dataframe is printed in the terminal with each iteration
-    race_data = pd.DataFrame({'Racer #': [number for number in range(1, num_racers + 1)], 'Duration': rd_list,
-                              'Racer': [character.name for character in participants],
-                              'Position': [character.position for character in participants],
-                              'Speed': [character.speed for character in participants],
-                              'Item': [character.item for character in participants],
-                              'Distance': [character.distance_from_start for character in participants]}).set_index(
-        "Racer #")
+    if record:
+        race_data = pd.DataFrame({'Racer #': [number for number in range(1, num_racers + 1)], 'Duration': rd_list,
+                                  'Racer': [character.name for character in participants],
+                                  'Position': [character.position for character in participants],
+                                  'Speed': [character.speed for character in participants],
+                                  'Item': [character.item for character in participants],
+                                  'Distance': [character.distance_from_start for character in participants]}
+                                 ).set_index("Racer #")
+    if timed:
+        now = clock()
+        recording = now - started
+        started = now
     # Accounts for timing rules for items
     if Race_duration == Lightning_use_time + 30:
-        Unavailable_items.remove("lightning_bolt")
+        make_available("lightning_bolt")
 
     if Race_duration == POW_use_time + 20:
-        Unavailable_items.remove("POW")
+        make_available("POW")
 
     if Race_duration == Blooper_use_time + 15:
-        Unavailable_items.remove("blooper")
+        make_available("blooper")
 
     if Race_duration == 30:
-        Unavailable_items.remove("blue_shell")
+        make_available("blue_shell")
 
     sorted_racers = sorted(participants, key=attrgetter('position'), reverse=True)
     for i in range(len(sorted_racers) - 1):
-        if sorted_racers[i].distance_from_start > sorted_racers[i + 1].distance_from_start:  # If the racer has traveled
-            # a longer distance than the racer in front of it, the first racer has passed the second racer and thus
-            # switch positions
+        if sorted_racers[i].distance_from_start > sorted_racers[i + 1].distance_from_start:  # If the racer has
+            # traveled a longer distance than the racer in front of it, the first racer has passed the second racer
+            # and thus switch positions
             update_position(sorted_racers[i], sorted_racers[i + 1])
+    index_positions(participants)
+    if timed:
+        now = clock()
+        ranking = now - started
+        started = now
 
     for racer in participants:
+        previous_distance = racer.distance_from_start
         update_distance(racer, 1)
 
         if (racer.speed != racer.max_speed) and (not racer.status):
             update_speed(racer, 1)
+        if timed:
+            now = clock()
+            movement += now - started
+            started = now
 
         distance_traveled = racer.distance_from_start
-        remainder = distance_traveled % 250
-        if (distance_traveled >= 250) and (distance_traveled < finish_line) and (0 <= remainder <= 50) and (
-                racer.item is None):  # Item boxes are placed every 250 meters up until 1750 meters. Since some racers
-            # may not land exactly on the item box, items are given to racers if they pass up to 50 meters of the item
-            # box
+        if (distance_traveled < finish_line) and (racer.item is None) and crosses_item_box(
+                previous_distance, distance_traveled):
+            # Item boxes are placed every Item_box_spacing meters before the finish line, or where the track puts
+            # them. Since some racers may not land exactly on the item box, items are given to racers whose move in
+            # this second reached an item box or the 50 meters past it
             get_item(racer, num_racers)
+            if Race_stats is not None:
+                Race_stats.add_item_pull(racer.position, racer.item)
+            if Event_log is not None:
+                Event_log.append((Race_duration, "pickup", racer.name, racer.item, racer.position))
             racer.time_item_got = Race_duration
-            racer.time_delay = random.randint(3, 5)  # Random integer item usage delay to account for the item wheel
-            # spinning and landing on the item in the real game
+            # Random integer item usage delay to account for the item wheel spinning and landing on the item in the
+            # real game
+            racer.time_delay = stream(racer, "delay").randint(3, 5)
             if racer.item in All_possible_unavailable_items and racer.item not in Unavailable_items:
-                Unavailable_items.append(racer.item)
+                make_unavailable(racer.item, racer)
+        if timed:
+            now = clock()
+            pickup += now - started
+            started = now
 
         if racer.item == "lightning_cloud":
             if Race_duration == racer.time_item_got + 1 and racer.item is not None and racer.using_item is False:  # Use
@@ -1899,6 +2521,8 @@ def update_race_state(participants, num_racers):
                 racer.recently_used_item = racer.item
                 racer.time_item_used = Race_duration
                 racer.using_item = True
+                if Event_log is not None:
+                    Event_log.append((Race_duration, "use", racer.name, racer.item, racer.position))
         else:
             if ((Race_duration == racer.time_item_got + racer.time_delay) or (
                     Race_duration == racer.time_item_got + 2 * racer.time_delay) and racer.item is not None and
@@ -1907,6 +2531,8 @@ def update_race_state(participants, num_racers):
                 racer.recently_used_item = racer.item
                 racer.time_item_used = Race_duration
                 racer.using_item = True
+                if Event_log is not None:
+                    Event_log.append((Race_duration, "use", racer.name, racer.item, racer.position))
 
         if racer.recently_used_item is not None:
             use_item(racer, participants)
@@ -1926,17 +2552,34 @@ def update_race_state(participants, num_racers):
             racer.status.remove("stunned")
             racer.status.remove("1s_stun")
             racer.status.remove("invulnerable")
+        if timed:
+            now = clock()
+            using += now - started
+            started = now
 
         # Populates the dataframes with the distance, speed, position, and other parameters for each racer
-        race_data_distance[racer.name] = [racer.distance_from_start]
-        race_data_speed[racer.name] = [racer.speed]
-        race_data_position[racer.name] = [racer.position]
-        index = race_data.Racer[race_data.Racer == racer.name].index.tolist()
-        race_data.loc[index, 'Duration'] = Race_duration
-        race_data.loc[index, 'Position'] = racer.position
-        race_data.loc[index, 'Speed'] = racer.speed
-        race_data.loc[index, 'Item'] = racer.item
-        race_data.loc[index, 'Distance'] = racer.distance_from_start
+        if record:
+            race_data_distance[racer.name] = [racer.distance_from_start]
+            race_data_speed[racer.name] = [racer.speed]
+            race_data_position[racer.name] = [racer.position]
+            index = race_data.Racer[race_data.Racer == racer.name].index.tolist()
+            race_data.loc[index, 'Duration'] = Race_duration
+            race_data.loc[index, 'Position'] = racer.position
+            race_data.loc[index, 'Speed'] = racer.speed
+            race_data.loc[index, 'Item'] = racer.item
+            race_data.loc[index, 'Distance'] = racer.distance_from_start
+        if timed:
+            now = clock()
+            recording += now - started
+            started = now
+
+    if Event_log is not None:
+        Event_log.end_second()
+
+    if not record:
+        if timed:
+            Race_metrics.add_tick((movement, ranking, pickup, using, recording))
+        return None
 
     df_distance = pd.DataFrame(race_data_distance)
     df_speed = pd.DataFrame(race_data_speed)
@@ -1945,25 +2588,56 @@ def update_race_state(participants, num_racers):
     # Update positions based on distance
     df_position.iloc[:, 1:] = df_distance.iloc[:, 1:].rank(axis=1, ascending=False, method='min')
 
+    if timed:
+        Race_metrics.add_tick((movement, ranking, pickup, using, recording + clock() - started))
     return df_position, df_speed, df_distance, race_data
 
 
-def run_race_simulation(participants, num_racers):
+def mark_finished(participants):
     '''
-    Simulates the entire race by running update_race_state until the race is completed
+    Marks the racers who crossed the finish line during the last second as finished and gives them their finishing
+    position
     Args:
         participants (list): the racers participating in the race
-        num_racers (int): the number of racers in the race
 
     Returns:
         None
     '''
-    global df_position, df_speed, df_distance, Race_duration, finish_line, race_data
+    crossed = [racer for racer in participants if racer.distance_from_start >= finish_line and racer.finished is False]
+    if not crossed:
+        return
+    already_finished = sum(1 for racer in participants if racer.finished)
+    # The racer who got the furthest past the finish line crossed it first
+    crossed.sort(key=attrgetter('distance_from_start'), reverse=True)
+    for place, racer in enumerate(crossed, start=already_finished + 1):
+        racer.finished = True
+        racer.finish_time = Race_duration
+        racer.finish_position = place
+        if Event_log is not None:
+            Event_log.append((Race_duration, "finish", racer.name, None, place))
+
+
+def race_ticks(participants, num_racers, on_tick=None, show_table=True):
+    '''
+    Runs the race one second at a time until the race is completed. The race pauses at every yield, which is where
+    the caller waits before running the next second, so the same race can be played back at any pace
+    Args:
+        participants (list): the racers participating in the race
+        num_racers (int): the number of racers in the race
+        on_tick (function): called with df_position, df_speed, and df_distance once before the race starts and again
+                            every time a row is added to them. Used to render frames while the race is still running
+        show_table (bool): if True, the state of the race is printed as a table after every second
+
+    Yields:
+        Race_duration (int): the number of seconds that have elapsed since the start of the race
+    '''
+    global df_position, df_speed, df_distance, Race_duration, race_data
 
-    finish_line = 2000  # Race length can be changed freely
     df_distance = pd.DataFrame({"Race duration": [Race_duration]})
     df_speed = pd.DataFrame({"Race Duration": [Race_duration]})
     df_position = pd.DataFrame({"Race Duration": [Race_duration]})
+    if on_tick is not None:
+        on_tick(df_position, df_speed, df_distance)
 
     while not all(kart.finished for kart in participants):  # Runs the race until all racers are finished
         Race_duration += 1
@@ -1974,151 +2648,4481 @@ def run_race_simulation(participants, num_racers):
         df_distance = pd.concat([df_distance, race_data_distance], ignore_index=True)
         df_speed = pd.concat([df_speed, race_data_speed], ignore_index=True)
         df_position = pd.concat([df_position, race_data_position], ignore_index=True)
+        if on_tick is not None:
+            on_tick(df_position, df_speed, df_distance)
 
         # Prints the current state of the race
-        print(tabulate(race_data, headers='keys', tablefmt='psql'))
+        if show_table:
+            print(tabulate(race_data, headers='keys', tablefmt='psql'))
 
-        # Delays the execution of the while loop to view the current race state with each iteration
-        time.sleep(1)
+        # Lets the caller delay the next iteration to view the current race state
+        yield Race_duration
 
-        for racer in participants:
-            if racer.distance_from_start >= finish_line and racer.finished is False:
-                racer.finished = True
-    return df_distance, df_position, df_speed
+        mark_finished(participants)
 
 
-# Where all the other functions will get called and where we will create the animation
-def main():
+def run_race_simulation(participants, num_racers, on_tick=None):
     '''
-    Runs all the functions described above
+    Simulates the entire race by running update_race_state until the race is completed
+    Args:
+        participants (list): the racers participating in the race
+        num_racers (int): the number of racers in the race
+        on_tick (function): called with df_position, df_speed, and df_distance once before the race starts and again
+                            every time a row is added to them. Used to render frames while the race is still running
+
     Returns:
         None
     '''
-    # Checks if the user inputs an integer between 2 and 12
-    # The error handling at the bottom will handle the cases where the user inputs a string
-    n = input("Enter number of racers: ")
-
-    if (int(float(n)) != float(n)) or (float(n) < 2.0) or (float(n) > 12.0):
-        print("Must input an integer between 2 and 12, inclusive.")
-        sys.exit()
-    num_racers = int(float(n))
-
-    # Select int(n) racers at random from the list of all racers
-    participants = random.sample(all_racers, num_racers)
-    initial_positions = [i for i in range(1, num_racers + 1)]
+    for _ in race_ticks(participants, num_racers, on_tick):
+        # Delays the execution of the while loop to view the current race state with each iteration
+        time.sleep(1)
+    return df_distance, df_position, df_speed
 
-    # Assign each participant an initial position and initial distance from the starting line. Simulates a staggered
-    # start in a race
 
-    for j in range(len(participants)):
-        participants[j].position = initial_positions[j]
-        participants[j].distance_from_start = -1 * initial_positions[j]
+# The slowest and fastest speeds that a race can be played back at in real time
+Min_playback_speed = 0.25
+Max_playback_speed = 100
 
-    df_distance, df_position, df_speed = run_race_simulation(participants, num_racers)
 
-    fig, ax = plt.subplots()
-    fig2, ax2 = plt.subplots()
-    fig2.set_size_inches(8, 5)
-    fig3, ax3 = plt.subplots()
-    fig3.set_size_inches(8, 5)
+async def play_race(participants, num_racers, speed=1.0, on_tick=None, dashboard=None, refresh_rate=10,
+                    win_odds=None):
+    '''
+    Plays the race back in real time without blocking, so other coroutines keep running during the race. Every second
+    of the race is scheduled on the event loop's monotonic clock, at its own time from the start of the race, so any
+    time spent simulating or printing never adds up into drift
+    Args:
+        participants (list): the racers participating in the race
+        num_racers (int): the number of racers in the race
+        speed (float): how many times faster than real time the race is played, from 0.25 to 100.
+                       None plays the race as fast as possible
+        on_tick (function): called like the on_tick of race_ticks, but from a worker thread that the race waits on
+                            without blocking the event loop, so it can block, such as on a full queue
+        dashboard (TerminalDashboard): if given, the race is shown on this dashboard instead of printing a table
+                                       every second
+        refresh_rate (float): how many times per second the dashboard is redrawn
+        win_odds (dict): if given, the win odds on the dashboard are kept up to date by track_win_odds, which is
+                         passed these keyword arguments (pool, and optionally rollouts and time_budget)
+
+    Returns:
+        df_distance, df_position, df_speed (DataFrame): the same race data as run_race_simulation
+    '''
+    if speed is not None and not Min_playback_speed <= speed <= Max_playback_speed:
+        raise ValueError(f"The playback speed must be between {Min_playback_speed} and {Max_playback_speed}")
+
+    # The dashboard is redrawn by its own task, so how often it refreshes does not depend on the playback speed
+    if dashboard is not None:
+        refresher = asyncio.create_task(dashboard.run(refresh_rate))
+    if dashboard is not None and win_odds is not None:
+        tracker = asyncio.create_task(track_win_odds(participants, num_racers, dashboard, **win_odds))
+
+    # The frames are handed over and on_tick is run in a thread after every second, so a slow or blocked on_tick does
+    # not stall the dashboard or the win odds. Every second makes new dataframes, so the frames held do not change
+    handed = []
+    hand_over = None if on_tick is None else lambda *frames: handed.append(frames)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    try:
+        for tick, _ in enumerate(race_ticks(participants, num_racers, hand_over, show_table=dashboard is None),
+                                 start=1):
+            while handed:
+                await asyncio.to_thread(on_tick, *handed.pop(0))
+            if speed is None:
+                # Still gives the other coroutines a turn between every second of the race
+                await asyncio.sleep(0)
+            else:
+                await asyncio.sleep(max(0, start + tick / speed - loop.time()))
+    finally:
+        if dashboard is not None and win_odds is not None:
+            tracker.cancel()
+        if dashboard is not None:
+            refresher.cancel()
+            dashboard.refresh()
+            dashboard.close()
+    return df_distance, df_position, df_speed
+
+
+# A racer can be left stunned for good when the racer who stunned them loses their item before the stun wears off, in
+# which case the race never ends. Races that are not watched are stopped after this many seconds
+Max_race_duration = 600
+
+# The attributes of a racer, in the order they are stored in a race snapshot
+Racer_fields = ("name", "weight", "position", "item", "recently_used_item", "distance_from_start", "speed",
+                "max_speed", "acceleration", "status", "racers_passed", "time_item_got", "time_item_used", "time_delay",
+                "using_item", "action", "shocked", "marker", "user_marker", "TC_initial", "TC_final", "finished",
+                "finish_time", "finish_position")
+
+# The complete state of a race at the end of one second. Every field only holds numbers, strings, and tuples, so a
+# snapshot can be pickled, sent to another process, and restored any number of times
+RaceSnapshot = namedtuple("RaceSnapshot", ["num_racers", "race_duration", "lightning_use_time", "blooper_use_time",
+                                           "pow_use_time", "unavailable_items", "finish_line", "item_table", "racers",
+                                           "rng_state", "item_box_spacing", "track", "block_states"])
+
+
+def reset_race_state():
+    '''
+    Sets the race clock, the item timing rules, the unavailable items, and the item probabilities back to how they are
+    before any race, so that another race can be run in the same process. The item probabilities are the ones of the
+    configuration set by apply_config, if any
+    Args:
+        None
+
+    Returns:
+        None
+    '''
+    global Race_duration, Lightning_use_time, Blooper_use_time, POW_use_time
+    Race_duration = 0
+    Lightning_use_time = 0
+    Blooper_use_time = 0
+    POW_use_time = 0
+    Unavailable_items[:] = ["lightning_bolt", "POW", "blue_shell", "blooper"]
+    for marked in Marked_racers.values():
+        marked.clear()
+    for affected in Field_effects.values():
+        affected.clear()
+    # The lists are changed in place because get_item uses them through the all_items_N names
+    for n, table in Item_tables.items():
+        table[:] = [(item, dict(weights)) for item, weights in base_item_table(n)]
+
+
+def apply_config(config=None):
+    '''
+    Changes the settings that races are run with in this process, so that variants of the game can be simulated
+    without editing the source
+    Args:
+        config (dict): the settings to change. "item_tables" maps a number of racers to a probability list in the same
+                       format as all_items_N, "weight_speeds" maps a weight class to its base max speed,
+                       "item_box_spacing" is the distance between item boxes, "finish_line" is the length of the race,
+                       and "track" is a track definition in the format of Track, which sets its own finish line.
+                       Settings that are left out keep their original values. None restores all the original settings
+
+    Returns:
+        None
+    '''
+    global Config_item_tables, Item_box_spacing, finish_line
+    if config is None:
+        config = {}
+    Config_item_tables = dict(Default_item_tables)
+    Synthetic_item_tables.clear()
+    for n, table in config.get("item_tables", {}).items():
+        Config_item_tables[int(n)] = [(item, {int(position): weight for position, weight in weights.items()})
+                                      for item, weights in table]
+    Weight_speeds.clear()
+    Weight_speeds.update(Default_weight_speeds)
+    Weight_speeds.update(config.get("weight_speeds", {}))
+    Item_box_spacing = config.get("item_box_spacing", Default_item_box_spacing)
+    finish_line = config.get("finish_line", Default_finish_line)
+    check_config(config)
+    set_track(config.get("track"))
+    reset_race_state()
+
+
+def check_config(config):
+    '''
+    Checks that the settings of a configuration can be used together, so a study can reject it before any races are
+    sent to other processes
+    Args:
+        config (dict): the configuration, in the format of apply_config
+
+    Returns:
+        None
+    '''
+    if "track" in config and "finish_line" in config:
+        raise ValueError("A track sets its own finish line, so a configuration cannot have both")
+
+
+def snapshot_race(participants, num_racers):
+    '''
+    Takes a snapshot of the complete state of the race: every attribute of every racer, the race clock, the item timing
+    clocks, the unavailable items, the item probabilities (which change during the race), the track, and the state of
+    the random number generators
+    Args:
+        participants (list): the racers participating in the race
+        num_racers (int): the number of racers in the race
+
+    Returns:
+        RaceSnapshot: the state of the race
+    '''
+    racers = []
+    for racer in participants:
+        fields = [getattr(racer, field) for field in Racer_fields]
+        fields[Racer_fields.index("status")] = tuple(racer.status)
+        racers.append(tuple(fields))
+    probabilities = tuple((item, tuple(weights.items())) for item, weights in item_table(num_racers))
+    return RaceSnapshot(num_racers, Race_duration, Lightning_use_time, Blooper_use_time, POW_use_time,
+                        tuple(Unavailable_items), finish_line, probabilities, tuple(racers), random.getstate(),
+                        Item_box_spacing, Race_track_definition,
+                        tuple((purpose, generator.getstate()) for purpose, generator in Block_draws.items()))
+
+
+def restore_race(snapshot, seed=None):
+    '''
+    Restores a race from a snapshot into new racer objects, so any number of races can be forked from one snapshot
+    without replaying the seconds before it
+    Args:
+        snapshot (RaceSnapshot): the state of the race to restore
+        seed (int): if given, the random number generator is seeded with it instead of being restored, so the race
+                    continues differently from the original one
+
+    Returns:
+        participants (list): new racers with the same attributes as the racers in the snapshot
+    '''
+    global Race_duration, Lightning_use_time, Blooper_use_time, POW_use_time, finish_line, Item_box_spacing
+    # Only the probability list for this number of racers is used by the race, so the others are left as they are
+    Race_duration = snapshot.race_duration
+    Lightning_use_time = snapshot.lightning_use_time
+    Blooper_use_time = snapshot.blooper_use_time
+    POW_use_time = snapshot.pow_use_time
+    Unavailable_items[:] = snapshot.unavailable_items
+    set_track(snapshot.track)
+    finish_line = snapshot.finish_line
+    Item_box_spacing = snapshot.item_box_spacing
+    item_table(snapshot.num_racers)[:] = [(item, dict(weights)) for item, weights in snapshot.item_table]
+    if seed is None:
+        random.setstate(snapshot.rng_state)
+        for purpose, state in snapshot.block_states:
+            Block_draws[purpose] = BlockRandom(0)
+            Block_draws[purpose].setstate(state)
+    else:
+        random.seed(seed)
+        seed_block_draws()
+
+    status = Racer_fields.index("status")
+    marker = Racer_fields.index("marker")
+    for marked in Marked_racers.values():
+        marked.clear()
+    participants = []
+    for fields in snapshot.racers:
+        # Skips Racer.__init__, which would draw a new max speed
+        racer = Racer.__new__(Racer)
+        racer.__dict__.update(zip(Racer_fields, fields))
+        racer.status = list(fields[status])
+        # The marker is set through Racer.marker so the racer is added to Marked_racers
+        del racer.__dict__["marker"]
+        racer._marker = 0
+        racer.marker = fields[marker]
+        participants.append(racer)
+    # The racers affected by the field-wide items are the ones that still have their status
+    for effect in Field_effects:
+        Field_effects[effect] = [racer for racer in participants if effect in racer.status]
+    return participants
+
+
+def simulate_race(participants, num_racers, max_duration=None, step=None, on_tick=None):
+    '''
+    Runs the race until all racers have finished without printing, animating, or waiting between seconds. The race
+    continues from its current state, so it can also finish a race restored from a snapshot
+    Args:
+        participants (list): the racers participating in the race
+        num_racers (int): the number of racers in the race
+        max_duration (int): the race is stopped after this many seconds even if some racers have not finished.
+                            Defaults to Max_race_duration
+        step (function): runs a second of the race, with the arguments of update_race_state. Defaults to
+                         update_race_state
+        on_tick (function): called with the participants after every second
+
+    Returns:
+        list: the racers in the order they finished the race, followed by any racers who did not finish (whose
+              finish_position is None), from the furthest to the least far
+    '''
+    global Race_duration
+    if max_duration is None:
+        max_duration = Max_race_duration
+    if step is None:
+        step = update_race_state
+    # A snapshot can be taken right after racers crossed the line but before they were marked as finished
+    mark_finished(participants)
+    while not all(kart.finished for kart in participants) and Race_duration < max_duration:
+        Race_duration += 1
+        step(participants, num_racers, record=False)
+        mark_finished(participants)
+        if on_tick is not None:
+            on_tick(participants)
+    finished = sorted((racer for racer in participants if racer.finished), key=attrgetter('finish_position'))
+    unfinished = sorted((racer for racer in participants if not racer.finished), key=attrgetter('distance_from_start'),
+                        reverse=True)
+    return finished + unfinished
+
+
+def try_race(participants, num_racers, step=None):
+    '''
+    Runs a race to the end with simulate_race, giving up on it if the item logic fails. A status effect is sometimes
+    removed twice when items interact, which raises a ValueError
+    Args:
+        participants (list): the racers participating in the race
+        num_racers (int): the number of racers in the race
+        step (function): passed on to simulate_race
+
+    Returns:
+        list: the racers in the order given by simulate_race, or None if the race failed
+    '''
+    try:
+        return simulate_race(participants, num_racers, step=step)
+    except ValueError:
+        return None
+
+
+# The most continuations a worker runs before sending them back, which takes about 40 milliseconds
+Max_rollout_batch = 25
+
+# The estimated chances of each racer finishing in each position, from a number of simulated continuations of a race
+FinishEstimate = namedtuple("FinishEstimate", ["rollouts", "probabilities", "intervals"])
+
+
+def wilson_interval(successes, trials, z=1.96):
+    '''
+    Finds the Wilson score confidence interval of a proportion. Unlike the usual normal interval, it does not shrink to
+    nothing when a racer has never or always finished in a position
+    Args:
+        successes (int): the number of trials with the outcome
+        trials (int): the total number of trials
+        z (float): the normal quantile of the confidence level. 1.96 gives a 95% interval
+
+    Returns:
+        low, high (float): the bounds of the interval
+    '''
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def run_rollouts(snapshot, seeds):
+    '''
+    Finishes a race from a snapshot once for every seed. Runs in the worker processes of estimate_finish_probabilities
+    Args:
+        snapshot (RaceSnapshot): the state of the race to continue from
+        seeds (range): one seed for each continuation
+
+    Returns:
+        list of tuples: the names of the racers in the order they finished, for each continuation
+    '''
+    orders = []
+    for seed in seeds:
+        participants = restore_race(snapshot, seed=seed)
+        # Continuations that fail are left out
+        order = try_race(participants, snapshot.num_racers)
+        if order is None:
+            continue
+        orders.append(tuple(racer.name for racer in order))
+    return orders
+
+
+def estimate_finish_probabilities(snapshot, rollouts=1000, time_budget=None, pool=None, workers=None, seed=None,
+                                  z=1.96):
+    '''
+    Estimates the chance of every racer finishing in every position by finishing the race from a snapshot many times
+    with different random numbers, in parallel. With a time budget, only the continuations that finished in time are
+    counted, so the estimate can be updated every second of a live race
+    Args:
+        snapshot (RaceSnapshot): the state of the race to estimate from
+        rollouts (int): the number of continuations to run
+        time_budget (float): the number of seconds to wait for continuations. None waits for all of them
+        pool (ProcessPoolExecutor): the processes that run the continuations. A pool that is kept for the whole race
+                                    avoids starting new processes every second. If None, a pool is made for this call
+        workers (int): the number of processes, used to size the pool and to split the continuations between them.
+                       Given with a pool, it should be the number of processes the pool was started with. Defaults to
+                       the number of CPUs
+        seed (int): the seed of the first continuation, the others use the following seeds. Defaults to a random seed
+                    that does not touch the random number generator of the race
+        z (float): the normal quantile of the confidence level of the intervals. 1.96 gives 95% intervals
+
+    Returns:
+        FinishEstimate: the number of continuations that were counted, and for every racer name, the chance of
+                        finishing in each position (first place first) and its confidence interval
+    '''
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if seed is None:
+        seed = int.from_bytes(os.urandom(4), "little")
+    own_pool = pool is None
+    if own_pool:
+        pool = race_pool(workers)
+
+    # A few batches per worker keep every worker busy, and small batches mean little work is lost at the deadline
+    batch_size = max(1, min(Max_rollout_batch, rollouts // (4 * workers)))
+    futures = [pool.submit(run_rollouts, snapshot, range(seed + start, seed + min(start + batch_size, rollouts)))
+               for start in range(0, rollouts, batch_size)]
+
+    num_racers = len(snapshot.racers)
+    counts = {fields[0]: [0] * num_racers for fields in snapshot.racers}
+    completed = 0
+    try:
+        timeout = None if deadline is None else max(0, deadline - time.monotonic())
+        for future in as_completed(futures, timeout=timeout):
+            for order in future.result():
+                for place, name in enumerate(order):
+                    counts[name][place] += 1
+                completed += 1
+    except FuturesTimeoutError:
+        pass
+    finally:
+        for future in futures:
+            future.cancel()
+        if own_pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    probabilities = {name: [count / completed if completed else 0.0 for count in places]
+                     for name, places in counts.items()}
+    intervals = {name: [wilson_interval(count, completed, z) for count in places] for name, places in counts.items()}
+    return FinishEstimate(completed, probabilities, intervals)
+
+
+async def track_win_odds(participants, num_racers, dashboard, pool, workers, rollouts=200, time_budget=0.5):
+    '''
+    Keeps the win odds on a dashboard up to date during a live race. After every second of the race, a snapshot is
+    taken and the estimate runs in another thread, so playback never waits for it
+    Args:
+        participants (list): the racers participating in the race
+        num_racers (int): the number of racers in the race
+        dashboard (TerminalDashboard): the dashboard showing the race
+        pool (ProcessPoolExecutor): the processes that run the continuations
+        workers (int): the number of processes in the pool
+        rollouts (int): the number of continuations for each estimate
+        time_budget (float): the number of seconds each estimate may take
+
+    Returns:
+        None
+    '''
+    estimated_at = None
+    while not all(racer.finished for racer in participants):
+        if Race_duration == estimated_at:
+            await asyncio.sleep(0.01)
+            continue
+        estimated_at = Race_duration
+        snapshot = snapshot_race(participants, num_racers)
+        estimate = await asyncio.to_thread(estimate_finish_probabilities, snapshot, rollouts, time_budget, pool,
+                                           workers)
+        if estimate.rollouts:
+            dashboard.win_odds = {name: places[0] for name, places in estimate.probabilities.items()}
+
+
+# The RaceStats that item pulls and hits are counted in while races are simulated. None when they are not counted,
+# which is the case for a normal race
+Race_stats = None
+
+# The number of races a worker simulates before sending its statistics back
+Race_batch_size = 200
+
+
+def welford_update(accumulator, value):
+    '''
+    Adds a value to a running count, mean, and sum of squared differences from the mean (Welford's algorithm)
+    Args:
+        accumulator (list): the count, mean, and sum of squared differences, which are updated in place
+        value (float): the value to add
+
+    Returns:
+        None
+    '''
+    accumulator[0] += 1
+    delta = value - accumulator[1]
+    accumulator[1] += delta / accumulator[0]
+    accumulator[2] += delta * (value - accumulator[1])
+
+
+def welford_combine(first, second):
+    '''
+    Combines two running counts, means, and sums of squared differences from the mean (Chan's formula)
+    Args:
+        first (list): the count, mean, and sum of squared differences of some values
+        second (list): the same for other values
+
+    Returns:
+        list: the count, mean, and sum of squared differences of all the values
+    '''
+    n_a, mean_a, m2_a = first
+    n_b, mean_b, m2_b = second
+    n = n_a + n_b
+    if n == 0:
+        return [0, 0.0, 0.0]
+    delta = mean_b - mean_a
+    return [n, mean_a + delta * n_b / n, m2_a + m2_b + delta * delta * n_a * n_b / n]
+
+
+def position_counts(counts, key, size):
+    '''
+    Gets the number of times a racer, weight class, or starting position finished in each position, making it longer if
+    the race has more positions than were counted so far
+    Args:
+        counts (dict): the counts of every key
+        key: the racer, weight class, or starting position
+        size (int): the number of positions the race has, at least 12
+
+    Returns:
+        list: the count of every position, from 1st place
+    '''
+    places = counts.setdefault(key, [0] * size)
+    if len(places) < size:
+        places.extend([0] * (size - len(places)))
+    return places
+
+
+class RaceStats:
+    '''
+    Statistics of many races that are updated as every race finishes, so no race data has to be kept. Statistics
+    gathered by different processes can be merged into one
+
+    Attributes:
+    races (int): The number of races counted
+    unfinished (int): The number of races that were stopped before every racer finished
+    failed (int): The number of races that were abandoned because the item logic raised an error. They are not counted
+                  in the other statistics, except for the item pulls and hits before the error
+    positions (dict): For every racer name, how many times they finished in each position, first place first
+    weight_positions (dict): For every weight class, how many times its racers finished in each position
+    start_positions (dict): For every starting position, how many times the racer starting there finished in each
+                            position
+    finish_times (dict): For every racer name, the number of races they finished and the running mean and sum of
+                         squared differences from the mean of their finishing times (Welford's algorithm)
+    item_pulls (dict): For every position, how many times each item was pulled from an item box in that position
+    item_hits (dict): For every item, how many times it hit a racer
+    item_stuns (dict): For every item, how many of its hits stunned the racer
+    metrics (RaceMetrics): How fast the races were simulated, if they were counted
+
+    Methods:
+    add_race, add_record, add_item_pull, add_hit, merge, finish_time_mean, finish_time_variance, summary,
+    weight_summary, item_summary
+    '''
+
+    def __init__(self):
+        '''
+        Constructs an empty set of statistics
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        self.races = 0
+        self.unfinished = 0
+        self.failed = 0
+        self.positions = {}
+        self.weight_positions = {}
+        self.start_positions = {}
+        self.finish_times = {}
+        self.item_pulls = {}
+        self.item_hits = {}
+        self.item_stuns = {}
+        self.metrics = None
+
+    def add_race(self, order, start_positions=None):
+        '''
+        Counts a race once it is over
+
+        Parameters:
+        order (list): the racers in the order they finished, as returned by simulate_race
+        start_positions (dict): the starting position of every racer, keyed by name. If None, results by starting
+                                position are not counted
+
+        Returns:
+        None
+        '''
+        self.races += 1
+        # Racers who did not finish are at the end of the order
+        if order[-1].finished is False:
+            self.unfinished += 1
+        size = max(12, len(order))
+        for place, racer in enumerate(order):
+            position_counts(self.positions, racer.name, size)[place] += 1
+            position_counts(self.weight_positions, racer.weight, size)[place] += 1
+            if start_positions is not None:
+                position_counts(self.start_positions, start_positions[racer.name], size)[place] += 1
+            if racer.finished is False:
+                continue
+            welford_update(self.finish_times.setdefault(racer.name, [0, 0.0, 0.0]), racer.finish_time)
+
+    def add_record(self, record):
+        '''
+        Counts a race from its compact record, as made by race_records and kept in a ResultCache. Gives the same
+        statistics as counting the race with add_race, add_item_pull, and add_hit while it runs
+
+        Parameters:
+        record (tuple): the names of the racers in the order they finished (empty if the race failed), their finishing
+                        times (None for racers who did not finish), their starting positions, the items pulled with
+                        the position of the racer, and the items that hit a racer with whether they stunned them
+
+        Returns:
+        None
+        '''
+        names, finish_times, start_positions, pulls, hits = record
+        for position, item in pulls:
+            self.add_item_pull(position, item)
+        for item, stun in hits:
+            self.add_hit(item, stun)
+        if not names:
+            self.failed += 1
+            return
+        self.races += 1
+        if finish_times[-1] is None:
+            self.unfinished += 1
+        size = max(12, len(names))
+        for place, (name, finish_time, start) in enumerate(zip(names, finish_times, start_positions)):
+            position_counts(self.positions, name, size)[place] += 1
+            position_counts(self.weight_positions, racer_weight(name), size)[place] += 1
+            position_counts(self.start_positions, start, size)[place] += 1
+            if finish_time is not None:
+                welford_update(self.finish_times.setdefault(name, [0, 0.0, 0.0]), finish_time)
+
+    def add_item_pull(self, position, item):
+        '''
+        Counts an item pulled from an item box
+
+        Parameters:
+        position (int): the position of the racer who got the item
+        item (str): the item
+
+        Returns:
+        None
+        '''
+        pulls = self.item_pulls.setdefault(position, {})
+        pulls[item] = pulls.get(item, 0) + 1
+
+    def add_hit(self, item, stun):
+        '''
+        Counts a racer being hit by an item
+
+        Parameters:
+        item (str): the item that hit the racer
+        stun (bool): whether the hit stunned the racer
+
+        Returns:
+        None
+        '''
+        self.item_hits[item] = self.item_hits.get(item, 0) + 1
+        if stun:
+            self.item_stuns[item] = self.item_stuns.get(item, 0) + 1
+
+    def merge(self, other):
+        '''
+        Adds the statistics of other races, such as the ones simulated by another process
+
+        Parameters:
+        other (RaceStats): the statistics to add
+
+        Returns:
+        RaceStats: these statistics, so merges can be chained
+        '''
+        self.races += other.races
+        self.unfinished += other.unfinished
+        self.failed += other.failed
+        for mine, theirs in ((self.positions, other.positions), (self.weight_positions, other.weight_positions),
+                             (self.start_positions, other.start_positions)):
+            for key, counts in theirs.items():
+                mine[key] = [a + b for a, b in itertools.zip_longest(mine.get(key, []), counts, fillvalue=0)]
+        for name, times in other.finish_times.items():
+            self.finish_times[name] = welford_combine(self.finish_times.get(name, [0, 0.0, 0.0]), times)
+        for position, pulls in other.item_pulls.items():
+            mine = self.item_pulls.setdefault(position, {})
+            for item, count in pulls.items():
+                mine[item] = mine.get(item, 0) + count
+        for mine, theirs in ((self.item_hits, other.item_hits), (self.item_stuns, other.item_stuns)):
+            for item, count in theirs.items():
+                mine[item] = mine.get(item, 0) + count
+        # Statistics saved before metrics were kept do not have them
+        theirs = getattr(other, "metrics", None)
+        if theirs is not None:
+            self.metrics = theirs if self.metrics is None else self.metrics.merge(theirs)
+        return self
+
+    def finish_time_mean(self, name):
+        '''
+        Finds a racer's mean finishing time
+
+        Parameters:
+        name (str): the name of the racer
+
+        Returns:
+        float: the mean finishing time in seconds, or None if they never finished
+        '''
+        n, mean, _ = self.finish_times.get(name, (0, 0.0, 0.0))
+        return mean if n else None
+
+    def finish_time_variance(self, name):
+        '''
+        Finds the sample variance of a racer's finishing times
+
+        Parameters:
+        name (str): the name of the racer
+
+        Returns:
+        float: the variance in seconds squared, or None if they finished fewer than two races
+        '''
+        n, _, m2 = self.finish_times.get(name, (0, 0.0, 0.0))
+        return m2 / (n - 1) if n > 1 else None
+
+    def summary(self):
+        '''
+        Summarizes the results of every racer
+
+        Parameters:
+        None
+
+        Returns:
+        DataFrame: the number of races, wins, win rate, mean finishing position, and mean and standard deviation of
+                   the finishing time of every racer, from the highest win rate to the lowest
+        '''
+        rows = []
+        for name, counts in self.positions.items():
+            races = sum(counts)
+            variance = self.finish_time_variance(name)
+            rows.append({"Racer": name, "Races": races, "Wins": counts[0], "Win Rate": counts[0] / races,
+                         "Mean Position": sum(place * count for place, count in enumerate(counts, start=1)) / races,
+                         "Mean Finish Time": self.finish_time_mean(name),
+                         "Finish Time SD": variance ** 0.5 if variance is not None else None})
+        return pd.DataFrame(rows).sort_values("Win Rate", ascending=False).set_index("Racer")
+
+    def weight_summary(self):
+        '''
+        Summarizes how often each weight class finished in each position
+
+        Parameters:
+        None
+
+        Returns:
+        DataFrame: for every weight class, the share of its racers' results in each position
+        '''
+        num_positions = max((place for counts in self.weight_positions.values()
+                             for place, count in enumerate(counts, start=1) if count), default=0)
+        return pd.DataFrame({weight: [count / sum(counts) for count in counts[:num_positions]]
+                             for weight, counts in self.weight_positions.items()},
+                            index=pd.RangeIndex(1, num_positions + 1, name="Position"))
+
+    def item_summary(self):
+        '''
+        Summarizes how often every item was pulled and how often it hit and stunned other racers
+
+        Parameters:
+        None
+
+        Returns:
+        DataFrame: the number of pulls, hits, and stuns of every item
+        '''
+        pulls = {}
+        for position_pulls in self.item_pulls.values():
+            for item, count in position_pulls.items():
+                pulls[item] = pulls.get(item, 0) + count
+        items = sorted(set(pulls) | set(self.item_hits))
+        return pd.DataFrame({"Pulls": [pulls.get(item, 0) for item in items],
+                             "Hits": [self.item_hits.get(item, 0) for item in items],
+                             "Stuns": [self.item_stuns.get(item, 0) for item in items]},
+                            index=pd.Index(items, name="Item"))
+
+
+def record_hit(item, stun, racer):
+    '''
+    Counts a racer being hit by an item in Race_stats, if hits are being counted, and records the hit in Event_log, if
+    events are being recorded. Every hit goes through here, so no hit is counted without being recorded
+    Args:
+        item (str): the item that hit the racer
+        stun (bool): whether the hit stunned the racer
+        racer (obj): the racer who was hit
+
+    Returns:
+        None
+    '''
+    if Race_stats is not None:
+        Race_stats.add_hit(item, stun)
+    if Event_log is not None:
+        Event_log.append((Race_duration, "stun" if stun else "hit", racer.name, item, racer.position))
+
+
+# The kinds of events an EventLog records
+Event_kinds = ("start", "pickup", "use", "hit", "stun", "stun_expired", "overtake", "unavailable", "available",
+               "finish")
+
+# One event of a race. kind is one of Event_kinds, racer is the name of the racer it happened to (None for the whole
+# race), detail is the item involved, the racer that was passed for an overtake, or the seed for the start of a race,
+# and position is the racer's position when it happened (the finishing position for a finish)
+Event = namedtuple("Event", ["time", "kind", "racer", "detail", "position"])
+
+# The log the race records its events in, or None to record nothing. The race checks it before building a record, so
+# races without a log pay for one comparison per event
+Event_log = None
+
+# The number of events an EventLog keeps in memory. A log with a spill file writes them to it once it has this many
+Event_log_capacity = 100000
+
+
+class EventLog:
+    '''
+    A log of the events of races. The events are kept as plain tuples in the order of the fields of Event, in a
+    deque whose append is called directly by the race, so recording an event is one call into C. Without a spill file,
+    the deque is a ring buffer that keeps the latest events. With a spill file, the events are written to the file a
+    batch at a time as compressed chunks, so a batch of races can record all of its events
+
+    Attributes:
+    capacity (int): The number of events kept in memory
+    spill_path (str): The file the events are written to, or None to keep only the latest events
+    records (deque): The events in memory
+    append (method): Records an event, given as a tuple in the order of the fields of Event
+    spilled (int): The number of events written to the spill file
+
+    Methods:
+    end_second, spill, events, save
+    '''
+
+    def __init__(self, capacity=None, spill_path=None):
+        '''
+        Constructs all the necessary attributes for the EventLog class
+
+        Parameters:
+        capacity (int): The number of events kept in memory. Defaults to Event_log_capacity
+        spill_path (str): The file the events are written to, or None to keep only the latest events. The file is
+                          emptied first
+
+        Returns:
+        None
+        '''
+        self.capacity = capacity if capacity is not None else Event_log_capacity
+        self.spill_path = spill_path
+        self.records = deque(maxlen=self.capacity if spill_path is None else None)
+        self.append = self.records.append
+        self.spilled = 0
+        if spill_path is not None:
+            open(spill_path, "wb").close()
+
+    def end_second(self):
+        '''
+        Writes the events to the spill file once there are enough of them. Called by the race at the end of every
+        second
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        if self.spill_path is not None and len(self.records) >= self.capacity:
+            self.spill()
+
+    def spill(self):
+        '''
+        Writes the events in memory to the spill file as one chunk, and clears them
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        if not self.records:
+            return
+        write_event_chunk(self.spill_path, list(self.records))
+        self.spilled += len(self.records)
+        self.records.clear()
+
+    def events(self):
+        '''
+        Lists the events in memory
+
+        Parameters:
+        None
+
+        Returns:
+        list of Events: the events, oldest first
+        '''
+        return [Event._make(record) for record in self.records]
+
+    def save(self, path):
+        '''
+        Writes the events in memory to a file that read_events can read
+
+        Parameters:
+        path (str): the file
+
+        Returns:
+        None
+        '''
+        open(path, "wb").close()
+        write_event_chunk(path, list(self.records))
+
+
+def write_event_chunk(path, records):
+    '''
+    Adds a chunk of events to the end of an event file. Every chunk is a compressed pickle of the list of events, after
+    its length as 8 bytes
+    Args:
+        path (str): the file
+        records (list of tuples): the events
+
+    Returns:
+        None
+    '''
+    data = zlib.compress(pickle.dumps(records, pickle.HIGHEST_PROTOCOL))
+    with open(path, "ab") as file:
+        file.write(len(data).to_bytes(8, "little"))
+        file.write(data)
+
+
+def read_events(path):
+    '''
+    Reads the events in a file written by an EventLog
+    Args:
+        path (str): the file
+
+    Yields:
+        Event: every event in the file, oldest first
+    '''
+    with open(path, "rb") as file:
+        while True:
+            header = file.read(8)
+            if len(header) < 8:
+                return
+            for record in pickle.loads(zlib.decompress(file.read(int.from_bytes(header, "little")))):
+                yield Event._make(record)
+
+
+def make_unavailable(item, racer):
+    '''
+    Makes an item unavailable to the other racers while a racer holds it or while its effect lasts
+    Args:
+        item (str): the item, one of All_possible_unavailable_items
+        racer (obj): the racer who got the item
+
+    Returns:
+        None
+    '''
+    Unavailable_items.append(item)
+    if Event_log is not None:
+        Event_log.append((Race_duration, "unavailable", racer.name, item, racer.position))
+
+
+def make_available(item):
+    '''
+    Makes an unavailable item available again
+    Args:
+        item (str): the item
+
+    Returns:
+        None
+    '''
+    Unavailable_items.remove(item)
+    if Event_log is not None:
+        Event_log.append((Race_duration, "available", None, item, 0))
+
+
+def start_race(num_racers):
+    '''
+    Picks the racers of a new race at random and puts them on the starting grid like main does, but as new racer
+    objects, so races can be run one after another in the same process. Fields larger than the roster also pick from
+    numbered copies of the characters
+    Args:
+        num_racers (int): the number of racers in the race
+
+    Returns:
+        participants (list): the racers participating in the race
+    '''
+    picked = stream(None, "grid").sample(roster(num_racers), num_racers)
+    seed_block_draws()
+    participants = [Racer(name, weight) for name, weight in picked]
+    for position, racer in enumerate(participants, start=1):
+        racer.position = position
+        racer.distance_from_start = -1 * position
+    return participants
+
+
+def run_races(num_racers, seeds, event_log=None, metrics=False, step=None):
+    '''
+    Simulates one race for every seed and gathers their statistics. Runs in the worker processes of run_batch
+    Args:
+        num_racers (int): the number of racers in each race
+        seeds (range or list of ints): the seed of each race
+        event_log (str): if given, the events of the races are written to the file event_log.<first seed>, which
+                         read_events can read
+        metrics (bool): if True, the races are also counted in a RaceMetrics, kept as the metrics of the statistics
+        step (function): passed on to simulate_race
+
+    Returns:
+        RaceStats: the statistics of the races
+    '''
+    global Race_stats, Event_log, Race_metrics
+    Race_stats = stats = RaceStats()
+    if metrics:
+        Race_metrics = stats.metrics = RaceMetrics()
+    if event_log is not None:
+        Event_log = EventLog(spill_path=f"{event_log}.{seeds[0]}")
+    try:
+        for seed in seeds:
+            reset_race_state()
+            random.seed(seed)
+            if Event_log is not None:
+                Event_log.append((0, "start", None, seed, 0))
+            participants = start_race(num_racers)
+            start_positions = {racer.name: racer.position for racer in participants}
+            order = try_race(participants, num_racers, step=step)
+            if order is None:
+                stats.failed += 1
+                continue
+            stats.add_race(order, start_positions)
+    finally:
+        Race_stats = None
+        if event_log is not None:
+            Event_log.spill()
+            Event_log = None
+        if metrics:
+            Race_metrics.races, Race_metrics.failed = stats.races, stats.failed
+            Race_metrics = None
+    return stats
+
+
+def run_in_batches(task, num_races, stats, seed=0, workers=None, batch_size=None, stop=None, pool=None):
+    '''
+    Runs a task over a range of race seeds in parallel, a batch of seeds at a time. Only a few batches are waiting at
+    any time and each one is merged into the total as soon as the batches before it are, so the memory used does not
+    grow with the number of races
+    Args:
+        task (function): called in a worker process with a range of seeds, and returns statistics that have a merge
+                         method
+        num_races (int): the number of seeds to run, or the most seeds to run if stop is given
+        stats: the empty statistics that the results of the batches are merged into
+        seed (int): the first seed. The seeds that follow are used for the other races, so the same seed always gives
+                    the same statistics however many workers are used
+        workers (int): the number of processes. Defaults to the number of CPUs
+        batch_size (int): the number of seeds each worker runs at a time. Defaults to Race_batch_size
+        stop (function): called with the statistics every time a batch is merged. Once it returns True, no more races
+                         are run. Since the batches are merged in order, the same seed always stops after the same
+                         number of races
+        pool (ProcessPoolExecutor): the processes to run the batches in, so several studies can share them. If None,
+                                    a pool of workers processes is made for this call
+
+    Returns:
+        the statistics of all the races
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if batch_size is None:
+        batch_size = Race_batch_size
+    starts = iter(range(0, num_races, batch_size))
+    pending = {}
+    # Batches that finished before the ones submitted earlier, waiting to be merged in order
+    finished = {}
+    next_start = 0
+    stopped = False
+    own_pool = pool is None
+    if own_pool:
+        pool = race_pool(workers)
+    try:
+        while not stopped:
+            # Keeps two batches per worker submitted, so no worker waits while the results are merged
+            for start in starts:
+                future = pool.submit(task, range(seed + start, seed + min(start + batch_size, num_races)))
+                pending[future] = start
+                if len(pending) >= 2 * workers:
+                    break
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[pending.pop(future)] = future.result()
+            while next_start in finished and not stopped:
+                stats.merge(finished.pop(next_start))
+                next_start += batch_size
+                stopped = stop is not None and stop(stats)
+    finally:
+        for future in pending:
+            future.cancel()
+        if own_pool:
+            pool.shutdown()
+    return stats
+
+
+def run_batch(num_races, num_racers, seed=0, workers=None, batch_size=None, stop=None, cache=None, config=None,
+              event_log=None, metrics=None):
+    '''
+    Simulates many races in parallel and gathers their statistics
+    Args:
+        num_races (int): the number of races to simulate, or the most races to simulate if stop is given
+        num_racers (int): the number of racers in each race
+        seed (int): passed on to run_in_batches
+        workers (int): passed on to run_in_batches
+        batch_size (int): passed on to run_in_batches. Ignored with a cache, which sets the size of the batches
+        stop (function): passed on to run_in_batches
+        cache (ResultCache): if given, races that were already simulated with the same settings and seeds are read
+                             from it, and the other races are added to it
+        config (dict): the configuration of the game, in the format of apply_config, such as a track. None for the
+                       original game
+        event_log (str): if given, the events of every batch of races are written to the file
+                         event_log.<first seed of the batch>. Cannot be used with a cache, since cached races are not
+                         run again
+        metrics (RaceMetrics): if given, the races are counted in it as every batch is merged, so it can be exported
+                               while they run. Cannot be used with a cache
+
+    Returns:
+        RaceStats: the statistics of all the races
+    '''
+    if cache is None:
+        counted = metrics is not None
+        if config is None:
+            task = partial(run_races, num_racers, event_log=event_log, metrics=counted)
+        else:
+            task = partial(run_config_races, config, num_racers, event_log=event_log, metrics=counted)
+        stats = RaceStats()
+        stats.metrics = metrics
+        return run_in_batches(task, num_races, stats, seed=seed, workers=workers, batch_size=batch_size, stop=stop)
+    if event_log is not None or metrics is not None:
+        raise ValueError("An event log and metrics cannot be kept for cached races")
+    return run_cached_batch(cache, config, num_racers, num_races, seed=seed, workers=workers, stop=stop)
+
+
+# Bump this whenever a change to the race logic changes the results of a race, so that cached results of the old
+# logic are not used
+Engine_version = 6
+
+# The weight class of every character
+Racer_weights = {racer.name: racer.weight for racer in all_racers}
+
+
+class RaceRecorder:
+    '''
+    Collects the item pulls and hits of a single race in place of a RaceStats, so they can be stored in the race's
+    compact record
+
+    Attributes:
+    pulls (list): The items pulled, with the position of the racer who pulled them
+    hits (list): The items that hit a racer, with whether they stunned the racer
+
+    Methods:
+    add_item_pull, add_hit
+    '''
+
+    def __init__(self):
+        '''
+        Constructs an empty recorder
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        self.pulls = []
+        self.hits = []
+
+    def add_item_pull(self, position, item):
+        '''
+        Records an item pulled from an item box
+
+        Parameters:
+        position (int): the position of the racer who got the item
+        item (str): the item
+
+        Returns:
+        None
+        '''
+        self.pulls.append((position, item))
+
+    def add_hit(self, item, stun):
+        '''
+        Records a racer being hit by an item
+
+        Parameters:
+        item (str): the item that hit the racer
+        stun (bool): whether the hit stunned the racer
+
+        Returns:
+        None
+        '''
+        self.hits.append((item, stun))
+
+
+def race_records(num_racers, seeds):
+    '''
+    Simulates one race for every seed, in the same way as run_races, and keeps a compact record of each one
+    Args:
+        num_racers (int): the number of racers in each race
+        seeds (range): the seed of each race
+
+    Returns:
+        list of tuples: the record of every race, in the format of RaceStats.add_record
+    '''
+    global Race_stats
+    records = []
+    try:
+        for seed in seeds:
+            Race_stats = recorder = RaceRecorder()
+            reset_race_state()
+            random.seed(seed)
+            participants = start_race(num_racers)
+            start_positions = {racer.name: racer.position for racer in participants}
+            order = try_race(participants, num_racers)
+            if order is None:
+                records.append(((), (), (), tuple(recorder.pulls), tuple(recorder.hits)))
+                continue
+            records.append((tuple(racer.name for racer in order), tuple(racer.finish_time for racer in order),
+                            tuple(start_positions[racer.name] for racer in order), tuple(recorder.pulls),
+                            tuple(recorder.hits)))
+    finally:
+        Race_stats = None
+    return records
+
+
+def simulation_key(num_racers):
+    '''
+    Finds a hash of every setting that the results of a race depend on, as they are set in this process: the version
+    of the race logic, the characters and their weight classes, the number of racers, the item probabilities, the
+    weight class speeds, the item box spacing, the race length, the track, the longest a race can last, how far each
+    item reaches, the items that can be made unavailable, and the purposes that are drawn a block at a time
+    Args:
+        num_racers (int): the number of racers in each race
+
+    Returns:
+        str: the SHA-256 hash of the settings
+    '''
+    settings = {"engine_version": Engine_version, "roster": sorted(Racer_weights.items()), "num_racers": num_racers,
+                "item_table": base_item_table(num_racers), "weight_speeds": Weight_speeds,
+                "item_box_spacing": Item_box_spacing, "finish_line": finish_line, "track": Race_track_definition,
+                "max_race_duration": Max_race_duration, "hit_ranges": Hit_ranges,
+                "unavailable_items": All_possible_unavailable_items, "block_purposes": Block_purposes}
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+
+# The number of seeds stored together in one file of a ResultCache
+Cache_block_size = Race_batch_size
+
+
+class ResultCache:
+    '''
+    A cache of race results on disk. The races of a block of consecutive seeds are stored together in one compressed
+    file, named after the hash of the simulation settings and the first seed, so the same races are never simulated
+    twice and overlapping batches only simulate the blocks they are missing. When the files take more space than
+    allowed, the least recently used ones are deleted
+
+    Attributes:
+    directory (str): The folder the files are kept in
+    max_bytes (int): The most space the files may take
+    block_size (int): The number of seeds in each file
+    written (int): An estimate of the space taken, kept by each process so it does not need to check the folder every
+                   time a file is written. None until it is first needed
+
+    Methods:
+    path, load, store, evict
+    '''
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, block_size=None):
+        '''
+        Constructs all the necessary attributes for the ResultCache class
+
+        Parameters:
+        directory (str): The folder the files are kept in. It is made if it does not exist
+        max_bytes (int): The most space the files may take. Defaults to 512 MB
+        block_size (int): The number of seeds in each file. Defaults to Cache_block_size
+
+        Returns:
+        None
+        '''
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.block_size = block_size if block_size is not None else Cache_block_size
+        self.written = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, block_start):
+        '''
+        Finds the file that holds a block of races
+
+        Parameters:
+        key (str): the hash of the simulation settings, from simulation_key
+        block_start (int): the first seed of the block
+
+        Returns:
+        str: the path of the file
+        '''
+        name = hashlib.sha256(f"{key}:{block_start}:{self.block_size}".encode()).hexdigest()
+        return os.path.join(self.directory, name + ".races")
+
+    def load(self, key, block_start):
+        '''
+        Reads a block of races, and marks its file as recently used
+
+        Parameters:
+        key (str): the hash of the simulation settings, from simulation_key
+        block_start (int): the first seed of the block
+
+        Returns:
+        list of tuples: the record of every race in the block, or None if the block is not in the cache
+        '''
+        path = self.path(key, block_start)
+        try:
+            with open(path, "rb") as file:
+                records = pickle.loads(zlib.decompress(file.read()))
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        # A file that cannot be read is simulated again and replaced
+        except (zlib.error, pickle.UnpicklingError, EOFError):
+            return None
+        return records
+
+    def store(self, key, block_start, records):
+        '''
+        Writes a block of races. The file is written under a temporary name and then renamed, so other processes never
+        read a file that is only partly written
+
+        Parameters:
+        key (str): the hash of the simulation settings, from simulation_key
+        block_start (int): the first seed of the block
+        records (list of tuples): the record of every race in the block
+
+        Returns:
+        None
+        '''
+        path = self.path(key, block_start)
+        data = zlib.compress(pickle.dumps(records, pickle.HIGHEST_PROTOCOL))
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, path)
+        if self.written is None:
+            self.written = self.evict()
+        else:
+            self.written += len(data)
+            if self.written > self.max_bytes:
+                self.written = self.evict()
+
+    def evict(self):
+        '''
+        Deletes the least recently used files until the files take no more space than allowed
+
+        Parameters:
+        None
+
+        Returns:
+        int: the space the remaining files take, in bytes
+        '''
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".races"):
+                try:
+                    status = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((status.st_mtime, status.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            # Another process may have deleted the file already
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+def run_cached_races(cache, config, num_racers, wanted, seeds):
+    '''
+    Gathers the statistics of the races of a range of seeds, reading every block of races from the cache if it is
+    there and simulating and storing it otherwise. Runs in the worker processes of run_cached_batch
+    Args:
+        cache (ResultCache): the cache
+        config (dict): the configuration of the game, in the format of apply_config. None for the original game
+        num_racers (int): the number of racers in each race
+        wanted (range): the seeds that were asked for. Blocks at the edges of the range are simulated completely but
+                        only the seeds that were asked for are counted
+        seeds (range): the seeds of this batch, which start at the start of a block
+
+    Returns:
+        RaceStats: the statistics of the races
+    '''
+    apply_config(config)
+    try:
+        key = simulation_key(num_racers)
+        stats = RaceStats()
+        for block_start in range(seeds.start, seeds.stop, cache.block_size):
+            block = range(block_start, block_start + cache.block_size)
+            records = cache.load(key, block_start)
+            if records is None:
+                records = race_records(num_racers, block)
+                cache.store(key, block_start, records)
+            for seed, record in zip(block, records):
+                if seed in wanted and seed in seeds:
+                    stats.add_record(record)
+        return stats
+    finally:
+        apply_config(None)
+
+
+def run_cached_batch(cache, config, num_racers, num_races, seed=0, workers=None, stop=None, pool=None):
+    '''
+    Gathers the statistics of many races through a cache. The batches are whole blocks of the cache, so every block is
+    simulated by a single worker at most
+    Args:
+        cache (ResultCache): the cache
+        config (dict): the configuration of the game, in the format of apply_config. None for the original game
+        num_racers (int): the number of racers in each race
+        num_races (int): the number of races, or the most races if stop is given
+        seed (int): the seed of the first race
+        workers (int): passed on to run_in_batches
+        stop (function): passed on to run_in_batches
+        pool (ProcessPoolExecutor): passed on to run_in_batches
+
+    Returns:
+        RaceStats: the statistics of the races
+    '''
+    first_block = seed - seed % cache.block_size
+    task = partial(run_cached_races, cache, config, num_racers, range(seed, seed + num_races))
+    stats = run_in_batches(task, seed + num_races - first_block, RaceStats(), seed=first_block, workers=workers,
+                           batch_size=cache.block_size, stop=stop, pool=pool)
+    cache.evict()
+    return stats
+
+
+def write_atomically(path, data):
+    '''
+    Writes a file under a temporary name and then renames it, so no process, on this machine or another one sharing
+    the folder, reads a file that is only partly written
+    Args:
+        path (str): the file
+        data (bytes): what to write
+
+    Returns:
+        None
+    '''
+    temporary_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+
+
+# The number of seeds in each shard of a ShardQueue
+Shard_size = 1000
+
+# How long (in seconds) a claimed shard can go without its worker checking in before other workers take it over
+Shard_stale_after = 300
+
+# How long (in seconds) a worker waits before checking again for shards that other workers have claimed
+Shard_poll_interval = 5
+
+
+class ShardQueueError(Exception):
+    '''
+    Raised when a ShardQueue cannot be used for a study, such as when its folder already holds one or a worker's
+    settings do not match the settings the study was created with
+    '''
+
+
+class ShardQueue:
+    '''
+    A queue of batches of races kept as files in a folder, so machines that share the folder (over NFS, for example)
+    can simulate one study together without any other service. The seeds of the study are split into shards, which
+    start as files in the pending folder. A worker claims a shard by renaming its file into the claimed folder, which
+    only one worker can do, and keeps the claim fresh while it runs the races. The statistics of every shard are
+    written to the results folder, and claims whose worker stopped checking in are put back in the pending folder
+
+    Attributes:
+    directory (str): The folder of the queue
+    pending (str): The folder of the shards that are waiting for a worker
+    claimed (str): The folder of the shards that a worker is running
+    results (str): The folder of the statistics of the shards that are done
+
+    Methods:
+    create, job, claim, heartbeat, finish, release, reclaim_stale, counts, result_path, load_results
+    '''
+
+    def __init__(self, directory):
+        '''
+        Constructs all the necessary attributes for the ShardQueue class
+
+        Parameters:
+        directory (str): The folder of the queue
+
+        Returns:
+        None
+        '''
+        self.directory = directory
+        self.pending = os.path.join(directory, "pending")
+        self.claimed = os.path.join(directory, "claimed")
+        self.results = os.path.join(directory, "results")
+
+    def create(self, num_races, num_racers, seed=0, shard_size=None, config=None):
+        '''
+        Splits a study into shards and writes them to the queue
+
+        Parameters:
+        num_races (int): the number of races
+        num_racers (int): the number of racers in each race
+        seed (int): the seed of the first race
+        shard_size (int): the number of seeds in each shard. Defaults to Shard_size
+        config (dict): the configuration of the game, in the format of apply_config. None for the original game
+
+        Returns:
+        int: the number of shards
+        '''
+        if shard_size is None:
+            shard_size = Shard_size
+        if os.path.exists(os.path.join(self.directory, "job.json")):
+            raise ShardQueueError(f"{self.directory} already holds a study")
+        for folder in (self.pending, self.claimed, self.results):
+            os.makedirs(folder, exist_ok=True)
+        apply_config(config)
+        try:
+            key = simulation_key(num_racers)
+        finally:
+            apply_config(None)
+        job = {"num_races": num_races, "num_racers": num_racers, "seed": seed, "shard_size": shard_size,
+               "config": config, "key": key}
+        write_atomically(os.path.join(self.directory, "job.json"), json.dumps(job, indent=2).encode())
+        starts = range(seed, seed + num_races, shard_size)
+        for start in starts:
+            write_atomically(os.path.join(self.pending, f"{start:012d}.shard"), b"")
+        return len(starts)
+
+    def job(self):
+        '''
+        Reads the settings of the study in the queue
+
+        Parameters:
+        None
+
+        Returns:
+        dict: the number of races, the number of racers, the first seed, the shard size, the configuration of the
+              game, and the hash of the simulation settings from simulation_key
+        '''
+        with open(os.path.join(self.directory, "job.json")) as file:
+            return json.load(file)
+
+    def claim(self, worker):
+        '''
+        Claims a pending shard
+
+        Parameters:
+        worker (str): the name of the worker claiming it, which has to be different for every worker
+
+        Returns:
+        tuple: the first seed of the shard and the path of the claim, or None if no shard is pending
+        '''
+        for name in sorted(os.listdir(self.pending)):
+            # Skips the files that are still being written
+            if not name.endswith(".shard"):
+                continue
+            start = int(name.split(".")[0])
+            path = os.path.join(self.claimed, f"{name}.{worker}")
+            # Only one of the workers renaming the same file succeeds
+            try:
+                os.rename(os.path.join(self.pending, name), path)
+            except FileNotFoundError:
+                continue
+            # A shard that was put back after its results were written is already done
+            if os.path.exists(self.result_path(start)):
+                os.remove(path)
+                continue
+            return start, path
+        return None
+
+    def heartbeat(self, path):
+        '''
+        Shows that the worker holding a claim is still running it
+
+        Parameters:
+        path (str): the path of the claim, from claim
+
+        Returns:
+        bool: False if the claim was taken over by another worker, which runs the shard again from the start
+        '''
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def finish(self, start, path, stats):
+        '''
+        Writes the statistics of a shard and releases its claim
+
+        Parameters:
+        start (int): the first seed of the shard
+        path (str): the path of the claim, from claim
+        stats (RaceStats): the statistics of the races of the shard
+
+        Returns:
+        None
+        '''
+        # The races of a shard are the same whoever runs them, so a shard run twice writes the same results
+        write_atomically(self.result_path(start), zlib.compress(pickle.dumps(stats, pickle.HIGHEST_PROTOCOL)))
+        # The claim is gone if another worker took the shard over, and that worker writes the same results
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def release(self, path):
+        '''
+        Puts a claimed shard back in the pending folder without running it, so another worker can claim it
+
+        Parameters:
+        path (str): the path of the claim, from claim
+
+        Returns:
+        None
+        '''
+        os.rename(path, os.path.join(self.pending, os.path.basename(path).split(".")[0] + ".shard"))
+
+    def reclaim_stale(self, stale_after=None):
+        '''
+        Puts the claimed shards whose worker has not checked in for a while back in the pending folder, so a worker
+        that crashed does not hold on to its shards
+
+        Parameters:
+        stale_after (float): how long a claim can go without a heartbeat, in seconds. Defaults to Shard_stale_after
+
+        Returns:
+        int: the number of shards put back
+        '''
+        if stale_after is None:
+            stale_after = Shard_stale_after
+        reclaimed = 0
+        now = time.time()
+        for entry in os.scandir(self.claimed):
+            try:
+                stale = entry.stat().st_mtime < now - stale_after
+                if stale:
+                    self.release(entry.path)
+                    reclaimed += 1
+            # The worker finished the shard, or another worker put it back first
+            except FileNotFoundError:
+                continue
+        return reclaimed
+
+    def counts(self):
+        '''
+        Counts the shards in each state
+
+        Parameters:
+        None
+
+        Returns:
+        dict: the number of "pending", "claimed", and "done" shards
+        '''
+        return {"pending": len([name for name in os.listdir(self.pending) if name.endswith(".shard")]),
+                "claimed": len(os.listdir(self.claimed)),
+                "done": len([name for name in os.listdir(self.results) if name.endswith(".stats")])}
+
+    def result_path(self, start):
+        '''
+        Finds the file that holds the statistics of a shard
+
+        Parameters:
+        start (int): the first seed of the shard
+
+        Returns:
+        str: the path of the file
+        '''
+        return os.path.join(self.results, f"{start:012d}.stats")
+
+    def load_results(self):
+        '''
+        Reads the statistics of every shard that is done
+
+        Parameters:
+        None
+
+        Returns:
+        dict: the RaceStats of every shard that is done, keyed by its first seed
+        '''
+        results = {}
+        for name in os.listdir(self.results):
+            if name.endswith(".stats"):
+                with open(os.path.join(self.results, name), "rb") as file:
+                    results[int(name.split(".")[0])] = pickle.loads(zlib.decompress(file.read()))
+        return results
+
+
+def run_shard(shard_queue, job, start, path, metrics=None):
+    '''
+    Simulates the races of a claimed shard, a batch at a time, checking in with the queue after every batch. A worker
+    whose settings do not match the study puts the shard back and raises a ShardQueueError
+    Args:
+        shard_queue (ShardQueue): the queue
+        job (dict): the settings of the study, from ShardQueue.job
+        start (int): the first seed of the shard
+        path (str): the path of the claim
+        metrics (RaceMetrics): if given, the races are counted in it after every batch. They are not saved with the
+                               statistics of the shard
+
+    Returns:
+        RaceStats: the statistics of the races, or None if another worker took over the shard
+    '''
+    stop = min(start + job["shard_size"], job["seed"] + job["num_races"])
+    apply_config(job["config"])
+    try:
+        # A worker with a different version of the race logic or different settings would give different results
+        if simulation_key(job["num_racers"]) != job["key"]:
+            shard_queue.release(path)
+            raise ShardQueueError("The settings of this worker do not match the settings the study was created with")
+        stats = RaceStats()
+        for batch_start in range(start, stop, Race_batch_size):
+            batch = run_races(job["num_racers"], range(batch_start, min(batch_start + Race_batch_size, stop)),
+                              metrics=metrics is not None)
+            if metrics is not None:
+                metrics.merge(batch.metrics)
+                batch.metrics = None
+            stats.merge(batch)
+            if not shard_queue.heartbeat(path):
+                return None
+        return stats
+    finally:
+        apply_config(None)
+
+
+def work_shards(directory, stale_after=None, poll_interval=None, metrics_path=None, metrics_port=None):
+    '''
+    Claims and runs the shards of a queue until every shard is done. While other workers hold the last shards, the
+    worker waits, and takes over the shards of workers that stopped checking in
+    Args:
+        directory (str): the folder of the queue
+        stale_after (float): passed on to ShardQueue.reclaim_stale
+        poll_interval (float): how long to wait between checks for shards, in seconds. Defaults to
+                               Shard_poll_interval
+        metrics_path (str): if given, the metrics of this worker, with the depth of the queue, are written to this
+                            file every Metrics_interval seconds
+        metrics_port (int): if given, the metrics of this worker are served on this local port
+
+    Returns:
+        int: the number of shards this worker ran
+    '''
+    if poll_interval is None:
+        poll_interval = Shard_poll_interval
+    shard_queue = ShardQueue(directory)
+    job = shard_queue.job()
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    ran = 0
+    metrics = exporter = None
+    if metrics_path is not None or metrics_port is not None:
+        metrics = RaceMetrics()
+        exporter = MetricsExporter(metrics, metrics_path, metrics_port, shard_queue=shard_queue).start()
+    try:
+        while True:
+            claimed = shard_queue.claim(worker)
+            if claimed is None:
+                if shard_queue.reclaim_stale(stale_after):
+                    continue
+                if not shard_queue.counts()["claimed"]:
+                    return ran
+                time.sleep(poll_interval)
+                continue
+            start, path = claimed
+            stats = run_shard(shard_queue, job, start, path, metrics=metrics)
+            if stats is not None:
+                shard_queue.finish(start, path, stats)
+                ran += 1
+    finally:
+        if exporter is not None:
+            exporter.stop()
+
+
+def run_shard_workers(directory, workers=None, stale_after=None, metrics_path=None, metrics_port=None):
+    '''
+    Runs several workers of a queue on this machine, each in its own process
+    Args:
+        directory (str): the folder of the queue
+        workers (int): the number of workers. Defaults to the number of CPUs
+        stale_after (float): passed on to ShardQueue.reclaim_stale
+        metrics_path (str): if given, every worker writes its metrics to this file, followed by .<worker number> when
+                            there is more than one worker
+        metrics_port (int): if given, every worker serves its metrics on this local port plus its worker number
+
+    Returns:
+        int: the number of shards the workers ran
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        return work_shards(directory, stale_after, metrics_path=metrics_path, metrics_port=metrics_port)
+    with race_pool(workers) as pool:
+        futures = [pool.submit(work_shards, directory, stale_after,
+                               metrics_path=f"{metrics_path}.{number}" if metrics_path is not None else None,
+                               metrics_port=metrics_port + number if metrics_port is not None else None)
+                   for number in range(workers)]
+        return sum(future.result() for future in futures)
+
+
+def merge_shards(directory):
+    '''
+    Combines the statistics of the shards of a queue, in the order of their seeds
+    Args:
+        directory (str): the folder of the queue
+
+    Returns:
+        stats (RaceStats): the statistics of the shards that are done
+        missing (int): the number of shards that are not done yet
+    '''
+    shard_queue = ShardQueue(directory)
+    job = shard_queue.job()
+    results = shard_queue.load_results()
+    stats = RaceStats()
+    missing = 0
+    for start in range(job["seed"], job["seed"] + job["num_races"], job["shard_size"]):
+        if start in results:
+            stats.merge(results[start])
+        else:
+            missing += 1
+    return stats, missing
+
+
+# The phases of a second of the race that RaceMetrics times: moving the racers, updating and indexing their positions,
+# picking up items, using items, and recording the second in the race's dataframes
+Tick_phases = ("movement", "ranking", "pickup", "use_item", "recording")
+
+# The upper bounds of the buckets of the tick phase histograms, in seconds
+Tick_phase_buckets = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 1e-2, 0.1)
+
+# One in every this many seconds of the races is timed phase by phase. Reading the clock for every racer costs a large
+# share of a second of the race, so timing only some of them keeps the histograms accurate without slowing the races
+Metrics_tick_sample = 10
+
+# How often a MetricsExporter rewrites its file, in seconds
+Metrics_interval = 10
+
+# The metrics the races in this process are counted in, or None to count nothing
+Race_metrics = None
+
+
+class RaceMetrics:
+    '''
+    Counters of how fast races are simulated, for spotting slow workers and slowdowns without a profiler. Metrics
+    counted by different processes can be merged into one, and written in the OpenMetrics text format
+
+    Attributes:
+    races (int): The number of races simulated
+    failed (int): The number of races that were abandoned because the item logic raised an error
+    ticks (int): The number of seconds of the races simulated
+    phase_buckets (dict): For every phase in Tick_phases, how many timed seconds of the races spent a time in each
+                          bucket of Tick_phase_buckets on it, with one last bucket for longer times
+    phase_seconds (dict): For every phase, the total time the timed seconds spent on it
+    timed_ticks (int): The number of seconds of the races that were timed phase by phase
+    queue_depth (dict): The number of "pending", "claimed", and "done" shards of the ShardQueue the races come from,
+                        if any
+
+    Methods:
+    start_tick, add_tick, merge, openmetrics
+    '''
+
+    def __init__(self):
+        '''
+        Constructs an empty set of metrics
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        self.races = 0
+        self.failed = 0
+        self.ticks = 0
+        self.phase_buckets = {phase: [0] * (len(Tick_phase_buckets) + 1) for phase in Tick_phases}
+        self.phase_seconds = {phase: 0.0 for phase in Tick_phases}
+        self.timed_ticks = 0
+        self.queue_depth = {}
+
+    def start_tick(self):
+        '''
+        Counts a second of a race as it starts
+
+        Parameters:
+        None
+
+        Returns:
+        bool: True if the second should be timed phase by phase
+        '''
+        self.ticks += 1
+        return self.ticks % Metrics_tick_sample == 0
+
+    def add_tick(self, times):
+        '''
+        Adds the phase times of a timed second of a race to the histograms
+
+        Parameters:
+        times (tuple of floats): the seconds spent on every phase, in the order of Tick_phases
+
+        Returns:
+        None
+        '''
+        self.timed_ticks += 1
+        for phase, seconds in zip(Tick_phases, times):
+            self.phase_buckets[phase][bisect.bisect_left(Tick_phase_buckets, seconds)] += 1
+            self.phase_seconds[phase] += seconds
+
+    def merge(self, other):
+        '''
+        Adds the metrics of other races, such as the ones simulated by another process
+
+        Parameters:
+        other (RaceMetrics): the metrics to add
+
+        Returns:
+        RaceMetrics: these metrics, so merges can be chained
+        '''
+        self.races += other.races
+        self.failed += other.failed
+        self.ticks += other.ticks
+        self.timed_ticks += other.timed_ticks
+        for phase in Tick_phases:
+            self.phase_buckets[phase] = [a + b for a, b in zip(self.phase_buckets[phase], other.phase_buckets[phase])]
+            self.phase_seconds[phase] += other.phase_seconds[phase]
+        return self
+
+    def openmetrics(self, races_per_second=None, ticks_per_second=None):
+        '''
+        Writes the metrics in the OpenMetrics text format
+
+        Parameters:
+        races_per_second (float): the current rate of races, if known
+        ticks_per_second (float): the current rate of seconds of the races, if known
+
+        Returns:
+        str: the metrics, ending with "# EOF"
+        '''
+        lines = ["# TYPE mkw_races counter", "# HELP mkw_races Races simulated.", f"mkw_races_total {self.races}",
+                 "# TYPE mkw_failed_races counter",
+                 "# HELP mkw_failed_races Races abandoned because the item logic raised an error.",
+                 f"mkw_failed_races_total {self.failed}",
+                 "# TYPE mkw_ticks counter", "# HELP mkw_ticks Seconds of the races simulated.",
+                 f"mkw_ticks_total {self.ticks}"]
+        for name, rate, help_text in (("races_per_second", races_per_second, "Races simulated per second."),
+                                      ("ticks_per_second", ticks_per_second,
+                                       "Seconds of the races simulated per second.")):
+            if rate is not None:
+                lines += [f"# TYPE mkw_{name} gauge", f"# HELP mkw_{name} {help_text}", f"mkw_{name} {rate:.6g}"]
+        lines += ["# TYPE mkw_tick_phase_seconds histogram",
+                  "# HELP mkw_tick_phase_seconds Time a second of a race spends on each phase, for one in every "
+                  f"{Metrics_tick_sample} seconds."]
+        for phase in Tick_phases:
+            cumulative = list(itertools.accumulate(self.phase_buckets[phase]))
+            for bound, count in zip(Tick_phase_buckets, cumulative):
+                lines.append(f'mkw_tick_phase_seconds_bucket{{phase="{phase}",le="{bound:g}"}} {count}')
+            lines += [f'mkw_tick_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {cumulative[-1]}',
+                      f'mkw_tick_phase_seconds_count{{phase="{phase}"}} {cumulative[-1]}',
+                      f'mkw_tick_phase_seconds_sum{{phase="{phase}"}} {self.phase_seconds[phase]:.9g}']
+        if self.queue_depth:
+            lines += ["# TYPE mkw_shard_queue_depth gauge",
+                      "# HELP mkw_shard_queue_depth Shards of the shared queue in each state."]
+            lines += [f'mkw_shard_queue_depth{{state="{state}"}} {count}' for state, count in self.queue_depth.items()]
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    '''
+    Exports a RaceMetrics while races are being simulated, by rewriting a file in the OpenMetrics text format every
+    few seconds from a background thread, and optionally by serving it over HTTP on this machine
+
+    Attributes:
+    metrics (RaceMetrics): The metrics being exported
+    path (str): The file the metrics are written to, or None
+    port (int): The local port the metrics are served on, or None
+    interval (float): How often the file is rewritten, in seconds
+    shard_queue (ShardQueue): The queue whose depth is exported, or None
+
+    Methods:
+    start, stop, render, write
+    '''
+
+    def __init__(self, metrics, path=None, port=None, interval=None, shard_queue=None):
+        '''
+        Constructs all the necessary attributes for the MetricsExporter class
+
+        Parameters:
+        metrics (RaceMetrics): the metrics to export
+        path (str): the file to write the metrics to, or None
+        port (int): the local port to serve the metrics on, or None
+        interval (float): how often the file is rewritten, in seconds. Defaults to Metrics_interval
+        shard_queue (ShardQueue): the queue whose depth is exported, or None
+
+        Returns:
+        None
+        '''
+        self.metrics = metrics
+        self.path = path
+        self.port = port
+        self.interval = interval if interval is not None else Metrics_interval
+        self.shard_queue = shard_queue
+        self._stopped = threading.Event()
+        self._thread = None
+        self._server = None
+        self._first = self._last = (time.perf_counter(), 0, 0)
+        self._rates = (None, None)
+
+    def start(self):
+        '''
+        Starts writing and serving the metrics
+
+        Parameters:
+        None
+
+        Returns:
+        MetricsExporter: this exporter
+        '''
+        self._first = self._last = (time.perf_counter(), self.metrics.races + self.metrics.failed, self.metrics.ticks)
+        if self.port is not None:
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    body = exporter.render().encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/openmetrics-text; version=1.0.0; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, format, *args):
+                    pass
+
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        '''
+        Rewrites the file every interval until the exporter is stopped
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        while not self._stopped.wait(self.interval):
+            self.write()
+
+    def render(self, final=False):
+        '''
+        Writes the metrics in the OpenMetrics text format, with the rates since the last time they were rendered and
+        the current depth of the queue
+
+        Parameters:
+        final (bool): if True, the rates are the ones over the whole time the exporter ran, for the last time the
+                      metrics are written
+
+        Returns:
+        str: the metrics
+        '''
+        now = time.perf_counter()
+        last_time, last_races, last_ticks = self._first if final else self._last
+        races, ticks = self.metrics.races + self.metrics.failed, self.metrics.ticks
+        # A render right after the last one, such as an HTTP request, keeps the rates of the last interval
+        if now > last_time and (final or now - last_time >= 1):
+            self._rates = ((races - last_races) / (now - last_time), (ticks - last_ticks) / (now - last_time))
+            self._last = (now, races, ticks)
+        if self.shard_queue is not None:
+            self.metrics.queue_depth = self.shard_queue.counts()
+        return self.metrics.openmetrics(*self._rates)
+
+    def write(self, final=False):
+        '''
+        Rewrites the metrics file, if there is one
+
+        Parameters:
+        final (bool): passed on to render
+
+        Returns:
+        None
+        '''
+        if self.path is not None:
+            write_atomically(self.path, self.render(final).encode())
+
+    def stop(self):
+        '''
+        Stops the background thread and the server, and writes the metrics file one last time, with the rates over
+        the whole run
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        self.write(final=True)
+
+
+# The most races simulated when a study runs until its statistics are precise enough
+Max_converging_races = 1000000
+
+
+def precision_reached(stats, win_rate_precision, finish_time_precision=None, z=1.96, min_races=1000):
+    '''
+    Checks if the statistics of a batch of races are precise enough to stop simulating
+    Args:
+        stats (RaceStats): the statistics so far
+        win_rate_precision (float): the largest half-width allowed for the confidence interval of every character's
+                                    win rate, such as 0.005 for plus or minus half a percentage point
+        finish_time_precision (float): if given, the largest half-width allowed for the confidence interval of every
+                                       character's mean finishing time, in seconds
+        z (float): the normal quantile of the confidence level. 1.96 gives 95% intervals
+        min_races (int): the fewest races to simulate before checking, so a character who has barely raced cannot
+                         look precise by chance
+
+    Returns:
+        bool: True if every tracked statistic is precise enough
+    '''
+    if stats.races < min_races:
+        return False
+    for name, counts in stats.positions.items():
+        low, high = wilson_interval(counts[0], sum(counts), z)
+        if (high - low) / 2 > win_rate_precision:
+            return False
+        if finish_time_precision is not None:
+            variance = stats.finish_time_variance(name)
+            if variance is None or z * math.sqrt(variance / stats.finish_times[name][0]) > finish_time_precision:
+                return False
+    return True
+
+
+def run_until_converged(num_racers, win_rate_precision=0.005, finish_time_precision=None, max_races=None, seed=0,
+                        workers=None, z=1.96, cache=None, config=None):
+    '''
+    Simulates races until every character's win rate, and optionally their mean finishing time, is known to the given
+    precision, instead of simulating a fixed number of races
+    Args:
+        num_racers (int): the number of racers in each race
+        win_rate_precision (float): passed on to precision_reached
+        finish_time_precision (float): passed on to precision_reached
+        max_races (int): the most races to simulate if the statistics never become precise enough. Defaults to
+                         Max_converging_races
+        seed (int): passed on to run_batch
+        workers (int): passed on to run_batch
+        z (float): passed on to precision_reached
+        cache (ResultCache): passed on to run_batch
+        config (dict): passed on to run_batch
+
+    Returns:
+        stats (RaceStats): the statistics of all the races, whose races attribute is how many races it took
+        converged (bool): whether the precision was reached before max_races
+    '''
+    if max_races is None:
+        max_races = Max_converging_races
 
-    def update_position_movie(frame):
+    def stop(stats):
         """
-        Creates the position leaderboard for each iteration of the race
+        Stops the batch once the statistics are precise enough
         Args:
-            frame (int): the current race duration
+            stats (RaceStats): the statistics so far
 
         Returns:
-            None
+            bool: True if every tracked statistic is precise enough
         """
-        ax.clear()
-        ax.axis('off')
+        return precision_reached(stats, win_rate_precision, finish_time_precision, z)
+
+    stats = run_batch(max_races, num_racers, seed=seed, workers=workers, stop=stop, cache=cache, config=config)
+    return stats, precision_reached(stats, win_rate_precision, finish_time_precision, z)
+
+
+class PairedStats:
+    '''
+    Statistics of a paired comparison between two configurations of the game. Both configurations race with the same
+    seeds and the same random numbers for every racer and purpose, so the difference between their results comes from
+    the configurations and not from luck
+
+    Attributes:
+    races (int): The number of paired samples counted. With antithetic variates, each sample is the average of a race
+                 and its mirror image
+    failed (int): The number of samples that were left out because the item logic raised an error in one of the races
+    results (dict): For every racer name and metric ("win" or "position"), the running count, mean, and sum of squared
+                    differences of the result with configuration A, with configuration B, and of the difference B - A
+
+    Methods:
+    add_pair, merge, summary
+    '''
+
+    def __init__(self):
+        '''
+        Constructs an empty set of statistics
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        self.races = 0
+        self.failed = 0
+        self.results = {}
+
+    def add_pair(self, orders_a, orders_b):
+        '''
+        Counts the races of one seed
+
+        Parameters:
+        orders_a (list): the finishing orders of the races with configuration A, one race or a race and its mirror
+                         image
+        orders_b (list): the finishing orders of the races with configuration B, with the same random numbers
+
+        Returns:
+        None
+        '''
+        self.races += 1
+        outcomes_a = {}
+        outcomes_b = {}
+        for orders, outcomes in ((orders_a, outcomes_a), (orders_b, outcomes_b)):
+            for order in orders:
+                for place, racer in enumerate(order, start=1):
+                    win, position = outcomes.get(racer.name, (0.0, 0.0))
+                    outcomes[racer.name] = (win + (place == 1) / len(orders), position + place / len(orders))
+        for name, (win_a, position_a) in outcomes_a.items():
+            win_b, position_b = outcomes_b[name]
+            for metric, a, b in (("win", win_a, win_b), ("position", position_a, position_b)):
+                result = self.results.setdefault((name, metric), {"a": [0, 0.0, 0.0], "b": [0, 0.0, 0.0],
+                                                                  "difference": [0, 0.0, 0.0]})
+                welford_update(result["a"], a)
+                welford_update(result["b"], b)
+                welford_update(result["difference"], b - a)
+
+    def merge(self, other):
+        '''
+        Adds the statistics of other seeds, such as the ones run by another process
+
+        Parameters:
+        other (PairedStats): the statistics to add
+
+        Returns:
+        PairedStats: these statistics, so merges can be chained
+        '''
+        self.races += other.races
+        self.failed += other.failed
+        for key, theirs in other.results.items():
+            mine = self.results.setdefault(key, {"a": [0, 0.0, 0.0], "b": [0, 0.0, 0.0], "difference": [0, 0.0, 0.0]})
+            for part in mine:
+                mine[part] = welford_combine(mine[part], theirs[part])
+        return self
+
+    def summary(self, z=1.96):
+        '''
+        Summarizes the paired difference of every racer's win rate and mean finishing position
+
+        Parameters:
+        z (float): the normal quantile of the confidence level. 1.96 gives 95% intervals
+
+        Returns:
+        DataFrame: for every racer and metric, the number of samples, the mean with A and with B, the mean difference
+                   B - A with its variance and confidence interval, and the variance reduction, which is how many
+                   times more samples two independent runs would need for the same precision
+        '''
+        rows = []
+        for (name, metric), result in sorted(self.results.items()):
+            n, difference, m2_difference = result["difference"]
+            variance = m2_difference / (n - 1) / n if n > 1 else None
+            independent = (result["a"][2] + result["b"][2]) / (n - 1) / n if n > 1 else None
+            half_width = z * math.sqrt(variance) if variance is not None else None
+            rows.append({"Racer": name, "Metric": metric, "Samples": n, "Mean A": result["a"][1],
+                         "Mean B": result["b"][1], "Difference": difference, "Variance": variance,
+                         "CI Low": difference - half_width if half_width is not None else None,
+                         "CI High": difference + half_width if half_width is not None else None,
+                         "Variance Reduction": independent / variance if variance else None})
+        return pd.DataFrame(rows).set_index(["Racer", "Metric"])
+
+
+def run_paired_races(config_a, config_b, num_racers, antithetic, seeds):
+    '''
+    Races both configurations with the same random numbers for every seed. Runs in the worker processes of
+    compare_configs
+    Args:
+        config_a (dict): the first configuration, in the format of apply_config
+        config_b (dict): the second configuration
+        num_racers (int): the number of racers in each race
+        antithetic (bool): if True, every seed is also raced with the mirror image of its random numbers, and each
+                           sample is the average of the two
+        seeds (range): the seeds to race
+
+    Returns:
+        PairedStats: the statistics of the comparison
+    '''
+    global Race_streams
+    stats = PairedStats()
+    try:
+        for seed in seeds:
+            orders = {"a": [], "b": []}
+            for mirrored in ((False, True) if antithetic else (False,)):
+                for variant, config in (("a", config_a), ("b", config_b)):
+                    apply_config(config)
+                    Race_streams = RandomStreams(seed, antithetic=mirrored)
+                    participants = start_race(num_racers)
+                    order = try_race(participants, num_racers)
+                    if order is not None:
+                        orders[variant].append(order)
+            if len(orders["a"]) != len(orders["b"]) or len(orders["a"]) != (2 if antithetic else 1):
+                stats.failed += 1
+                continue
+            stats.add_pair(orders["a"], orders["b"])
+    finally:
+        Race_streams = None
+        apply_config(None)
+    return stats
+
+
+def compare_configs(config_a, config_b, num_racers, num_races, seed=0, workers=None, antithetic=False):
+    '''
+    Compares two configurations of the game, such as two versions of an item probability list or of the weight class
+    speeds, with common random numbers. Every seed is raced with both configurations using the same random numbers for
+    every racer and purpose, so the paired difference is much less noisy than the difference between two independent
+    batches of races
+    Args:
+        config_a (dict): the first configuration, in the format of apply_config
+        config_b (dict): the second configuration
+        num_racers (int): the number of racers in each race
+        num_races (int): the number of seeds to race. Each seed takes two races, or four with antithetic variates
+        seed (int): passed on to run_in_batches
+        workers (int): passed on to run_in_batches
+        antithetic (bool): passed on to run_paired_races
+
+    Returns:
+        PairedStats: the statistics of the comparison
+    '''
+    task = partial(run_paired_races, config_a, config_b, num_racers, antithetic)
+    return run_in_batches(task, num_races, PairedStats(), seed=seed, workers=workers)
+
+
+def load_config(path):
+    '''
+    Reads a configuration of the game from a JSON file
+    Args:
+        path (str): the file, which holds an object in the format of apply_config, such as
+                    {"weight_speeds": {"Light": 24}, "item_tables": {"12": [["mushroom", {"1": 0, "2": 5}], ...]}}
+
+    Returns:
+        dict: the configuration
+    '''
+    with open(path) as file:
+        return json.load(file)
+
+
+def run_config_races(config, num_racers, seeds, event_log=None, metrics=False):
+    '''
+    Simulates one race for every seed with a configuration of the game. Runs in the worker processes of run_sweep
+    Args:
+        config (dict): the configuration, in the format of apply_config
+        num_racers (int): the number of racers in each race
+        seeds (range): the seed of each race
+        event_log (str): passed on to run_races
+        metrics (bool): passed on to run_races
+
+    Returns:
+        RaceStats: the statistics of the races
+    '''
+    apply_config(config)
+    try:
+        return run_races(num_racers, seeds, event_log=event_log, metrics=metrics)
+    finally:
+        apply_config(None)
+
+
+def config_hash(config):
+    '''
+    Finds a short name for a configuration that only depends on its settings
+    Args:
+        config (dict): the configuration, in the format of apply_config
+
+    Returns:
+        str: the first 12 hexadecimal digits of the SHA-256 hash of the configuration as sorted JSON
+    '''
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def sweep_points(spec):
+    '''
+    Lists the settings of every configuration in a parameter sweep. The parameters are "finish_line",
+    "item_box_spacing", and "item:NAME", which multiplies the chance of getting the item NAME in every position and
+    every probability list
+    Args:
+        spec (dict): either {"grid": {parameter: [values]}}, which tries every combination of the values, or
+                     {"random": {"samples": N, "seed": S, "ranges": {parameter: [low, high]}}}, which draws N
+                     configurations with every parameter uniformly between low and high (whole numbers if both bounds
+                     are whole numbers)
+
+    Returns:
+        list of dicts: the value of every parameter, for every configuration
+    '''
+    if "grid" in spec:
+        names = list(spec["grid"])
+        return [dict(zip(names, values)) for values in itertools.product(*(spec["grid"][name] for name in names))]
+    sample = spec["random"]
+    rng = random.Random(sample.get("seed", 0))
+    points = []
+    for _ in range(sample["samples"]):
+        point = {}
+        for name, (low, high) in sample["ranges"].items():
+            point[name] = rng.randint(low, high) if isinstance(low, int) and isinstance(high, int) else \
+                rng.uniform(low, high)
+        points.append(point)
+    return points
+
+
+def sweep_config(point, base=None):
+    '''
+    Turns the settings of one configuration of a parameter sweep into a configuration that apply_config can use
+    Args:
+        point (dict): the value of every parameter, as listed by sweep_points
+        base (dict): the settings shared by every configuration. The item parameters scale its item probabilities,
+                     if it has any, and the original ones otherwise
+
+    Returns:
+        dict: the configuration
+    '''
+    config = {}
+    scales = {}
+    for name, value in point.items():
+        if name in ("finish_line", "item_box_spacing"):
+            config[name] = value
+        elif name.startswith("item:"):
+            scales[name[len("item:"):]] = value
+        else:
+            raise ValueError(f"Unknown sweep parameter: {name}")
+    if scales:
+        tables = dict(Default_item_tables)
+        tables.update({int(n): table for n, table in (base or {}).get("item_tables", {}).items()})
+        config["item_tables"] = {n: [(item, {int(position): weight * scales.get(item, 1)
+                                             for position, weight in weights.items()})
+                                     for item, weights in table]
+                                 for n, table in tables.items()}
+    return config
+
+
+def run_sweep(spec, num_races, num_racers, seed=0, workers=None, cache=None, base=None):
+    '''
+    Simulates a batch of races for every configuration of a parameter sweep. The batches of all the configurations
+    share one pool of processes, which moves on to the batches of the next configuration while the last ones of a
+    configuration are still running, and each configuration's batches are merged in the order of their seeds. Every
+    configuration races with the same seeds
+    Args:
+        spec (dict): the configurations to try, in the format of sweep_points
+        num_races (int): the number of races for each configuration
+        num_racers (int): the number of racers in each race
+        seed (int): the seed of the first race of every configuration
+        workers (int): the number of processes. Defaults to the number of CPUs
+        cache (ResultCache): if given, races that were already simulated with the same configuration and seeds are
+                             read from it, and the other races are added to it
+        base (dict): settings shared by every configuration, in the format of apply_config, such as a track. The
+                     settings of the sweep take precedence
+
+    Returns:
+        dict: for every configuration, keyed by config_hash, its settings and the RaceStats of its races.
+              Configurations that are the same are only run once
+    '''
+    if workers is None:
+        workers = os.cpu_count() or 1
+    configs = {}
+    for point in sweep_points(spec):
+        config = {**(base or {}), **sweep_config(point, base)}
+        check_config(config)
+        configs.setdefault(config_hash(config), (point, config))
+    stop = seed + num_races
+    if cache is None:
+        first, batch_size = seed, Race_batch_size
+    else:
+        # The batches are whole blocks of the cache, as in run_cached_batch
+        first, batch_size = seed - seed % cache.block_size, cache.block_size
+
+    def batches():
+        '''
+        Lists the batches of every configuration, one configuration after another
+        Args:
+            None
+
+        Yields:
+            tuple: the hash of the configuration, the task that runs its races, and the first seed of the batch
+        '''
+        for key, (_, config) in configs.items():
+            if cache is None:
+                task = partial(run_config_races, config, num_racers)
+            else:
+                task = partial(run_cached_races, cache, config, num_racers, range(seed, stop))
+            for start in range(first, stop, batch_size):
+                yield key, task, start
+
+    results = {key: (point, RaceStats()) for key, (point, _) in configs.items()}
+    # For every configuration, the first seed of the next batch to merge, and the batches that finished before it
+    next_starts = dict.fromkeys(configs, first)
+    finished = {key: {} for key in configs}
+    queued = batches()
+    pending = {}
+    with race_pool(workers) as pool:
+        try:
+            while True:
+                # Keeps two batches per worker submitted, as run_in_batches does, so the memory used does not grow
+                # with the size of the sweep
+                for key, task, start in queued:
+                    pending[pool.submit(task, range(start, min(start + batch_size, stop)))] = (key, start)
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, start = pending.pop(future)
+                    finished[key][start] = future.result()
+                    while next_starts[key] in finished[key]:
+                        results[key][1].merge(finished[key].pop(next_starts[key]))
+                        next_starts[key] += batch_size
+        finally:
+            for future in pending:
+                future.cancel()
+    if cache is not None:
+        cache.evict()
+    return results
+
+
+def sweep_summary(results, z=1.96):
+    '''
+    Summarizes how the win rate of every starting position responds to the settings of a parameter sweep
+    Args:
+        results (dict): the results of run_sweep
+        z (float): the normal quantile of the confidence level. 1.96 gives 95% intervals
+
+    Returns:
+        DataFrame: one row for every configuration and starting position, with the configuration's hash and settings,
+                   the number of races, the win rate and its confidence interval, and the mean finishing position
+    '''
+    rows = []
+    for key, (point, stats) in results.items():
+        for start, counts in sorted(stats.start_positions.items()):
+            races = sum(counts)
+            low, high = wilson_interval(counts[0], races, z)
+            rows.append({"Config": key, **point, "Start Position": start, "Races": races,
+                         "Win Rate": counts[0] / races, "CI Low": low, "CI High": high,
+                         "Mean Position": sum(place * count for place, count in enumerate(counts, start=1)) / races})
+    return pd.DataFrame(rows)
+
+
+def print_comparison(stats):
+    '''
+    Prints the paired comparison of two configurations as a table
+    Args:
+        stats (PairedStats): the statistics of the comparison
+
+    Returns:
+        None
+    '''
+    print(f"Samples: {stats.races} ({stats.failed} left out after an error)")
+    print(tabulate(stats.summary().reset_index(), headers='keys', tablefmt='psql', showindex=False,
+                   floatfmt=("", "", "g", ".4f", ".4f", ".4f", ".2e", ".4f", ".4f", ".2f")))
+
+
+def print_batch_summary(stats):
+    '''
+    Prints the statistics of a batch of races as tables
+    Args:
+        stats (RaceStats): the statistics to print
+
+    Returns:
+        None
+    '''
+    print(f"Races: {stats.races} ({stats.unfinished} stopped after {Max_race_duration} seconds, {stats.failed} "
+          f"abandoned after an error)")
+    print(tabulate(stats.summary(), headers='keys', tablefmt='psql',
+                   floatfmt=("", "g", "g", ".3f", ".3f", ".2f", ".2f")))
+    print(tabulate(stats.weight_summary(), headers='keys', tablefmt='psql', floatfmt=".3f"))
+    print(tabulate(stats.item_summary(), headers='keys', tablefmt='psql'))
+
+
+class TerminalDashboard:
+    '''
+    A view of the race that stays in place in the terminal, instead of printing a new table every second.
+    The screen is drawn once and every refresh only rewrites the cells whose text changed since the last one, using
+    ANSI escape codes to move the cursor.
+
+    Attributes:
+    participants (list): The racers shown on the dashboard, one row each in the order of the race table
+    stream (file): Where the dashboard is written, usually the terminal
+    cells (dict): The text currently shown on screen, keyed by the (row, column) where it starts
+    win_odds (dict): The latest chance of each racer winning, keyed by name. None if the odds are not shown
+
+    Methods:
+    layout, refresh, run, close
+    '''
+
+    def __init__(self, participants, stream=None, win_odds=False):
+        '''
+        Constructs all the necessary attributes for the TerminalDashboard class
+
+        Parameters:
+        participants (list): The racers participating in the race
+        stream (file): Where the dashboard is written. Defaults to sys.stdout
+        win_odds (bool): if True, a column shows each racer's chance of winning, which is kept up to date by
+                         track_win_odds
+
+        Returns:
+        None
+        '''
+        self.participants = participants
+        self.stream = stream if stream is not None else sys.stdout
+        self.cells = {}
+        self.win_odds = {} if win_odds else None
+
+        # The header and width of every column. The widths fit the longest name and the longest item
+        name_width = max(len("Racer"), max(len(racer.name) for racer in participants))
+        item_width = max(len(item) for item, _ in all_items_12)
+        self.columns = [("Racer #", 7), ("Racer", name_width), ("Position", 8), ("Speed", 8), ("Item", item_width),
+                        ("Distance", 10)]
+        if Race_track is not None and Race_track.laps > 1:
+            self.columns.append(("Lap", 5))
+        if win_odds:
+            self.columns.append(("Win %", 6))
+
+    def layout(self):
+        '''
+        Formats the current state of the race as the text of every cell of the dashboard
+
+        Parameters:
+        None
+
+        Returns:
+        dict: the padded text of every cell, keyed by the (row, column) where it starts. Rows and columns start at 1
+        '''
+        cells = {(1, 1): f"Time Elapsed: {Race_duration}".ljust(24)}
+        column = 1
+        for header, width in self.columns:
+            cells[(3, column)] = header.rjust(width)
+            for i, racer in enumerate(self.participants):
+                if header == "Racer #":
+                    text = str(i + 1)
+                elif header == "Racer":
+                    text = racer.name
+                elif header == "Position":
+                    text = str(racer.position)
+                elif header == "Speed":
+                    text = f"{racer.speed:.2f}"
+                elif header == "Item":
+                    text = racer.item if racer.item is not None else ""
+                elif header == "Lap":
+                    text = f"{Race_track.lap(racer.distance_from_start)}/{Race_track.laps}"
+                elif header == "Win %":
+                    odds = self.win_odds.get(racer.name)
+                    text = f"{100 * odds:.1f}" if odds is not None else ""
+                else:
+                    text = f"{racer.distance_from_start:.1f}"
+                cells[(4 + i, column)] = text.rjust(width)
+            column += width + 3
+        return cells
+
+    def refresh(self):
+        '''
+        Redraws the cells that changed since the last refresh. The first refresh clears the screen and draws everything
+
+        Parameters:
+        None
+
+        Returns:
+        int: the number of cells that were redrawn
+        '''
+        output = []
+        if not self.cells:
+            # Clears the screen and hides the cursor
+            output.append("\x1b[2J\x1b[?25l")
+        redrawn = 0
+        for (row, column), text in self.layout().items():
+            if self.cells.get((row, column)) != text:
+                output.append(f"\x1b[{row};{column}H{text}")
+                self.cells[(row, column)] = text
+                redrawn += 1
+        if output:
+            self.stream.write("".join(output))
+            self.stream.flush()
+        return redrawn
+
+    async def run(self, refresh_rate):
+        '''
+        Refreshes the dashboard at a fixed rate until the task is cancelled
+
+        Parameters:
+        refresh_rate (float): how many times per second the dashboard is redrawn
+
+        Returns:
+        None
+        '''
+        while True:
+            self.refresh()
+            await asyncio.sleep(1 / refresh_rate)
+
+    def close(self):
+        '''
+        Moves the cursor below the dashboard and shows it again, so the output after the race is printed normally
+
+        Parameters:
+        None
+
+        Returns:
+        None
+        '''
+        self.stream.write(f"\x1b[{4 + len(self.participants)};1H\x1b[?25h\n")
+        self.stream.flush()
+
+
+# The widths (in inches) of the position, speed, and distance panels. The position leaderboard uses the default
+# matplotlib figure width and the bar graphs are widened so that the racer names fit
+Panel_widths = [6.4, 8, 8]
+Panel_height = 5
+
+
+def leaderboard_order(df_position, participants, frame):
+    '''
+    Orders the racers for one frame of the position leaderboard
+    Args:
+        df_position (DataFrame): the positions of the racers throughout the race
+        participants (list): the racers participating in the race
+        frame (int): the current race duration
+
+    Returns:
+        list of str: the names of the racers, from first place to last place
+    '''
+    return leaderboard_from_row(df_position.iloc[frame], [racer.name for racer in participants])
+
+
+def leaderboard_from_row(row, names):
+    '''
+    Orders the racers using one row of the position dataframe
+    Args:
+        row (Series): the positions of the racers at one point of the race
+        names (list of str): the names of the racers participating in the race
+
+    Returns:
+        list of str: the names of the racers, from first place to last place
+    '''
+    # Sorts the position values in ascending order
+    data = row.sort_values(ascending=True, na_position='last')
+    return [index for index in data.index if index in names]
+
+
+def draw_position_frame(ax, names, frame):
+    '''
+    Draws the position leaderboard for one iteration of the race
+    Args:
+        ax (Axes): the axes the leaderboard is drawn on
+        names (list of str): the names of the racers, from first place to last place
+        frame (int): the current race duration
+
+    Returns:
+        None
+    '''
+    ax.clear()
+    ax.axis('off')
+
+    # Writes the information of the racers in the form of " [position]. [racer_name]"
+    for i, name in enumerate(names):
+        ax.text(0.5, 0.9 - i * 0.1, f"{i + 1}. {name}", ha='center', va='center', fontsize=8)
+
+    ax.set_title(f'Position Table - Frame {frame + 1}')
+
+
+def draw_bar_frame(ax, labels, values, y_max, title):
+    '''
+    Draws one iteration of a dynamic bar graph (speed or distance)
+    Args:
+        ax (Axes): the axes the bar graph is drawn on
+        labels (list of str): the label of each bar
+        values (array): the height of each bar
+        y_max (float): the upper limit of the y-axis, which stays the same for the whole animation
+        title (str): the title of the graph
+
+    Returns:
+        None
+    '''
+    ax.clear()
+    ax.bar(labels, values)
+    ax.set_ylim(0, y_max)
+    ax.set_title(title)
+
+
+class SplitPillowWriter(PillowWriter):
+    '''
+    A GIF writer that cuts every frame of a figure made of side-by-side panels into one animation per panel.
+    This lets the three race animations be rasterized once and still be saved as three separate files.
+
+    Attributes:
+    outfiles (list of str): The file each panel's animation is saved to, from left to right
+    widths (list of float): The width (in inches) of each panel, from left to right
+    fps (int): The number of frames per second of the saved animations
+
+    Methods:
+    setup, grab_frame, finish
+    '''
+
+    def __init__(self, outfiles, widths, fps=1):
+        '''
+        Constructs all the necessary attributes for the SplitPillowWriter class
+
+        Parameters:
+        outfiles (list of str): The file each panel's animation is saved to, from left to right
+        widths (list of float): The width (in inches) of each panel, from left to right
+        fps (int): The number of frames per second of the saved animations
+
+        Returns:
+        None
+        '''
+        super().__init__(fps=fps)
+        self.outfiles = outfiles
+        self.widths = widths
+
+    def setup(self, fig, outfile, dpi=None):
+        '''
+        Prepares the writer to grab frames from the figure. The outfile is ignored as every panel is saved to its own
+        file in outfiles
+        '''
+        super().setup(fig, outfile, dpi=dpi)
+        width, height = self.frame_size
+        # The pixel columns where each panel starts and ends
+        edges = [0]
+        for panel_width in self.widths:
+            edges.append(edges[-1] + panel_width)
+        edges = [round(edge / sum(self.widths) * width) for edge in edges]
+        self._boxes = [(edges[i], 0, edges[i + 1], height) for i in range(len(self.widths))]
+        self._panel_frames = [[] for _ in self.widths]
+
+    def grab_frame(self, **savefig_kwargs):
+        '''
+        Rasterizes the current frame of the figure once and crops it into one image per panel
+        '''
+        buf = BytesIO()
+        self.fig.savefig(buf, **{**savefig_kwargs, "format": "rgba", "dpi": self.dpi})
+        im = Image.frombuffer("RGBA", self.frame_size, buf.getbuffer(), "raw", "RGBA", 0, 1).convert("RGB")
+        for frames, box in zip(self._panel_frames, self._boxes):
+            frames.append(im.crop(box))
+
+    def finish(self):
+        '''
+        Saves the animation of every panel
+        '''
+        for frames, outfile in zip(self._panel_frames, self.outfiles):
+            frames[0].save(outfile, save_all=True, append_images=frames[1:], duration=int(1000 / self.fps), loop=0)
+
+
+def save_combined_animation(df_position, df_speed, df_distance, participants, split=False, folder="."):
+    '''
+    Renders the position leaderboard, the speed bar graph, and the distance bar graph as three panels of one figure,
+    in a single pass over the frames of the race
+    Args:
+        df_position (DataFrame): the positions of the racers throughout the race
+        df_speed (DataFrame): the speeds of the racers throughout the race
+        df_distance (DataFrame): the distances of the racers throughout the race
+        participants (list): the racers participating in the race
+        split (bool): if True, every frame is cut into its three panels, which are saved as position_animation.gif,
+                      speed_animation.gif, and distance_animation.gif. Otherwise, the whole figure is saved as
+                      race_animation.gif
+        folder (str): the folder the animations are saved in
+
+    Returns:
+        fig (Figure): the combined figure, showing the last frame of the race
+    '''
+    fig = plt.figure(figsize=(sum(Panel_widths), Panel_height))
+    panels = fig.subfigures(1, 3, width_ratios=Panel_widths)
+    ax, ax2, ax3 = [panel.subplots() for panel in panels]
+
+    # The data of every frame is taken out of the dataframes once, instead of re-indexing them for every frame
+    leaderboards = [leaderboard_order(df_position, participants, frame) for frame in range(len(df_position))]
+    speed_values = df_speed.iloc[:, 1:].to_numpy(dtype=float)
+    distance_values = df_distance.iloc[:, 1:].to_numpy(dtype=float)
+
+    # The bar graphs are drawn once and only the heights of the bars change from frame to frame. They are first drawn
+    # with the last frame because the first frame has no data, which would leave the bars without a place on the x-axis
+    draw_bar_frame(ax2, list(df_speed.columns[1:]), speed_values[-1], df_speed.iloc[:, 1:].max().max(), 'Speed')
+    draw_bar_frame(ax3, list(df_distance.columns[1:]), distance_values[-1], df_distance.iloc[:, 1:].max().max(),
+                   'Distance')
+    panels[1].autofmt_xdate(rotation=45, ha='right')  # Racer names are rotated to prevent overlapping text
+    panels[2].autofmt_xdate(rotation=45, ha='right')
+    speed_bars = ax2.containers[0]
+    distance_bars = ax3.containers[0]
+
+    if split:
+        writer = SplitPillowWriter([os.path.join(folder, outfile) for outfile in
+                                    ['position_animation.gif', 'speed_animation.gif', 'distance_animation.gif']],
+                                   Panel_widths, fps=1)
+    else:
+        writer = PillowWriter(fps=1)
+
+    # Every frame is drawn and rasterized exactly once
+    with writer.saving(fig, os.path.join(folder, 'race_animation.gif'), fig.dpi):
+        for frame in range(len(df_position)):
+            draw_position_frame(ax, leaderboards[frame], frame)
+            for bar, speed in zip(speed_bars, speed_values[frame]):
+                bar.set_height(speed)
+            for bar, distance in zip(distance_bars, distance_values[frame]):
+                bar.set_height(distance)
+            writer.grab_frame()
+    return fig
+
+
+def grab_frame(fig):
+    '''
+    Rasterizes a figure exactly like PillowWriter grabs a frame, so the saved GIFs are the same as the ones from
+    FuncAnimation
+    Args:
+        fig (Figure): the figure to rasterize
+
+    Returns:
+        Image: the frame, in RGB mode unless the figure has transparent pixels
+    '''
+    width, height = fig.get_size_inches()
+    frame_size = int(width * fig.dpi), int(height * fig.dpi)
+    buf = BytesIO()
+    fig.savefig(buf, format="rgba", dpi=fig.dpi)
+    im = Image.frombuffer("RGBA", frame_size, buf.getbuffer(), "raw", "RGBA", 0, 1)
+    if im.getextrema()[3][0] < 255:
+        return im
+    return im.convert("RGB")
 
-        # Gets the data for the current frame and sorts the position values in ascending order
-        data = df_position.iloc[frame].sort_values(ascending=True, na_position='last')
 
-        # Update the positions of racers based on the current frame
-        for i, (index, value) in enumerate(data.items(), start=1):
-            for racer in participants:
-                if racer.name == index:
-                    racer.position = i  # Gives the racers a position to sort for visualization
+def rasterize_frames(kind, first_frame, frame_data, settings):
+    '''
+    Draws a run of consecutive frames of one of the race animations on its own Agg figure. This is the work that is
+    split across the processes of save_animations_parallel, so it only uses plain data and never touches pyplot
+    Args:
+        kind (str): "position" for the position leaderboard, or "bar" for the speed and distance bar graphs
+        first_frame (int): the index of the first frame in frame_data
+        frame_data (list): the data of each frame. The names of the racers in order for the leaderboard, or the height
+                           of each bar for the bar graphs
+        settings (tuple): the bar labels, the y-axis limit, and the title of a bar graph. None for the leaderboard
 
-        # Sort the racers based on their positions
-        sorted_racers = sorted(participants, key=lambda x: x.position)
+    Returns:
+        list of tuples: the Pillow mode and the raw pixels of each frame, in the same form as PillowWriter grabs them
+    '''
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    if kind == "bar":
+        fig.set_size_inches(8, 5)
+        labels, y_max, title = settings
+    frames = []
+    for frame, data in enumerate(frame_data, start=first_frame):
+        if kind == "position":
+            draw_position_frame(ax, data, frame)
+        else:
+            draw_bar_frame(ax, labels, data, y_max, title)
+            fig.autofmt_xdate(rotation=45, ha='right')  # Racer names are rotated to prevent overlapping text
 
-        # Update the positions again to ensure they start from 1 instead of 0 indexing
-        for i, racer in enumerate(sorted_racers, start=1):
-            racer.position = i
+        im = grab_frame(fig)
+        frames.append((im.mode, im.size, im.tobytes()))
+    return frames
 
-        # Writes the information of the racers in the form of " [position]. [racer_name]"
-        racer_info = [f"{racer.position}. {racer.name}" for racer in sorted_racers]
 
-        for i, info in enumerate(racer_info):
-            ax.text(0.5, 0.9 - i * 0.1, info, ha='center', va='center', fontsize=8)
+def save_animations_parallel(df_position, df_speed, df_distance, participants, workers, fps=1):
+    '''
+    Renders the position, speed, and distance animations with a pool of processes. The frames of every animation are
+    split into consecutive runs that are rasterized by rasterize_frames, then put back in order and encoded with Pillow.
+    The saved GIFs are byte-identical to the ones saved by FuncAnimation in main
+    Args:
+        df_position (DataFrame): the positions of the racers throughout the race
+        df_speed (DataFrame): the speeds of the racers throughout the race
+        df_distance (DataFrame): the distances of the racers throughout the race
+        participants (list): the racers participating in the race
+        workers (int): the number of processes used to rasterize the frames
+        fps (int): the number of frames per second of the saved animations
 
-        ax.set_title(f'Position Table - Frame {frame + 1}')
+    Returns:
+        None
+    '''
+    # The data of every frame is taken out of the dataframes in the main process and only plain lists are sent over
+    animations = [
+        ('position_animation.gif', "position",
+         [leaderboard_order(df_position, participants, frame) for frame in range(len(df_position))], None),
+        ('speed_animation.gif', "bar", list(df_speed.iloc[:, 1:].to_numpy(dtype=float)),
+         (list(df_speed.columns[1:]), df_speed.iloc[:, 1:].max().max(), 'Speed')),
+        ('distance_animation.gif', "bar", list(df_distance.iloc[:, 1:].to_numpy(dtype=float)),
+         (list(df_distance.columns[1:]), df_distance.iloc[:, 1:].max().max(), 'Distance')),
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Every animation is cut into one run of frames per worker so that all three keep the pool busy
+        jobs = []
+        for outfile, kind, frame_data, settings in animations:
+            run_length = -(-len(frame_data) // workers)
+            runs = [pool.submit(rasterize_frames, kind, start, frame_data[start:start + run_length], settings)
+                    for start in range(0, len(frame_data), run_length)]
+            jobs.append((outfile, runs))
+
+        for outfile, runs in jobs:
+            images = [Image.frombytes(mode, size, pixels) for run in runs for mode, size, pixels in run.result()]
+            images[0].save(outfile, save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0)
+
+
+def render_pipeline(tick_queue, names, speed_limit, distance_limit, fps=1):
+    '''
+    Rasterizes the frames of the position, speed, and distance animations as the rows of the race arrive on a queue,
+    so that rendering overlaps with the simulation. Runs in its own process, started by run_race_pipelined.
+    As the race is not known in advance, the y-axes of the bar graphs use fixed limits and bars that go past them are
+    cut off at the top
+    Args:
+        tick_queue (Queue): the position, speed, and distance rows of every frame, followed by None after the last one
+        names (list of str): the names of the racers participating in the race
+        speed_limit (float): the upper limit of the y-axis of the speed bar graph
+        distance_limit (float): the upper limit of the y-axis of the distance bar graph
+        fps (int): the number of frames per second of the saved animations
 
-    # Creates the position animation
-    animation_position = FuncAnimation(fig, update_position_movie, frames=len(df_position), repeat=False)
-    animation_position.save('position_animation.gif', writer='pillow', fps=1)
+    Returns:
+        None
+    '''
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    fig2 = Figure(figsize=(8, 5))
+    FigureCanvasAgg(fig2)
+    ax2 = fig2.subplots()
+    fig3 = Figure(figsize=(8, 5))
+    FigureCanvasAgg(fig3)
+    ax3 = fig3.subplots()
+
+    speed_bars = None
+    distance_bars = None
+    frames = ([], [], [])
+    frame = 0
+    while True:
+        rows = tick_queue.get()
+        if rows is None:
+            break
+        position_row, speed_row, distance_row = rows
+
+        draw_position_frame(ax, leaderboard_from_row(position_row, names), frame)
+        # The bar graphs are drawn with the first frame and only the heights of the bars change after that
+        if speed_bars is None:
+            draw_bar_frame(ax2, list(speed_row.index[1:]), [0] * (len(speed_row) - 1), speed_limit, 'Speed')
+            draw_bar_frame(ax3, list(distance_row.index[1:]), [0] * (len(distance_row) - 1), distance_limit,
+                           'Distance')
+            fig2.autofmt_xdate(rotation=45, ha='right')  # Racer names are rotated to prevent overlapping text
+            fig3.autofmt_xdate(rotation=45, ha='right')
+            speed_bars = ax2.containers[0]
+            distance_bars = ax3.containers[0]
+        for bar, speed in zip(speed_bars, speed_row.iloc[1:].to_numpy(dtype=float)):
+            bar.set_height(speed)
+        for bar, distance in zip(distance_bars, distance_row.iloc[1:].to_numpy(dtype=float)):
+            bar.set_height(distance)
+
+        for images, figure in zip(frames, (fig, fig2, fig3)):
+            im = grab_frame(figure)
+            # Pillow converts RGB frames to an adaptive palette when saving a GIF. Doing it now leaves only the
+            # encoding for when the race ends
+            if im.mode == "RGB":
+                im = im.convert("P", palette=Image.Palette.ADAPTIVE)
+            images.append(im)
+        frame += 1
+
+    for images, outfile in zip(frames, ['position_animation.gif', 'speed_animation.gif', 'distance_animation.gif']):
+        images[0].save(outfile, save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0)
+
+
+# How long (in seconds) the end of the race waits for room on a full queue to the renderer before stopping the renderer
+Renderer_shutdown_timeout = 10
+
+
+def run_race_pipelined(participants, num_racers, queue_size=64, speed=1.0, dashboard=None, refresh_rate=10,
+                       win_odds=None):
+    '''
+    Simulates the race while a separate process renders the animations. Every row added to the race dataframes is
+    sent to render_pipeline through a bounded queue, so the simulation waits if rendering falls too far behind
+    Args:
+        participants (list): the racers participating in the race
+        num_racers (int): the number of racers in the race
+        queue_size (int): the number of frames that can wait on the queue before the simulation waits for the renderer
+        speed (float): the playback speed of the race, passed on to play_race
+        dashboard (TerminalDashboard): passed on to play_race
+        refresh_rate (float): passed on to play_race
+        win_odds (dict): passed on to play_race
 
-    def update_speed_movie(frame):
+    Returns:
+        df_distance, df_position, df_speed (DataFrame): the same race data as run_race_simulation
+    '''
+    names = [racer.name for racer in participants]
+    tick_queue = multiprocessing.Queue(maxsize=queue_size)
+    # The fastest a racer can normally go is twice their max speed, in a bullet bill
+    speed_limit = 2 * max(racer.max_speed for racer in participants)
+    renderer = multiprocessing.Process(target=render_pipeline,
+                                       args=(tick_queue, names, speed_limit, finish_line))
+    renderer.start()
+
+    def send_rows(*rows):
         """
-        Presents the speeds of the racers throughout the race as a dynamic bar graph
+        Sends the newest row of each race dataframe to the renderer
         Args:
-            frame (int) : the current race duration
+            rows (DataFrame): df_position, df_speed, and df_distance
 
         Returns:
-
+            None
         """
-        ax2.clear()
-        ax2.bar(df_speed.columns[1:], df_speed.iloc[frame, 1:])  # Bars denote the speed of the racer
-        ax2.set_ylim(0, df_speed.iloc[:, 1:].max().max())
-        ax2.set_title(f'Speed')
-        fig2.autofmt_xdate(rotation=45, ha='right')  # Racer names are rotated to prevent overlapping text
+        # Every row gets the columns the finished dataframes will have, which the first row does not have yet
+        rows = tuple(df.iloc[-1].reindex([df.columns[0], "Time Elapsed"] + names) for df in rows)
+        while True:
+            try:
+                tick_queue.put(rows, timeout=1)
+                return
+            except queue.Full:
+                if not renderer.is_alive():
+                    raise RuntimeError("The renderer process stopped before the race finished")
 
-    # Runs the speed bar graph animation
-    animation_speed = FuncAnimation(fig2, update_speed_movie, frames=len(df_speed), repeat=False)
-    animation_speed.save('speed_animation.gif', writer='pillow', fps=1)
+    try:
+        df_distance, df_position, df_speed = asyncio.run(play_race(participants, num_racers, speed, on_tick=send_rows,
+                                                                   dashboard=dashboard, refresh_rate=refresh_rate,
+                                                                   win_odds=win_odds))
+    finally:
+        # A renderer that stopped, or that stopped taking frames off a full queue, never gets the end of the race, so it
+        # is stopped instead of being waited for forever
+        delivered = False
+        if renderer.is_alive():
+            try:
+                tick_queue.put(None, timeout=Renderer_shutdown_timeout)
+                delivered = True
+            except queue.Full:
+                pass
+        if not delivered:
+            tick_queue.cancel_join_thread()
+            renderer.terminate()
+        renderer.join()
+    return df_distance, df_position, df_speed
 
-    def update_distance_movie(frame):
-        """
-        Presents the distance the racers are from the start as a dynamic bar graph
-        Args:
-            frame (int): current race duration
 
-        Returns:
+# Where all the other functions will get called and where we will create the animation
+def main(animation="separate", render_workers=1, pipeline=False, speed=1.0, dashboard=False, refresh_rate=10,
+         win_odds=False, rollouts=200, odds_budget=0.5, odds_workers=None, event_log=None):
+    '''
+    Runs all the functions described above
+    Args:
+        animation (str): how the animations are rendered. "separate" renders the position, speed, and distance
+                         animations as three figures, "combined" renders them as three panels of one figure saved to
+                         race_animation.gif, and "split" renders the combined figure once and cuts it into the three
+                         usual files
+        render_workers (int): the number of processes used to rasterize the separate animations. With more than one,
+                              the frames are rendered in parallel by save_animations_parallel
+        pipeline (bool): if True, the separate animations are rendered by another process while the race is simulated
+        speed (float): how many times faster than real time the race is played, from 0.25 to 100.
+                       None plays the race as fast as possible
+        dashboard (bool): if True, the race is shown on a dashboard that stays in place in the terminal instead of
+                          printing a table every second
+        refresh_rate (float): how many times per second the dashboard is redrawn
+        win_odds (bool): if True, the dashboard shows each racer's chance of winning, estimated every second of the
+                         race by finishing it many times in other processes
+        rollouts (int): the number of continuations for each estimate of the win odds
+        odds_budget (float): the number of seconds each estimate of the win odds may take
+        odds_workers (int): the number of processes that estimate the win odds. Defaults to the number of CPUs
+        event_log (str): if given, the latest Event_log_capacity events of the race are saved to this file, which
+                         read_events can read
 
-        """
-        ax3.clear()
-        ax3.bar(df_distance.columns[1:], df_distance.iloc[frame, 1:])  # Bars denote the distance each racer is from the
-        # start
-        ax3.set_ylim(0, df_distance.iloc[:, 1:].max().max())
-        ax3.set_title(f'Distance')
-        fig3.autofmt_xdate(rotation=45, ha='right')  # Racer names are rotated to prevent overlapping text
+    Returns:
+        None
+    '''
+    global Event_log
+    # Checks if the user inputs an integer between 2 and Max_racers
+    # The error handling at the bottom will handle the cases where the user inputs a string
+    n = input("Enter number of racers: ")
+
+    if (int(float(n)) != float(n)) or (float(n) < 2.0) or (float(n) > Max_racers):
+        print(f"Must input an integer between 2 and {Max_racers}, inclusive.")
+        sys.exit()
+    num_racers = int(float(n))
+
+    # Select int(n) racers at random from the list of all racers. Larger fields also have numbered copies of them
+    if num_racers <= len(all_racers):
+        participants = random.sample(all_racers, num_racers)
+        seed_block_draws()
+    else:
+        participants = start_race(num_racers)
+    initial_positions = [i for i in range(1, num_racers + 1)]
+
+    # Assign each participant an initial position and initial distance from the starting line. Simulates a staggered
+    # start in a race
+
+    for j in range(len(participants)):
+        participants[j].position = initial_positions[j]
+        participants[j].distance_from_start = -1 * initial_positions[j]
 
-    animation_distance = FuncAnimation(fig3, update_distance_movie, frames=len(df_distance), repeat=False)
-    animation_distance.save('distance_animation.gif', writer='pillow', fps=1)
+    race_dashboard = TerminalDashboard(participants, win_odds=win_odds) if dashboard else None
+    # The same processes estimate the win odds for the whole race, so none are started while it is running
+    if odds_workers is None:
+        odds_workers = os.cpu_count() or 1
+    odds_pool = race_pool(odds_workers) if win_odds else None
+    odds_settings = (dict(pool=odds_pool, workers=odds_workers, rollouts=rollouts, time_budget=odds_budget)
+                     if win_odds else None)
+    if event_log is not None:
+        Event_log = EventLog()
+        Event_log.append((0, "start", None, None, 0))
+    try:
+        if pipeline:
+            df_distance, df_position, df_speed = run_race_pipelined(participants, num_racers, speed=speed,
+                                                                    dashboard=race_dashboard,
+                                                                    refresh_rate=refresh_rate, win_odds=odds_settings)
+        else:
+            df_distance, df_position, df_speed = asyncio.run(play_race(participants, num_racers, speed,
+                                                                       dashboard=race_dashboard,
+                                                                       refresh_rate=refresh_rate,
+                                                                       win_odds=odds_settings))
+    finally:
+        if odds_pool is not None:
+            odds_pool.shutdown(cancel_futures=True)
+        if event_log is not None:
+            Event_log.save(event_log)
+            Event_log = None
+
+    if pipeline:
+        # The animations were already saved while the race was running
+        pass
+    elif animation == "separate" and render_workers > 1:
+        save_animations_parallel(df_position, df_speed, df_distance, participants, render_workers)
+    elif animation == "separate":
+        fig, ax = plt.subplots()
+        fig2, ax2 = plt.subplots()
+        fig2.set_size_inches(8, 5)
+        fig3, ax3 = plt.subplots()
+        fig3.set_size_inches(8, 5)
+
+        def update_position_movie(frame):
+            """
+            Creates the position leaderboard for each iteration of the race
+            Args:
+                frame (int): the current race duration
+
+            Returns:
+                None
+            """
+            draw_position_frame(ax, leaderboard_order(df_position, participants, frame), frame)
+
+        # Creates the position animation
+        animation_position = FuncAnimation(fig, update_position_movie, frames=len(df_position), repeat=False)
+        animation_position.save('position_animation.gif', writer='pillow', fps=1)
+
+        def update_speed_movie(frame):
+            """
+            Presents the speeds of the racers throughout the race as a dynamic bar graph
+            Args:
+                frame (int) : the current race duration
+
+            Returns:
+
+            """
+            # Bars denote the speed of the racer
+            draw_bar_frame(ax2, df_speed.columns[1:], df_speed.iloc[frame, 1:], df_speed.iloc[:, 1:].max().max(),
+                           'Speed')
+            fig2.autofmt_xdate(rotation=45, ha='right')  # Racer names are rotated to prevent overlapping text
+
+        # Runs the speed bar graph animation
+        animation_speed = FuncAnimation(fig2, update_speed_movie, frames=len(df_speed), repeat=False)
+        animation_speed.save('speed_animation.gif', writer='pillow', fps=1)
+
+        def update_distance_movie(frame):
+            """
+            Presents the distance the racers are from the start as a dynamic bar graph
+            Args:
+                frame (int): current race duration
+
+            Returns:
+
+            """
+            # Bars denote the distance each racer is from the start
+            draw_bar_frame(ax3, df_distance.columns[1:], df_distance.iloc[frame, 1:],
+                           df_distance.iloc[:, 1:].max().max(), 'Distance')
+            fig3.autofmt_xdate(rotation=45, ha='right')  # Racer names are rotated to prevent overlapping text
+
+        animation_distance = FuncAnimation(fig3, update_distance_movie, frames=len(df_distance), repeat=False)
+        animation_distance.save('distance_animation.gif', writer='pillow', fps=1)
+    else:
+        fig = save_combined_animation(df_position, df_speed, df_distance, participants,
+                                                 split=animation == "split")
 
     plt.show()
 
+    # The final standings are the ones shown in the last frame of the position leaderboard
+    for i, name in enumerate(leaderboard_order(df_position, participants, len(df_position) - 1), start=1):
+        for racer in participants:
+            if racer.name == name:
+                racer.position = i
+
     if len(df_distance) < finish_line:
         for racer in participants:
             if racer.finished:
                 print(f"{racer.name} has crossed the finish line in Position {racer.position}!")
 
 
+# The field sizes of the game that the benchmarks race, and the larger fields made from numbered copies of the racers
+Benchmark_field_sizes = (2, 4, 8, 12)
+Benchmark_large_fields = (50, 200)
+
+# How many times every benchmark is run, so a regression can be told apart from noise
+Benchmark_repeats = 5
+
+# The number of 12 racer races each run of a race benchmark simulates. Larger fields race proportionally fewer
+Benchmark_races = 100
+
+# The number of item box rolls, use_item calls, and animation frames each run of their benchmarks times
+Benchmark_rolls = 20000
+Benchmark_item_uses = 200
+Benchmark_frames = 20
+
+
+def finishing_seeds(num_racers, count, first_seed=0):
+    '''
+    Finds seeds whose race ends with every racer finished. A race that is played second by second, such as a live race,
+    only stops once every racer has finished, so the benchmarks of recorded races only use these seeds
+    Args:
+        num_racers (int): the number of racers in each race
+        count (int): the number of seeds to find
+        first_seed (int): the first seed to try
+
+    Returns:
+        list of ints: the seeds, in increasing order
+    '''
+    seeds = []
+    seed = first_seed
+    while len(seeds) < count:
+        reset_race_state()
+        random.seed(seed)
+        order = try_race(start_race(num_racers), num_racers)
+        if order is not None and order[-1].finished:
+            seeds.append(seed)
+        seed += 1
+    return seeds
+
+
+def bench_races(num_racers, num_races, repeats):
+    '''
+    Times races simulated without recording them by run_races, one after another in this process. Only races that end
+    with every racer finished are timed, so races stopped at Max_race_duration or by an error do not count
+    Args:
+        num_racers (int): the number of racers in each race
+        num_races (int): the number of races in each run
+        repeats (int): the number of runs
+
+    Returns:
+        races (list of floats): the races simulated per second in every run
+        ticks (list of floats): the seconds of the races simulated per second in every run
+    '''
+    seeds = finishing_seeds(num_racers, num_races)
+    # The seconds of the races are counted once, before the races are timed, since counting them in a RaceMetrics would
+    # slow down the races being timed. The same seeds always take the same number of seconds
+    ticks = run_races(num_racers, seeds, metrics=True).metrics.ticks
+    races_per_second, ticks_per_second = [], []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        run_races(num_racers, seeds)
+        elapsed = time.perf_counter() - started
+        races_per_second.append(num_races / elapsed)
+        ticks_per_second.append(ticks / elapsed)
+    reset_race_state()
+    return races_per_second, ticks_per_second
+
+
+def bench_item_rolls(num_racers, rolls, repeats):
+    '''
+    Times get_item, with the items that are unavailable at the start of a race, so both the default and the updated
+    probabilities are used
+    Args:
+        num_racers (int): the number of racers in the race
+        rolls (int): the number of items given in each run
+        repeats (int): the number of runs
+
+    Returns:
+        list of floats: the items given per second in every run
+    '''
+    samples = []
+    for repeat in range(repeats):
+        reset_race_state()
+        random.seed(repeat)
+        participants = start_race(num_racers)
+        started = time.perf_counter()
+        for roll in range(rolls):
+            get_item(participants[roll % num_racers], num_racers)
+        samples.append(rolls / (time.perf_counter() - started))
+    reset_race_state()
+    return samples
+
+
+def synthetic_item_state(item, num_racers=12, seed=0):
+    '''
+    Sets up a race in the middle of its course, with the racers 40 meters apart, for the racer in the middle of the
+    field to use an item
+    Args:
+        item (str): the item
+        num_racers (int): the number of racers in the race
+        seed (int): the seed of the race
+
+    Returns:
+        racer (obj): the racer using the item
+        participants (list): the racers participating in the race
+    '''
+    global Race_duration
+    reset_race_state()
+    random.seed(seed)
+    participants = start_race(num_racers)
+    Race_duration = 100
+    for racer in participants:
+        racer.distance_from_start = 1000 - 40 * racer.position
+    racer = participants[[other.position for other in participants].index(num_racers // 2)]
+    racer.item = racer.recently_used_item = item
+    racer.time_item_got = Race_duration - 3
+    racer.time_item_used = Race_duration
+    racer.using_item = True
+    index_positions(participants)
+    return racer, participants
+
+
+def bench_use_item(item, calls, repeats):
+    '''
+    Times the first call of use_item for an item, on a new synthetic state every call
+    Args:
+        item (str): the item
+        calls (int): the number of calls in each run
+        repeats (int): the number of runs
+
+    Returns:
+        list of floats: the mean time of a call in every run, in microseconds
+    '''
+    samples = []
+    for repeat in range(repeats):
+        elapsed = 0.0
+        for call in range(calls):
+            racer, participants = synthetic_item_state(item, seed=repeat * calls + call)
+            started = time.perf_counter()
+            # use_item can fail in the same way as the races that try_race gives up on
+            try:
+                use_item(racer, participants)
+            except ValueError:
+                pass
+            elapsed += time.perf_counter() - started
+        samples.append(elapsed / calls * 1e6)
+    reset_race_state()
+    return samples
+
+
+def bench_trace_overhead(seeds, repeats):
+    '''
+    Times races that are recorded in dataframes second by second, like a live race, and races recorded in an event
+    log, against the same races simulated without recording anything
+    Args:
+        seeds (list of ints): the seeds of the races, which must end with every racer finished
+        repeats (int): the number of runs
+
+    Returns:
+        dict: for "dataframes" and "event_log", how many times longer the recorded races took in every run
+    '''
+    global Event_log
+
+    def run(mode):
+        started = time.perf_counter()
+        for seed in seeds:
+            reset_race_state()
+            random.seed(seed)
+            participants = start_race(12)
+            if mode == "dataframes":
+                for _ in race_ticks(participants, 12, show_table=False):
+                    pass
+            else:
+                simulate_race(participants, 12)
+        return time.perf_counter() - started
+
+    samples = {"dataframes": [], "event_log": []}
+    for _ in range(repeats):
+        plain = run("plain")
+        samples["dataframes"].append(run("dataframes") / plain)
+        Event_log = EventLog()
+        try:
+            samples["event_log"].append(run("event_log") / plain)
+        finally:
+            Event_log = None
+    return samples
+
+
+def bench_animations(seed, frames, repeats):
+    '''
+    Times drawing, rasterizing, and encoding the frames of every animation of a recorded race
+    Args:
+        seed (int): the seed of the race, which must end with every racer finished
+        frames (int): the most frames of each animation timed in each run
+        repeats (int): the number of runs
+
+    Returns:
+        dict: for "position", "speed", "distance", and "combined", the frames per second of every run
+    '''
+    reset_race_state()
+    random.seed(seed)
+    participants = start_race(12)
+    for _ in race_ticks(participants, 12, show_table=False):
+        pass
+    position, speed, distance = df_position.iloc[:frames], df_speed.iloc[:frames], df_distance.iloc[:frames]
+    animations = {
+        "position": ("position", [leaderboard_order(position, participants, frame) for frame in range(len(position))],
+                     None),
+        "speed": ("bar", list(speed.iloc[:, 1:].to_numpy(dtype=float)),
+                  (list(speed.columns[1:]), df_speed.iloc[:, 1:].max().max(), 'Speed')),
+        "distance": ("bar", list(distance.iloc[:, 1:].to_numpy(dtype=float)),
+                     (list(distance.columns[1:]), df_distance.iloc[:, 1:].max().max(), 'Distance')),
+    }
+    samples = {name: [] for name in list(animations) + ["combined"]}
+    for _ in range(repeats):
+        for name, (kind, frame_data, settings) in animations.items():
+            started = time.perf_counter()
+            images = [Image.frombytes(mode, size, pixels)
+                      for mode, size, pixels in rasterize_frames(kind, 0, frame_data, settings)]
+            images[0].save(BytesIO(), format="GIF", save_all=True, append_images=images[1:], duration=1000, loop=0)
+            samples[name].append(len(images) / (time.perf_counter() - started))
+        with tempfile.TemporaryDirectory() as folder:
+            started = time.perf_counter()
+            fig = save_combined_animation(position, speed, distance, participants, folder=folder)
+            samples["combined"].append(len(position) / (time.perf_counter() - started))
+            plt.close(fig)
+    return samples
+
+
+def bench_peak_memory(num_races, repeats):
+    '''
+    Measures the most memory allocated by Python while races are simulated without recording them
+    Args:
+        num_races (int): the number of 12 racer races in each run
+        repeats (int): the number of runs
+
+    Returns:
+        list of floats: the peak memory of every run, in MiB
+    '''
+    samples = []
+    for _ in range(repeats):
+        tracemalloc.start()
+        try:
+            run_races(12, range(num_races))
+            samples.append(tracemalloc.get_traced_memory()[1] / 2 ** 20)
+        finally:
+            tracemalloc.stop()
+    return samples
+
+
+def benchmark_environment():
+    '''
+    Describes the machine and the software the benchmarks ran with, so results from different machines are not
+    compared by mistake
+    Args:
+        None
+
+    Returns:
+        dict: the versions of Python and the libraries, the platform, the number of CPUs, the version of the race
+              logic, and the commit of this file when it is in a git repository
+    '''
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "platform": platform.platform(), "machine": platform.machine(), "cpus": os.cpu_count(),
+            "numpy": np.__version__, "pandas": pd.__version__, "matplotlib": matplotlib.__version__,
+            "pillow": Image.__version__, "engine_version": Engine_version,
+            "random_block_size": Random_block_size, "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+
+def benchmark_result(samples, unit, higher_is_better=True):
+    '''
+    Puts the samples of a benchmark in the form they are saved in
+    Args:
+        samples (list of floats): the result of every run
+        unit (str): the unit of the results
+        higher_is_better (bool): whether a higher result is an improvement
+
+    Returns:
+        dict: the unit, the direction, the median, and the samples
+    '''
+    return {"unit": unit, "higher_is_better": higher_is_better, "median": float(np.median(samples)),
+            "samples": [float(sample) for sample in samples]}
+
+
+def run_benchmarks(repeats=None, quick=False, progress=None):
+    '''
+    Runs every benchmark in this process: races and seconds of the races per second for every field size, items
+    given per second by get_item, the cost of use_item for every item, the overhead of recording a race, the frames
+    per second of every animation, and the peak memory of simulating races
+    Args:
+        repeats (int): the number of runs of every benchmark. Defaults to Benchmark_repeats
+        quick (bool): if True, every run does a tenth of the work, for a quick check that gives noisier results
+        progress (function): called with the name of every benchmark before it runs
+
+    Returns:
+        dict: "environment", from benchmark_environment, "settings", and "benchmarks", the result of every benchmark
+              as made by benchmark_result, keyed by name
+    '''
+    if repeats is None:
+        repeats = Benchmark_repeats
+    scale = 10 if quick else 1
+    if progress is None:
+        progress = lambda name: None
+    results = {}
+    for num_racers in Benchmark_field_sizes + Benchmark_large_fields:
+        progress(f"races of {num_racers} racers")
+        num_races = max(2, Benchmark_races * 12 // num_racers // scale)
+        races, ticks = bench_races(num_racers, num_races, repeats)
+        results[f"races_per_second.{num_racers}"] = benchmark_result(races, "races/s")
+        results[f"ticks_per_second.{num_racers}"] = benchmark_result(ticks, "ticks/s")
+    progress("item rolls")
+    results["item_rolls_per_second"] = benchmark_result(bench_item_rolls(12, Benchmark_rolls // scale, repeats),
+                                                        "rolls/s")
+    for item, _ in base_item_table(12):
+        progress(f"use_item with {item}")
+        results[f"use_item_microseconds.{item}"] = benchmark_result(
+            bench_use_item(item, max(10, Benchmark_item_uses // scale), repeats), "us", higher_is_better=False)
+    progress("trace overhead")
+    seeds = finishing_seeds(12, max(2, 20 // scale))
+    for mode, samples in bench_trace_overhead(seeds, repeats).items():
+        results[f"trace_overhead.{mode}"] = benchmark_result(samples, "x", higher_is_better=False)
+    progress("animations")
+    for name, samples in bench_animations(seeds[0], max(5, Benchmark_frames // scale), repeats).items():
+        results[f"gif_frames_per_second.{name}"] = benchmark_result(samples, "frames/s")
+    progress("peak memory")
+    results["peak_memory_mib"] = benchmark_result(bench_peak_memory(max(5, Benchmark_races // 2 // scale), repeats),
+                                                  "MiB", higher_is_better=False)
+    reset_race_state()
+    return {"environment": benchmark_environment(),
+            "settings": {"repeats": repeats, "quick": quick, "races": Benchmark_races, "rolls": Benchmark_rolls,
+                         "item_uses": Benchmark_item_uses, "frames": Benchmark_frames},
+            "benchmarks": results}
+
+
+def print_benchmarks(report):
+    '''
+    Prints the median of every benchmark of a report
+    Args:
+        report (dict): the benchmark report, as made by run_benchmarks
+
+    Returns:
+        None
+    '''
+    rows = [{"Benchmark": name, "Median": f"{result['median']:.6g}", "Unit": result["unit"]}
+            for name, result in report["benchmarks"].items()]
+    print(tabulate(rows, headers='keys', tablefmt='psql', showindex=False))
+    print(f"Python {report['environment']['python']} on {report['environment']['platform']}")
+
+
+# The benchmarks that the regression check fails on, by the part of their name before the field size or item
+Tracked_benchmarks = ("races_per_second", "item_rolls_per_second", "gif_frames_per_second", "peak_memory_mib")
+
+# The largest change for the worse allowed in the median of a tracked benchmark, as a fraction of the baseline
+Regression_threshold = 0.1
+
+# The number of times the samples are resampled to find the confidence interval of a change
+Bootstrap_resamples = 2000
+
+
+def change_interval(baseline, current, level=0.95, resamples=None, seed=0):
+    '''
+    Finds the relative change in the median of a benchmark and its bootstrap confidence interval, by resampling the
+    runs of the baseline and the current benchmark independently
+    Args:
+        baseline (list of floats): the runs of the baseline
+        current (list of floats): the runs of the current benchmark
+        level (float): the confidence level of the interval
+        resamples (int): the number of resamples. Defaults to Bootstrap_resamples
+        seed (int): the seed of the resampling, so the same runs always give the same interval
+
+    Returns:
+        tuple of floats: the change of the median as a fraction of the baseline median, and the lower and upper ends
+                         of its confidence interval
+    '''
+    if resamples is None:
+        resamples = Bootstrap_resamples
+    baseline = np.asarray(baseline, dtype=float)
+    current = np.asarray(current, dtype=float)
+    rng = np.random.default_rng(seed)
+    baseline_medians = np.median(rng.choice(baseline, (resamples, len(baseline))), axis=1)
+    current_medians = np.median(rng.choice(current, (resamples, len(current))), axis=1)
+    changes = current_medians / baseline_medians - 1
+    tail = (1 - level) / 2 * 100
+    low, high = np.percentile(changes, [tail, 100 - tail])
+    return float(np.median(current) / np.median(baseline) - 1), float(low), float(high)
+
+
+def compare_benchmarks(baseline, current, threshold=None, tracked=None):
+    '''
+    Compares the benchmarks of a fresh run with a baseline. A tracked benchmark regressed when its median got worse
+    by more than the threshold and the confidence interval of the change does not include no change, so a noisy run
+    does not fail the check by chance
+    Args:
+        baseline (dict): the baseline report, as made by run_benchmarks
+        current (dict): the fresh report
+        threshold (float): the largest change for the worse allowed, as a fraction. Defaults to Regression_threshold
+        tracked (tuple of str): the benchmarks that can regress, by the part of their name before the first dot.
+                                Defaults to Tracked_benchmarks
+
+    Returns:
+        list of dicts: for every benchmark of the baseline, its name, unit, baseline and current medians, change and
+                       confidence interval (negative is worse), and status: "regressed", "improved", "ok",
+                       "untracked", or "missing" if the fresh run does not have a tracked benchmark
+    '''
+    if threshold is None:
+        threshold = Regression_threshold
+    if tracked is None:
+        tracked = Tracked_benchmarks
+    rows = []
+    for name, before in baseline["benchmarks"].items():
+        after = current["benchmarks"].get(name)
+        row = {"Benchmark": name, "Unit": before["unit"], "Baseline": float(np.median(before["samples"])),
+               "Current": None if after is None else float(np.median(after["samples"])), "Change": None, "Low": None,
+               "High": None}
+        if after is None:
+            row["Status"] = "missing" if name.split(".")[0] in tracked else "untracked"
+            rows.append(row)
+            continue
+        change, low, high = change_interval(before["samples"], after["samples"])
+        # Changes are turned around for benchmarks where lower is better, so a negative change is always worse
+        if not before["higher_is_better"]:
+            change, low, high = -change, -high, -low
+        row.update(Change=change, Low=low, High=high)
+        if name.split(".")[0] not in tracked:
+            row["Status"] = "untracked"
+        elif change < -threshold and high < 0:
+            row["Status"] = "regressed"
+        elif change > threshold and low > 0:
+            row["Status"] = "improved"
+        else:
+            row["Status"] = "ok"
+        rows.append(row)
+    return rows
+
+
+def environment_differences(baseline, current):
+    '''
+    Finds the settings and parts of the environment that differ between two benchmark reports, other than the time,
+    the commit, and the number of runs, since results from different machines or settings cannot be compared
+    Args:
+        baseline (dict): the baseline report, as made by run_benchmarks
+        current (dict): the fresh report
+
+    Returns:
+        list of str: a description of every difference
+    '''
+    differences = []
+    for section, ignored in (("environment", ("time", "commit")), ("settings", ("repeats",))):
+        for key in sorted(set(baseline[section]) | set(current[section])):
+            if key not in ignored and baseline[section].get(key) != current[section].get(key):
+                differences.append(f"{key}: {baseline[section].get(key)} in the baseline, "
+                                   f"{current[section].get(key)} now")
+    return differences
+
+
+def print_regression_report(rows, threshold=None, differences=()):
+    '''
+    Prints the comparison of a fresh run of the benchmarks with a baseline
+    Args:
+        rows (list of dicts): the comparison, as made by compare_benchmarks
+        threshold (float): the threshold the comparison used. Defaults to Regression_threshold
+        differences (list of str): the differences between the environments, as found by environment_differences
+
+    Returns:
+        bool: True if no tracked benchmark regressed or is missing
+    '''
+    if threshold is None:
+        threshold = Regression_threshold
+    table = [{"Benchmark": row["Benchmark"], "Baseline": f"{row['Baseline']:.6g}",
+              "Current": "" if row["Current"] is None else f"{row['Current']:.6g}", "Unit": row["Unit"],
+              "Change": "" if row["Change"] is None else f"{row['Change']:+.1%}",
+              "95% CI": "" if row["Low"] is None else f"{row['Low']:+.1%} to {row['High']:+.1%}",
+              "Status": row["Status"]} for row in rows]
+    print(tabulate(table, headers='keys', tablefmt='psql', showindex=False))
+    for difference in differences:
+        print(f"Warning: the environment differs from the baseline ({difference}), so the comparison may not be fair.")
+    regressed = [row["Benchmark"] for row in rows if row["Status"] == "regressed"]
+    missing = [row["Benchmark"] for row in rows if row["Status"] == "missing"]
+    if regressed:
+        print(f"{len(regressed)} benchmarks regressed by more than {threshold:.0%}: {', '.join(regressed)}")
+    if missing:
+        print(f"{len(missing)} tracked benchmarks are missing from this run: {', '.join(missing)}")
+    if regressed or missing:
+        return False
+    print(f"No tracked benchmark regressed by more than {threshold:.0%}.")
+    return True
+
+
+# The settings that the race logic runs with by default, which every other engine is checked against. "block_size" is
+# the number of random floats drawn at a time, and "step" is the function that runs a second of the race, with the
+# arguments of update_race_state (None for update_race_state)
+Reference_engine = {"block_size": Random_block_size, "step": None}
+
+# The engines the equivalence check knows by name, as the settings that differ from Reference_engine
+Engines = {"reference": {}, "small-blocks": {"block_size": 1}, "large-blocks": {"block_size": 4096}}
+
+# The field sizes and the number of seeds of each that the equivalence check races, and the number of seeds of every
+# race that starts with an item being used in the middle of the field
+Equivalence_field_sizes = (2, 4, 8, 12, 50)
+Equivalence_seeds = 10
+Equivalence_item_seeds = 2
+
+# The racer attributes that are compared every second of a race, in the order they are kept in a RaceTrace
+Traced_attributes = ("position", "distance_from_start", "speed", "item", "recently_used_item", "status", "finished")
+
+# The states of a race after every second, the events of every second, and the names of the racers in the order
+# they finished, or the error that stopped the race. Every state is the race clock, the unavailable items, and the
+# Traced_attributes of every racer, keyed by name
+RaceTrace = namedtuple("RaceTrace", ["states", "events", "order", "error"])
+
+
+def set_engine(engine=None):
+    '''
+    Sets the random block size that races in this process run with
+    Args:
+        engine (dict): the settings that differ from Reference_engine. None for the reference engine
+
+    Returns:
+        dict: the block size before, to pass back to set_engine
+    '''
+    global Random_block_size
+    previous = {"block_size": Random_block_size}
+    settings = {**Reference_engine, **(engine or {})}
+    Random_block_size = settings["block_size"]
+    return previous
+
+
+def race_state(participants):
+    '''
+    Takes the state of a race that the equivalence check compares
+    Args:
+        participants (list): the racers participating in the race
+
+    Returns:
+        tuple: the race clock, the unavailable items, and the Traced_attributes of every racer, keyed by name
+    '''
+    return (Race_duration, tuple(Unavailable_items),
+            {racer.name: tuple(tuple(value) if isinstance(value, list) else value
+                               for value in attrgetter(*Traced_attributes)(racer)) for racer in participants})
+
+
+def equivalence_cases(field_sizes=None, seeds=None, item_seeds=None):
+    '''
+    Lists the races of the equivalence check: whole races of every field size, and races that start with every item
+    being used by the racer in the middle of a 12 racer field
+    Args:
+        field_sizes (tuple of ints): the field sizes. Defaults to Equivalence_field_sizes
+        seeds (int): the number of seeds of every field size. Defaults to Equivalence_seeds
+        item_seeds (int): the number of seeds of every item. Defaults to Equivalence_item_seeds
+
+    Returns:
+        list of tuples: every race, as the number of racers, the seed, and the item used at the start (None for a
+                        whole race)
+    '''
+    if field_sizes is None:
+        field_sizes = Equivalence_field_sizes
+    if seeds is None:
+        seeds = Equivalence_seeds
+    if item_seeds is None:
+        item_seeds = Equivalence_item_seeds
+    cases = [(num_racers, seed, None) for num_racers in field_sizes for seed in range(seeds)]
+    cases += [(12, seed, item) for item, _ in base_item_table(12) for seed in range(item_seeds)]
+    return cases
+
+
+def trace_race(case, engine=None):
+    '''
+    Runs a race of the equivalence check with an engine, keeping its state and events after every second
+    Args:
+        case (tuple): the race, as listed by equivalence_cases
+        engine (dict): the settings that differ from Reference_engine. None for the reference engine
+
+    Returns:
+        RaceTrace: the trace of the race
+    '''
+    global Race_duration, Event_log
+    num_racers, seed, item = case
+    previous = set_engine(engine)
+    states, events = [], []
+
+    def record(participants):
+        states.append(race_state(participants))
+        events.append(list(Event_log.records))
+        Event_log.records.clear()
+
+    Event_log = EventLog()
+    try:
+        if item is None:
+            reset_race_state()
+            random.seed(seed)
+            participants = start_race(num_racers)
+        else:
+            _, participants = synthetic_item_state(item, num_racers, seed)
+            # The item is used in the first second that is run
+            Race_duration -= 1
+        record(participants)
+        try:
+            order = simulate_race(participants, num_racers, step=(engine or {}).get("step"), on_tick=record)
+        except ValueError as error:
+            record(participants)
+            return RaceTrace(states, events, None, repr(error))
+        return RaceTrace(states, events, [racer.name for racer in order], None)
+    finally:
+        Event_log = None
+        set_engine(previous)
+        reset_race_state()
+
+
+def state_delta(reference, candidate, tolerance=0.0):
+    '''
+    Lists the differences between two states of a race
+    Args:
+        reference (tuple): the state of the reference engine, as taken by race_state
+        candidate (tuple): the state of the other engine
+        tolerance (float): the largest difference allowed between two numbers, for engines that add up distances and
+                           speeds in another order
+
+    Returns:
+        list of str: a description of every difference
+    '''
+    deltas = []
+    if reference[1] != candidate[1]:
+        deltas.append(f"unavailable items: {list(reference[1])} vs {list(candidate[1])}")
+    for name in sorted(set(reference[2]) | set(candidate[2])):
+        if name not in reference[2] or name not in candidate[2]:
+            deltas.append(f"{name}: only in the {'candidate' if name not in reference[2] else 'reference'} race")
+            continue
+        for attribute, mine, theirs in zip(Traced_attributes, reference[2][name], candidate[2][name]):
+            if isinstance(mine, float) and isinstance(theirs, float):
+                if abs(mine - theirs) <= tolerance:
+                    continue
+            elif mine == theirs:
+                continue
+            deltas.append(f"{name}: {attribute} {mine!r} vs {theirs!r}")
+    return deltas
+
+
+def first_divergence(reference, candidate, tolerance=0.0):
+    '''
+    Finds the first second where two traces of the same race differ
+    Args:
+        reference (RaceTrace): the trace of the reference engine
+        candidate (RaceTrace): the trace of the other engine
+        tolerance (float): passed on to state_delta
+
+    Returns:
+        tuple: the race clock at the first difference and a description of every difference, or None if the traces
+               are the same
+    '''
+    for (mine, my_events), (theirs, their_events) in zip(zip(reference.states, reference.events),
+                                                         zip(candidate.states, candidate.events)):
+        deltas = state_delta(mine, theirs, tolerance)
+        if mine[0] != theirs[0]:
+            deltas.insert(0, f"race clock: {mine[0]} vs {theirs[0]}")
+        if my_events != their_events:
+            deltas += [f"event only in the reference race: {Event._make(event)}" for event in my_events
+                       if event not in their_events]
+            deltas += [f"event only in the candidate race: {Event._make(event)}" for event in their_events
+                       if event not in my_events]
+            if not deltas:
+                deltas.append("the same events in another order")
+        if deltas:
+            return mine[0], deltas
+    last = min(len(reference.states), len(candidate.states)) - 1
+    if len(reference.states) != len(candidate.states):
+        return reference.states[last][0], [f"the reference race lasted {len(reference.states) - 1} seconds and the "
+                                           f"candidate race {len(candidate.states) - 1}"]
+    if reference.error != candidate.error:
+        return reference.states[last][0], [f"error: {reference.error} vs {candidate.error}"]
+    if reference.order != candidate.order:
+        return reference.states[last][0], [f"finishing order: {reference.order} vs {candidate.order}"]
+    return None
+
+
+def check_equivalence(engine, cases=None, tolerance=0.0, progress=None):
+    '''
+    Runs the races of the equivalence check with the reference engine and another engine, with the same seeds, and
+    compares their states, events, and finishing orders second by second
+    Args:
+        engine (dict): the settings of the other engine that differ from Reference_engine
+        cases (list of tuples): the races, as listed by equivalence_cases. Defaults to equivalence_cases()
+        tolerance (float): passed on to state_delta
+        progress (function): called with every race before it runs
+
+    Returns:
+        list of tuples: the race, the race clock at the first difference, and the differences, for every race that
+                        diverged
+    '''
+    if cases is None:
+        cases = equivalence_cases()
+    divergences = []
+    for case in cases:
+        if progress is not None:
+            progress(case)
+        divergence = first_divergence(trace_race(case), trace_race(case, engine), tolerance)
+        if divergence is not None:
+            divergences.append((case, *divergence))
+    return divergences
+
+
+def run_engine_races(engine, num_racers, seeds):
+    '''
+    Simulates one race for every seed with an engine. Runs in the worker processes of check_statistical_equivalence
+    Args:
+        engine (dict): the settings that differ from Reference_engine
+        num_racers (int): the number of racers in each race
+        seeds (range): the seed of each race
+
+    Returns:
+        RaceStats: the statistics of the races
+    '''
+    previous = set_engine(engine)
+    try:
+        return run_races(num_racers, seeds, step=(engine or {}).get("step"))
+    finally:
+        set_engine(previous)
+
+
+def two_sample_z(successes_a, trials_a, successes_b, trials_b):
+    '''
+    Tests whether two proportions differ
+    Args:
+        successes_a (int): the successes of the first sample
+        trials_a (int): the trials of the first sample
+        successes_b (int): the successes of the second sample
+        trials_b (int): the trials of the second sample
+
+    Returns:
+        float: the z statistic of the difference, 0 if neither sample has any variance
+    '''
+    pooled = (successes_a + successes_b) / (trials_a + trials_b)
+    variance = pooled * (1 - pooled) * (1 / trials_a + 1 / trials_b)
+    return (successes_a / trials_a - successes_b / trials_b) / math.sqrt(variance) if variance > 0 else 0.0
+
+
+def check_statistical_equivalence(engine, num_racers=12, num_races=2000, seed=0, workers=None, alpha=0.01):
+    '''
+    Compares the results of many races of the reference engine and another engine, for engines that draw their
+    random numbers differently and so cannot give the same races. Every character's win rate and mean finishing time,
+    the share of every item among the item pulls, and the rate of unfinished races are tested for a difference, with
+    the significance level split between the tests (Bonferroni), so an equivalent engine fails with a chance of at most
+    alpha
+    Args:
+        engine (dict): the settings of the other engine that differ from Reference_engine
+        num_racers (int): the number of racers in each race
+        num_races (int): the number of races of each engine
+        seed (int): the first seed
+        workers (int): the number of processes. Defaults to the number of CPUs
+        alpha (float): the chance of failing an equivalent engine
+
+    Returns:
+        list of dicts: every test, with what was tested, the value of both engines, the z statistic, and whether the
+                       difference is significant
+    '''
+    results = []
+    for settings in (None, engine):
+        task = partial(run_engine_races, settings, num_racers)
+        results.append(run_in_batches(task, num_races, RaceStats(), seed=seed, workers=workers))
+    reference, candidate = results
+    tests = []
+    for name in sorted(set(reference.positions) & set(candidate.positions)):
+        counts_a, counts_b = reference.positions[name], candidate.positions[name]
+        tests.append((f"{name} win rate", counts_a[0], sum(counts_a), counts_b[0], sum(counts_b)))
+    tests.append(("unfinished races", reference.unfinished, reference.races, candidate.unfinished, candidate.races))
+    pulls_a = {}
+    pulls_b = {}
+    for stats, pulls in ((reference, pulls_a), (candidate, pulls_b)):
+        for position_pulls in stats.item_pulls.values():
+            for item, count in position_pulls.items():
+                pulls[item] = pulls.get(item, 0) + count
+    for item in sorted(set(pulls_a) | set(pulls_b)):
+        tests.append((f"share of {item} pulls", pulls_a.get(item, 0), sum(pulls_a.values()), pulls_b.get(item, 0),
+                      sum(pulls_b.values())))
+    rows = [{"Test": test, "Reference": a / n_a, "Candidate": b / n_b, "z": two_sample_z(a, n_a, b, n_b)}
+            for test, a, n_a, b, n_b in tests if n_a and n_b]
+    for name in sorted(set(reference.finish_times) & set(candidate.finish_times)):
+        (n_a, mean_a, m2_a), (n_b, mean_b, m2_b) = reference.finish_times[name], candidate.finish_times[name]
+        if n_a < 2 or n_b < 2:
+            continue
+        error = math.sqrt(m2_a / (n_a - 1) / n_a + m2_b / (n_b - 1) / n_b)
+        rows.append({"Test": f"{name} mean finishing time", "Reference": mean_a, "Candidate": mean_b,
+                     "z": (mean_a - mean_b) / error if error > 0 else 0.0})
+    critical = NormalDist().inv_cdf(1 - alpha / (2 * len(rows))) if rows else 0.0
+    for row in rows:
+        row["Different"] = abs(row["z"]) > critical
+    return rows
+
+
+def print_equivalence_report(divergences, cases, limit=10):
+    '''
+    Prints the races where an engine diverged from the reference engine, with the differences at the first second
+    where they diverged
+    Args:
+        divergences (list of tuples): the divergences, as found by check_equivalence
+        cases (list of tuples): the races that were compared
+        limit (int): the most differences printed for every race
+
+    Returns:
+        bool: True if no race diverged
+    '''
+    for (num_racers, seed, item), clock, deltas in divergences:
+        start = f", starting with {item} used in the middle of the field" if item is not None else ""
+        print(f"{num_racers} racers, seed {seed}{start}: first diverged at second {clock}")
+        for delta in deltas[:limit]:
+            print(f"    {delta}")
+        if len(deltas) > limit:
+            print(f"    ... and {len(deltas) - limit} more differences")
+    if divergences:
+        print(f"{len(divergences)} of {len(cases)} races diverged from the reference engine.")
+        return False
+    print(f"All {len(cases)} races matched the reference engine second by second.")
+    return True
+
+
+def playback_speed(text):
+    '''
+    Reads the playback speed given on the command line
+    Args:
+        text (str): a number from 0.25 to 100, or "max"
+
+    Returns:
+        float: the playback speed, or None to play the race as fast as possible
+    '''
+    if text == "max":
+        return None
+    try:
+        speed = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid playback speed: {text!r}")
+    if not Min_playback_speed <= speed <= Max_playback_speed:
+        raise argparse.ArgumentTypeError(f"the playback speed must be between {Min_playback_speed} and "
+                                         f"{Max_playback_speed}, or 'max'")
+    return speed
+
+
+def parse_args(argv=None):
+    '''
+    Reads the command line options
+    Args:
+        argv (list of str): the command line arguments. Defaults to sys.argv[1:]
+
+    Returns:
+        Namespace: the parsed options
+    '''
+    parser = argparse.ArgumentParser(description="Simulates a Mario Kart Wii race between 2-1000 CPUs.")
+    parser.add_argument("--animation", choices=["separate", "combined", "split"], default="separate",
+                        help="render the position, speed, and distance animations as three figures (separate), as "
+                             "one figure with three panels (combined), or as one figure cut into the three usual "
+                             "files (split)")
+    parser.add_argument("--render-workers", type=int, default=1, metavar="N",
+                        help="rasterize the frames of the separate animations with N processes (default: 1)")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="render the separate animations in another process while the race is simulated")
+    parser.add_argument("--speed", type=playback_speed, default=1.0, metavar="X",
+                        help=f"play the race X times faster than real time, from {Min_playback_speed} to "
+                             f"{Max_playback_speed}, or 'max' to play it as fast as possible (default: 1)")
+    parser.add_argument("--dashboard", action="store_true",
+                        help="show the race on a dashboard that stays in place instead of printing a table every second")
+    parser.add_argument("--refresh-rate", type=float, default=10, metavar="HZ",
+                        help="how many times per second the dashboard is redrawn (default: 10)")
+    parser.add_argument("--races", type=int, default=None, metavar="N",
+                        help="simulate N races without showing them and print their statistics instead")
+    parser.add_argument("--precision", type=float, default=None, metavar="P",
+                        help="simulate races until every character's win rate is known to within P (such as 0.005 "
+                             "for half a percentage point, at 95%% confidence). --races is then the most races to "
+                             f"simulate (default: {Max_converging_races})")
+    parser.add_argument("--time-precision", type=float, default=None, metavar="SECONDS",
+                        help="with --precision, also simulate until every character's mean finishing time is known "
+                             "to within SECONDS")
+    parser.add_argument("--compare", nargs=2, default=None, metavar=("A", "B"),
+                        help="compare two configurations of the game saved as JSON files over --races seeds, racing "
+                             "both with the same random numbers")
+    parser.add_argument("--track", default=None, metavar="FILE",
+                        help="race on the track in the JSON or TOML file FILE instead of the original straight track")
+    parser.add_argument("--sweep", default=None, metavar="SPEC",
+                        help="simulate --races races for every configuration of the parameter sweep in the JSON file "
+                             "SPEC, and print how the win rate of every starting position responds")
+    parser.add_argument("--output", default=None, metavar="FILE",
+                        help="with --sweep, also save the summary as a CSV file")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="keep the results of --races, --precision, and --sweep in the folder DIR, so races that "
+                             "were already simulated with the same settings and seeds are read instead")
+    parser.add_argument("--cache-size", type=float, default=512, metavar="MB",
+                        help="the most space the cache may take before the least recently used results are deleted "
+                             "(default: 512)")
+    parser.add_argument("--enqueue", default=None, metavar="DIR",
+                        help="split the seeds of --races into shards in the shared folder DIR for --work to run, "
+                             "instead of running them here")
+    parser.add_argument("--shard-size", type=int, default=Shard_size, metavar="N",
+                        help=f"with --enqueue, the number of seeds in each shard (default: {Shard_size})")
+    parser.add_argument("--work", default=None, metavar="DIR",
+                        help="claim and run the shards in the shared folder DIR with --workers processes until they "
+                             "are all done. Any number of machines can work on the same folder")
+    parser.add_argument("--stale-after", type=float, default=Shard_stale_after, metavar="SECONDS",
+                        help="with --work, take over the shards of workers that have not checked in for SECONDS "
+                             f"(default: {Shard_stale_after})")
+    parser.add_argument("--merge", default=None, metavar="DIR",
+                        help="combine the results of the shards in the shared folder DIR and print their statistics")
+    parser.add_argument("--event-log", default=None, metavar="FILE",
+                        help="record the events of the race, such as item pickups, hits, and overtakes, in FILE. With "
+                             "--races, the events of every batch of races are written to FILE.<first seed>")
+    parser.add_argument("--event-buffer", type=int, default=Event_log_capacity, metavar="N",
+                        help="with --event-log, the number of events kept in memory. A single race keeps its latest N "
+                             f"events, and --races writes them out every N events (default: {Event_log_capacity})")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help="with --races or --work, rewrite FILE every --metrics-interval seconds with the races "
+                             "and seconds of the races simulated per second, the time each phase of a second takes, "
+                             "and the depth of the shard queue, in the OpenMetrics text format. Each worker of --work "
+                             "writes FILE.<worker number>")
+    parser.add_argument("--metrics-port", type=int, default=None, metavar="PORT",
+                        help="with --races or --work, also serve the metrics on http://127.0.0.1:PORT. Each worker of "
+                             "--work serves them on PORT plus its worker number")
+    parser.add_argument("--metrics-interval", type=float, default=Metrics_interval, metavar="SECONDS",
+                        help=f"how often the metrics file is rewritten (default: {Metrics_interval})")
+    parser.add_argument("--benchmark", default=None, metavar="FILE",
+                        help="run the benchmarks of the race logic, the item rolls, use_item, recording, and the "
+                             "animations in this process, print their medians, and save every result with a "
+                             "description of this machine to the JSON file FILE ('-' to only print them)")
+    parser.add_argument("--bench-repeats", type=int, default=Benchmark_repeats, metavar="N",
+                        help=f"run every benchmark N times (default: {Benchmark_repeats})")
+    parser.add_argument("--bench-quick", action="store_true",
+                        help="do a tenth of the work in every run of the benchmarks, for a quick and noisier check")
+    parser.add_argument("--check-benchmarks", default=None, metavar="BASELINE",
+                        help="run the benchmarks and compare them with the results saved in the JSON file BASELINE by "
+                             "--benchmark. Exits with status 1 if the median of a tracked benchmark (races, item rolls, "
+                             "and animation frames per second, and peak memory) got worse by more than "
+                             "--regression-threshold and the change is larger than the noise of the runs")
+    parser.add_argument("--regression-threshold", type=float, default=Regression_threshold, metavar="FRACTION",
+                        help=f"the largest change for the worse allowed by --check-benchmarks, such as 0.1 for 10%% "
+                             f"(default: {Regression_threshold})")
+    parser.add_argument("--bench-results", default=None, metavar="FILE",
+                        help="with --check-benchmarks, compare the results saved in FILE instead of running the "
+                             "benchmarks")
+    parser.add_argument("--equivalence", choices=sorted(Engines), default=None, metavar="ENGINE",
+                        help="race the same seeds with the reference engine and ENGINE (one of "
+                             f"{', '.join(sorted(Engines))}) and report the first second where any race diverged, "
+                             "with the differences in the racers and the item events. Exits with status 1 if one did")
+    parser.add_argument("--equivalence-seeds", type=int, default=Equivalence_seeds, metavar="N",
+                        help=f"with --equivalence, the number of seeds of every field size (default: "
+                             f"{Equivalence_seeds})")
+    parser.add_argument("--tolerance", type=float, default=0.0, metavar="X",
+                        help="with --equivalence, the largest difference allowed in a distance or speed (default: 0)")
+    parser.add_argument("--statistical", action="store_true",
+                        help="with --equivalence, compare the win rates, finishing times, item pulls, and unfinished "
+                             "races of --races races of each engine instead, for engines that draw their random "
+                             "numbers differently")
+    parser.add_argument("--antithetic", action="store_true",
+                        help="with --compare, also race every seed with the mirror image of its random numbers")
+    parser.add_argument("--racers", type=int, default=12, metavar="N",
+                        help="the number of racers in each race simulated with --races, from 2 to 1000. Fields of "
+                             "more than 12 racers use item probabilities interpolated from the 12 racer ones "
+                             "(default: 12)")
+    parser.add_argument("--workers", type=int, default=None, metavar="N",
+                        help="simulate the races of --races with N processes (default: the number of CPUs)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="the seed of the first race simulated with --races (default: 0)")
+    parser.add_argument("--win-odds", action="store_true",
+                        help="show each racer's chance of winning on the dashboard, estimated every second of the race")
+    parser.add_argument("--rollouts", type=int, default=200, metavar="K",
+                        help="finish the race K times for each estimate of the win odds (default: 200)")
+    parser.add_argument("--odds-budget", type=float, default=0.5, metavar="SECONDS",
+                        help="the longest each estimate of the win odds may take (default: 0.5)")
+    parser.add_argument("--odds-workers", type=int, default=None, metavar="N",
+                        help="estimate the win odds with N processes (default: the number of CPUs)")
+    args = parser.parse_args(argv)
+    if args.render_workers < 1:
+        parser.error("--render-workers must be at least 1")
+    # Written so that nan fails too, and inf would never wait between redraws
+    if not (args.refresh_rate > 0 and math.isfinite(args.refresh_rate)):
+        parser.error("--refresh-rate must be a positive number")
+    if args.render_workers > 1 and args.animation != "separate":
+        parser.error("--render-workers only applies to --animation separate")
+    if args.pipeline and (args.animation != "separate" or args.render_workers > 1):
+        parser.error("--pipeline cannot be combined with --animation or --render-workers")
+    if args.races is not None and args.races < 1:
+        parser.error("--races must be at least 1")
+    if args.precision is not None and not 0 < args.precision < 0.5:
+        parser.error("--precision must be between 0 and 0.5")
+    if args.time_precision is not None and (args.precision is None or args.time_precision <= 0):
+        parser.error("--time-precision must be positive and requires --precision")
+    if args.compare is not None and (args.races is None or args.precision is not None):
+        parser.error("--compare requires --races and cannot be combined with --precision")
+    if args.sweep is not None and (args.races is None or args.precision is not None or args.compare is not None):
+        parser.error("--sweep requires --races and cannot be combined with --precision or --compare")
+    if args.output is not None and args.sweep is None:
+        parser.error("--output requires --sweep")
+    if args.cache is not None and (args.races is None and args.precision is None or args.compare is not None):
+        parser.error("--cache only applies to --races, --precision, and --sweep")
+    if args.cache_size <= 0:
+        parser.error("--cache-size must be positive")
+    if args.enqueue is not None and (args.races is None or args.precision is not None or args.compare is not None
+                                     or args.sweep is not None or args.cache is not None):
+        parser.error("--enqueue requires --races and cannot be combined with --precision, --compare, --sweep, or "
+                     "--cache")
+    if sum(option is not None for option in (args.enqueue, args.work, args.merge)) > 1:
+        parser.error("only one of --enqueue, --work, and --merge can be used at a time")
+    if (args.work is not None or args.merge is not None) and (args.races is not None or args.precision is not None):
+        parser.error("--work and --merge run the study in the folder, so they cannot be combined with --races or "
+                     "--precision")
+    if args.shard_size < 1:
+        parser.error("--shard-size must be at least 1")
+    if args.stale_after <= 0:
+        parser.error("--stale-after must be positive")
+    if args.event_log is not None and (args.precision is not None or args.compare is not None
+                                       or args.sweep is not None or args.cache is not None or args.enqueue is not None
+                                       or args.work is not None or args.merge is not None):
+        parser.error("--event-log only applies to a single race and to --races, without --cache")
+    if args.event_buffer < 1:
+        parser.error("--event-buffer must be at least 1")
+    if (args.metrics is not None or args.metrics_port is not None) and (
+            args.races is None and args.work is None or args.precision is not None or args.compare is not None
+            or args.sweep is not None or args.cache is not None or args.enqueue is not None):
+        parser.error("--metrics and --metrics-port only apply to --races, without --cache, and to --work")
+    if args.metrics_port is not None and not 0 < args.metrics_port < 65536:
+        parser.error("--metrics-port must be between 1 and 65535")
+    if args.metrics_interval <= 0:
+        parser.error("--metrics-interval must be positive")
+    if (args.benchmark is not None or args.check_benchmarks is not None) and (
+            args.races is not None or args.precision is not None or args.work is not None or args.merge is not None):
+        parser.error("--benchmark and --check-benchmarks cannot be combined with --races, --precision, --work, or "
+                     "--merge")
+    if args.bench_results is not None and (args.check_benchmarks is None or args.benchmark is not None):
+        parser.error("--bench-results requires --check-benchmarks and cannot be combined with --benchmark")
+    if args.regression_threshold <= 0:
+        parser.error("--regression-threshold must be positive")
+    if args.bench_repeats < 1:
+        parser.error("--bench-repeats must be at least 1")
+    if args.equivalence is not None and (args.precision is not None or args.compare is not None
+                                         or args.sweep is not None or args.cache is not None
+                                         or args.enqueue is not None or args.work is not None
+                                         or args.merge is not None or args.benchmark is not None
+                                         or args.check_benchmarks is not None):
+        parser.error("--equivalence cannot be combined with other studies or the benchmarks")
+    if args.equivalence is not None and args.races is not None and not args.statistical:
+        parser.error("--races only applies to --equivalence with --statistical")
+    if args.statistical and args.equivalence is None:
+        parser.error("--statistical requires --equivalence")
+    if args.equivalence_seeds < 1:
+        parser.error("--equivalence-seeds must be at least 1")
+    if args.tolerance < 0:
+        parser.error("--tolerance cannot be negative")
+    if args.antithetic and args.compare is None:
+        parser.error("--antithetic requires --compare")
+    if not 2 <= args.racers <= Max_racers:
+        parser.error(f"--racers must be between 2 and {Max_racers}")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.win_odds and not args.dashboard:
+        parser.error("--win-odds requires --dashboard")
+    if args.rollouts < 1:
+        parser.error("--rollouts must be at least 1")
+    if args.odds_budget <= 0:
+        parser.error("--odds-budget must be positive")
+    if args.odds_workers is not None and args.odds_workers < 1:
+        parser.error("--odds-workers must be at least 1")
+    return args
+
+
 # Error handling
-# First checks if user inputs more than one command line argument
-if len(sys.argv) != 1:
-    print("Invalid number of inputs")
-    sys.exit()
-else:
+# The command line options are checked by parse_args, which exits if the user passes an invalid option
+if __name__ == "__main__":
+    args = parse_args()
+    Event_log_capacity = args.event_buffer
+    Metrics_interval = args.metrics_interval
+    cache = ResultCache(args.cache, int(args.cache_size * 1024 * 1024)) if args.cache is not None else None
+    # Settings shared by every race, which the studies pass on to their worker processes
+    base = {"track": read_track(args.track)} if args.track is not None else {}
+    apply_config(base)
     try:
-        main()
+        if args.equivalence is not None and args.statistical:
+            rows = check_statistical_equivalence(Engines[args.equivalence], args.racers,
+                                                 args.races if args.races is not None else 2000, seed=args.seed,
+                                                 workers=args.workers)
+            print(tabulate([{**row, "z": f"{row['z']:+.2f}"} for row in rows], headers='keys', tablefmt='psql',
+                           showindex=False))
+            different = [row["Test"] for row in rows if row["Different"]]
+            if different:
+                print(f"{len(different)} results differ from the reference engine: {', '.join(different)}")
+                sys.exit(1)
+            print(f"No result of the {args.equivalence} engine differs from the reference engine.")
+        elif args.equivalence is not None:
+            cases = equivalence_cases(seeds=args.equivalence_seeds)
+            divergences = check_equivalence(Engines[args.equivalence], cases, args.tolerance)
+            print(f"Compared the {args.equivalence} engine with the reference engine.")
+            if not print_equivalence_report(divergences, cases):
+                sys.exit(1)
+        elif args.check_benchmarks is not None:
+            with open(args.check_benchmarks) as file:
+                baseline = json.load(file)
+            if args.bench_results is not None:
+                with open(args.bench_results) as file:
+                    report = json.load(file)
+            else:
+                report = run_benchmarks(repeats=args.bench_repeats, quick=args.bench_quick,
+                                        progress=lambda name: print(f"Timing {name}...", file=sys.stderr))
+            if args.benchmark is not None and args.benchmark != "-":
+                with open(args.benchmark, "w") as file:
+                    json.dump(report, file, indent=2)
+            passed = print_regression_report(compare_benchmarks(baseline, report, args.regression_threshold),
+                                             args.regression_threshold, environment_differences(baseline, report))
+            if not passed:
+                sys.exit(1)
+        elif args.benchmark is not None:
+            report = run_benchmarks(repeats=args.bench_repeats, quick=args.bench_quick,
+                                    progress=lambda name: print(f"Timing {name}...", file=sys.stderr))
+            print_benchmarks(report)
+            if args.benchmark != "-":
+                with open(args.benchmark, "w") as file:
+                    json.dump(report, file, indent=2)
+        elif args.enqueue is not None:
+            shards = ShardQueue(args.enqueue).create(args.races, args.racers, seed=args.seed,
+                                                     shard_size=args.shard_size, config=base or None)
+            print(f"Split {args.races} races into {shards} shards in {args.enqueue}.")
+        elif args.work is not None:
+            shards = run_shard_workers(args.work, workers=args.workers, stale_after=args.stale_after,
+                                       metrics_path=args.metrics, metrics_port=args.metrics_port)
+            print(f"Ran {shards} shards.")
+        elif args.merge is not None:
+            stats, missing = merge_shards(args.merge)
+            if missing:
+                print(f"{missing} shards are not done yet, so their races are left out. Run --work {args.merge} to "
+                      f"finish them.")
+            print_batch_summary(stats)
+        elif args.sweep is not None:
+            summary = sweep_summary(run_sweep(load_config(args.sweep), args.races, args.racers, seed=args.seed,
+                                              workers=args.workers, cache=cache, base=base))
+            print(tabulate(summary, headers='keys', tablefmt='psql', showindex=False))
+            if args.output is not None:
+                summary.to_csv(args.output, index=False)
+        elif args.compare is not None:
+            print_comparison(compare_configs({**base, **load_config(args.compare[0])},
+                                             {**base, **load_config(args.compare[1])}, args.racers, args.races,
+                                             seed=args.seed, workers=args.workers, antithetic=args.antithetic))
+        elif args.precision is not None:
+            stats, converged = run_until_converged(args.racers, args.precision, args.time_precision,
+                                                   max_races=args.races, seed=args.seed, workers=args.workers,
+                                                   cache=cache, config=base or None)
+            if converged:
+                print(f"The statistics reached the requested precision after {stats.races + stats.failed} races.")
+            else:
+                print(f"The statistics did not reach the requested precision within {stats.races + stats.failed} "
+                      f"races.")
+            print_batch_summary(stats)
+        elif args.races is not None:
+            metrics = exporter = None
+            if args.metrics is not None or args.metrics_port is not None:
+                metrics = RaceMetrics()
+                exporter = MetricsExporter(metrics, args.metrics, args.metrics_port).start()
+            started = time.perf_counter()
+            try:
+                stats = run_batch(args.races, args.racers, seed=args.seed, workers=args.workers, cache=cache,
+                                  config=base or None, event_log=args.event_log, metrics=metrics)
+            finally:
+                if exporter is not None:
+                    exporter.stop()
+            elapsed = time.perf_counter() - started
+            print_batch_summary(stats)
+            print(f"Simulated {args.races} races in {elapsed:.2f} seconds ({args.races / elapsed:.1f} races per "
+                  f"second).")
+        else:
+            try:
+                main(animation=args.animation, render_workers=args.render_workers, pipeline=args.pipeline,
+                     speed=args.speed, dashboard=args.dashboard, refresh_rate=args.refresh_rate,
+                     win_odds=args.win_odds, rollouts=args.rollouts, odds_budget=args.odds_budget,
+                     odds_workers=args.odds_workers, event_log=args.event_log)
+            # Prints out a message if user does not enter an integer between 2 and Max_racers
+            except ValueError:
+                print(f"Unexpected error occurred. Make sure you input an integer between 2 and {Max_racers}, "
+                      f"inclusive.")
     # Prints out a message if user ends a race early
     except KeyboardInterrupt:
         print("The race did not finish!")
-    # Prints out a message if user does not enter an integer between 2 and 12
-    except ValueError:
-        print("Unexpected error occurred. Make sure you input an integer between 2 and 12, inclusive.")
+    # Stops with the reason a shared queue of races cannot be used, which is not a problem with the input
+    except ShardQueueError as error:
+        print(error)
+        sys.exit(1)
+    # Stops with the reason the settings of a study cannot be used, such as a sweep that sets the finish line of a
+    # track
+    except ValueError as error:
+        print(error)
+        sys.exit(1)